@@ -0,0 +1,87 @@
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    diario: {
+        /**
+         * Construye la figura de 4 zonas a partir del payload compacto del día.
+         * Cambiar de variable o de tipo de gráfico no vuelve a consultar al servidor.
+         */
+        render_figure: function (payload, variable, tipo, layoutBase) {
+            if (!payload || !layoutBase) {
+                return window.dash_clientside.no_update;
+            }
+            // El servidor envía el payload ya serializado (memoizado por fecha)
+            if (typeof payload === "string") {
+                payload = JSON.parse(payload);
+            }
+
+            const nombres = {
+                TMAX: "temperatura máxima",
+                TMIN: "temperatura mínima",
+                PP: "precipitación"
+            };
+            const colorRegistro = "#636EFA";
+            const colorNormal = "#EF553B";
+            const usarBarras = tipo === "barras" || (tipo !== "lineas" && variable === "PP");
+
+            // Copia de los arreglos tipados: plotly.js los decodifica en sitio
+            const copiar = (arreglo) => ({dtype: arreglo.dtype, bdata: arreglo.bdata});
+
+            const crearTraza = (estaciones, valores, nombre, grupo, color, i, anomalia) => {
+                const eje = i === 0 ? "" : String(i + 1);
+                const traza = {
+                    x: estaciones,
+                    y: copiar(valores),
+                    name: nombre,
+                    legendgroup: grupo,
+                    showlegend: i === 0,
+                    xaxis: "x" + eje,
+                    yaxis: "y" + eje
+                };
+                if (anomalia) {
+                    traza.customdata = copiar(anomalia);
+                    traza.hovertemplate = "%{y:.1f}<br>Anomalía vs media climatológica: %{customdata:+.1f}";
+                }
+                if (usarBarras) {
+                    traza.type = "bar";
+                    traza.marker = {color: color};
+                } else {
+                    traza.type = "scatter";
+                    traza.mode = "lines+markers";
+                    traza.line = {color: color, width: 2};
+                    traza.marker = {size: 8};
+                }
+                return traza;
+            };
+
+            const data = [];
+            payload.estaciones.forEach((estaciones, i) => {
+                data.push(crearTraza(estaciones, payload.registro[variable][i],
+                    "Registro " + payload.fecha, "registro", colorRegistro, i,
+                    payload.anomalia ? payload.anomalia[variable][i] : null));
+                data.push(crearTraza(estaciones, payload.normal[variable][i],
+                    "Normal histórica (" + payload.mes + ")", "normal", colorNormal, i));
+
+                // Banda P10-P90 de la climatología del día del año (si existe)
+                if (payload.p10) {
+                    const eje = i === 0 ? "" : String(i + 1);
+                    [["p10", "P10 climatológico", "none"], ["p90", "P10–P90 climatológico", "tonexty"]].forEach(([clave, nombre, relleno]) => {
+                        data.push({
+                            type: "scatter", mode: "lines", x: estaciones, y: copiar(payload[clave][variable][i]),
+                            name: nombre, legendgroup: "climatologia", showlegend: i === 0 && clave === "p90",
+                            line: {color: "rgba(120, 120, 120, 0.6)", width: 1, dash: "dot"},
+                            fill: relleno, fillcolor: "rgba(120, 120, 120, 0.15)",
+                            xaxis: "x" + eje, yaxis: "y" + eje
+                        });
+                    });
+                }
+            });
+
+            const layout = Object.assign({}, layoutBase, {
+                title: Object.assign({}, layoutBase.title, {
+                    text: "Análisis de " + nombres[variable] + " - " + payload.fecha
+                })
+            });
+
+            return {data: data, layout: layout};
+        }
+    }
+});
@@ -0,0 +1,156 @@
+"""
+Ingesta el historial de registros diarios y mensuales (desde 1985) en el archivo
+histórico memory-mapped de DIRECTORIO_HISTORICO.
+
+- Descargas por lotes con el backend configurado (ALMACENAMIENTO) y parseo en
+  paralelo en varios procesos (--workers)
+- Reanudable: la procedencia de cada archivo (ruta, eTag, fecha, estaciones) se
+  anota después de escribir sus datos; los archivos ya ingeridos en su versión
+  actual se omiten
+- El dashboard abre el archivo en solo lectura y sirve desde él cualquier fecha
+  o rango ingerido, sin Graph ni openpyxl
+- La climatología (media, desviación, P10/P50/P90 y récords por estación y día
+  del año) se actualiza en cada lote con los valores nuevos
+- Cada libro se valida al parsearlo (TMIN > TMAX, PP negativa, texto en celdas
+  numéricas, temperaturas fuera de rango); las banderas por celda se guardan en
+  mapas .u8 junto a los valores y al final se imprimen las celdas marcadas por
+  estación y mes
+
+Uso:
+    python src/backfill_archive.py                       # 1985 hasta el año actual
+    python src/backfill_archive.py --desde 2020 --fuentes mensual
+    python src/backfill_archive.py --reconstruir-climatologia --fuentes ""
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import argparse
+import fcntl
+import os
+import sys
+import time
+
+from cache import data_cache
+from config import CLIENT_ID, GRAPH_ACCESS_TOKEN
+from data.archive import ANIO_INICIO, FUENTES, HistoricalArchive, extract_file
+from data.auth_module import get_access_token
+from data.climatology import Climatology
+from data.file_managment import (current_version, get_available_days, get_available_months, path_registro_diario,
+                                 path_registro_mensual)
+from data.storage import storage
+from data.validation import flag_rows, report_frame
+import config as cf
+
+ARCHIVO_BLOQUEO = ".ingesta.lock"
+ARCHIVOS_POR_LOTE = 64
+
+
+def pending_files(archive, fuente, desde, hasta):
+    """
+    Archivos (ruta, fecha) de una fuente que no están ingeridos en su versión actual
+    """
+
+    pending = []
+    for year in range(desde, hasta + 1):
+        if fuente == "mensual":
+            fechas = [date(year, month, 1) for month in get_available_months(year)]
+            rutas = [path_registro_mensual(year, fecha.month) for fecha in fechas]
+        else:
+            fechas = [date(year, month, day) for month in range(1, 13) for day in get_available_days(year, month)]
+            rutas = [path_registro_diario(fecha.year, fecha.month, fecha.day) for fecha in fechas]
+        for ruta, fecha in zip(rutas, fechas):
+            entry = archive.provenance.get(ruta)
+            if entry is None or entry["version"] != current_version(ruta):
+                pending.append((ruta, fecha))
+    return pending
+
+
+def ingest(archive, climatology, fuente, pending, workers):
+    """
+    Descarga y parsea por lotes; cada lote se escribe y se anota antes de seguir
+    """
+
+    ingested = errors = 0
+    marcadas = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), ARCHIVOS_POR_LOTE):
+            chunk = dict(pending[start:start + ARCHIVOS_POR_LOTE])
+            downloads = storage.read_many(list(chunk), f"el registro {fuente}")
+
+            futures = []
+            for ruta, fecha in chunk.items():
+                downloaded = downloads[ruta]
+                if isinstance(downloaded, Exception):
+                    errors += 1
+                    print(f"    Error: {downloaded}")
+                    continue
+                futures.append((ruta, executor.submit(extract_file, fuente, ruta, *downloaded, fecha)))
+
+            extracted = []
+            for ruta, future in futures:
+                try:
+                    extracted.append(future.result())
+                except Exception as e:
+                    errors += 1
+                    print(f"    Error al parsear {ruta}: {e}")
+
+            # La climatología lee del archivo los valores que un archivo reingerido reemplaza
+            climatology.update(extracted)
+            archive.write(extracted)
+            climatology.save()
+            marcadas += flag_rows(extracted)
+            ingested += len(extracted)
+            print(f"    {fuente}: {min(start + ARCHIVOS_POR_LOTE, len(pending))}/{len(pending)} procesados")
+
+    return ingested, errors, report_frame(marcadas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destino", default=cf.DIRECTORIO_HISTORICO, help="Directorio del archivo histórico")
+    parser.add_argument("--desde", type=int, default=ANIO_INICIO)
+    parser.add_argument("--hasta", type=int, default=date.today().year)
+    parser.add_argument("--fuentes", default=",".join(FUENTES), help="diario, mensual o ambas separadas por coma")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Procesos de parseo")
+    parser.add_argument("--reconstruir-climatologia", action="store_true",
+                        help="Recalcular la climatología completa desde el archivo (corrige récords)")
+    args = parser.parse_args()
+
+    if storage.requires_token:
+        if not CLIENT_ID and not GRAPH_ACCESS_TOKEN:
+            raise ValueError("CLIENT_ID no encontrado en archivo .env")
+        data_cache["ACCESS_TOKEN"] = get_access_token(CLIENT_ID)
+    storage.initialize()
+
+    archive = HistoricalArchive(args.destino, cf.ARCHIVO_HISTORICO_CAPACIDAD)
+    archive.open_for_writing()
+    with open(os.path.join(args.destino, ARCHIVO_BLOQUEO), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("Otra ingesta está en curso, se omite esta ejecución")
+            return 0
+
+        inicio = time.monotonic()
+        climatology = Climatology(os.path.join(args.destino, "climatologia"), archive)
+        climatology.open_for_writing(cf.VENTANA_CLIMATOLOGIA)
+        if args.reconstruir_climatologia:
+            climatology.rebuild()
+
+        total_errors = 0
+        for fuente in filter(None, args.fuentes.split(",")):
+            pending = pending_files(archive, fuente, args.desde, args.hasta)
+            print(f"{fuente}: {len(pending)} archivos por ingerir")
+            ingested, errors, reporte = ingest(archive, climatology, fuente, pending, args.workers)
+            total_errors += errors
+            print(f"{fuente}: {ingested} archivos ingeridos, {errors} errores")
+            if len(reporte):
+                print(f"{fuente}: celdas marcadas por la validación en {len(reporte)} estación-mes")
+                print(reporte.drop(columns="fuente").to_string(index=False))
+        print(f"Ingesta terminada en {time.monotonic() - inicio:.1f} s")
+
+    return 1 if total_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,167 @@
-from config import CLIENT_ID
+from collections import OrderedDict
+from threading import Lock
+from config import CLIENT_ID, CACHE_FIGURAS_MAX, CACHE_NEGATIVO_TTL, CACHE_PESOS_MAPA_MAX, CACHE_HISTOGRAMAS_MAX
 from data.auth_module import get_access_token
+from data.single_flight import loader_flight
+from data.stations import station_registry
+import pandas as pd
+import hashlib
+import time
 
 data_cache = {}
 
+
+class LRUCache:
+    """
+    Cache en memoria con desalojo del elemento menos usado recientemente
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate):
+        """
+        Elimina las entradas cuya llave cumple el predicado
+        """
+
+        with self.lock:
+            for key in [k for k in self.entries if predicate(k)]:
+                del self.entries[key]
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class TTLCache:
+    """
+    Cache en memoria cuyas entradas expiran después de ttl segundos
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Figuras (payloads serializados) ya construidas, por (fecha, versión normales, versión archivo)
+figure_cache = LRUCache(CACHE_FIGURAS_MAX)
+
+# Pesos de interpolación del mapa por (malla, estaciones con dato)
+weights_cache = LRUCache(CACHE_PESOS_MAPA_MAX)
+
+# Histogramas parciales de viento y nubes por (estación, año, mes, versión de la planilla)
+histogram_cache = LRUCache(CACHE_HISTOGRAMAS_MAX)
+
+# Rutas que respondieron 404 y listados de carpetas, con expiración corta
+negative_cache = TTLCache(CACHE_NEGATIVO_TTL)
+listing_cache = TTLCache(CACHE_NEGATIVO_TTL)
+
+
+def cache_stats():
+    """
+    Contadores de cada área de cache y de las descargas agrupadas
+    """
+
+    return {
+        "figure_cache": figure_cache.stats(),
+        "weights_cache": weights_cache.stats(),
+        "histogram_cache": histogram_cache.stats(),
+        "negative_cache": negative_cache.stats(),
+        "listing_cache": listing_cache.stats(),
+        "loader_flight": loader_flight.stats(),
+        "data_cache": {"entries": len(data_cache)},
+    }
+
+
+def monthly_memory():
+    """
+    Bytes en memoria de cada mes del registro mensual en cache (Dataframe y fechas)
+    """
+
+    from metrics import approx_size
+
+    return {key[len("MENSUAL_"):]: approx_size(value) for key, value in list(data_cache.items())
+            if isinstance(key, str) and key.startswith("MENSUAL_")}
+
+
+def frame_version(df):
+    """
+    Huella corta del contenido de un Dataframe
+    """
+
+    return hashlib.blake2b(pd.util.hash_pandas_object(df).to_numpy().tobytes(), digest_size=8).hexdigest()
+
+
 def init_cache():
-    # Extraemos y guardamos token de acceso
-    data_cache["ACCESS_TOKEN"] = get_access_token(CLIENT_ID)
+    from data.storage import storage
+
+    # Extraemos y guardamos token de acceso (solo el backend de Graph lo necesita)
+    if storage.requires_token:
+        data_cache["ACCESS_TOKEN"] = get_access_token(CLIENT_ID)
+
+    # Preparación del backend (en Graph: índice de disponibilidad persistido y actualizado con delta)
+    storage.initialize()
 
     # Extraemos y guardamos registros normales
     from data.file_managment import get_all_normales, get_metadata
     resultados_normales = get_all_normales()
     sheets = ["TMAX", "TMIN", "PP"]
+    data_cache["LISTA_ESTACIONES"] = resultados_normales["TMAX"].index.tolist()
+
+    # Registro de estaciones: la fila i de normales y metadata es la estación de código i
+    station_registry.load(data_cache["LISTA_ESTACIONES"])
     for sheet in sheets:
-        data_cache[f"NORMAL_{sheet}"] = resultados_normales[sheet]
-    data_cache["LISTA_ESTACIONES"] = data_cache["NORMAL_TMAX"].index.tolist()
-    data_cache["METADATA"] = get_metadata()
+        data_cache[f"NORMAL_{sheet}"] = station_registry.align(resultados_normales[sheet], f"normales {sheet}")
+    data_cache["NORMALES_VERSION"] = "-".join(frame_version(data_cache[f"NORMAL_{sheet}"]) for sheet in sheets)
+    data_cache["METADATA"] = station_registry.align(get_metadata(), "metadata")
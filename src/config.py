@@ -12,3 +12,38 @@ DIRECTORIO_PLANILLA = os.getenv("DIRECTORIO_PLANILLA", default="PLANILLA CLIMATO
 DIRECTORIO_METADATA = os.getenv("DIRECTORIO_METADATA", default="COORDENADAS DE ESTACIONES")
 ARCHIVO_EXCEL_NORMALES = os.getenv("ARCHIVO_EXCEL_NORMALES", default="NORMALES 1991-2020_ME.xlsx")
 ARCHIVO_EXCEL_METADATA = os.getenv("ARCHIVO_EXCEL_METADATA", default="COORDENADAS UTM-GEOGRAFICAS.xlsx")
+CACHE_FIGURAS_MAX = int(os.getenv("CACHE_FIGURAS_MAX", default="256"))
+CACHE_NEGATIVO_TTL = int(os.getenv("CACHE_NEGATIVO_TTL", default="300"))
+# Histogramas de viento y nubes por estación-mes (unos pocos KB cada uno)
+CACHE_HISTOGRAMAS_MAX = int(os.getenv("CACHE_HISTOGRAMAS_MAX", default="4096"))
+GRAPH_URL = os.getenv("GRAPH_URL", default="https://graph.microsoft.com/v1.0")
+GRAPH_DRIVE_URL = f"{GRAPH_URL}/me/drive"
+# Token fijo en lugar del flujo de msal (p. ej. contra src/tools/fake_graph_server.py)
+GRAPH_ACCESS_TOKEN = os.getenv("GRAPH_ACCESS_TOKEN", default="")
+ARCHIVO_INDICE_DISPONIBILIDAD = os.getenv("ARCHIVO_INDICE_DISPONIBILIDAD", default="indice_disponibilidad.json")
+INDICE_INTERVALO_DELTA = int(os.getenv("INDICE_INTERVALO_DELTA", default="60"))
+DESCARGAS_PARALELAS = int(os.getenv("DESCARGAS_PARALELAS", default="8"))
+# Backend de almacenamiento: "graph" (OneDrive) o "local" (espejo con el mismo esquema de carpetas)
+ALMACENAMIENTO = os.getenv("ALMACENAMIENTO", default="graph")
+DIRECTORIO_ESPEJO = os.getenv("DIRECTORIO_ESPEJO", default="espejo")
+# Archivo histórico memory-mapped que llena src/backfill_archive.py
+DIRECTORIO_HISTORICO = os.getenv("DIRECTORIO_HISTORICO", default="historico")
+ARCHIVO_HISTORICO_CAPACIDAD = int(os.getenv("ARCHIVO_HISTORICO_CAPACIDAD", default="64"))
+VENTANA_CLIMATOLOGIA = int(os.getenv("VENTANA_CLIMATOLOGIA", default="7"))
+# Mapa interpolado (IDW con corrección por altitud); ARCHIVO_ELEVACION es un .npz opcional
+# con latitud, longitud y altitud de una malla regular
+MAPA_RESOLUCION = float(os.getenv("MAPA_RESOLUCION", default="0.05"))
+MAPA_VECINOS = int(os.getenv("MAPA_VECINOS", default="8"))
+MAPA_POTENCIA = float(os.getenv("MAPA_POTENCIA", default="2"))
+GRADIENTE_TERMICO = float(os.getenv("GRADIENTE_TERMICO", default="0.0065"))
+ALTITUD_REFERENCIA = float(os.getenv("ALTITUD_REFERENCIA", default="3825"))
+ARCHIVO_ELEVACION = os.getenv("ARCHIVO_ELEVACION", default="")
+CACHE_PESOS_MAPA_MAX = int(os.getenv("CACHE_PESOS_MAPA_MAX", default="32"))
+DASH_PUERTO = int(os.getenv("DASH_PUERTO", default="8050"))
+DASH_DEBUG = os.getenv("DASH_DEBUG", default="1") == "1"
+# Perfilado con cProfile: "0" desactivado, "1" todas las solicitudes y cargadores,
+# "cabecera" solo solicitudes con la cabecera X-Perfilar: 1
+PERFILADO = os.getenv("PERFILADO", default="0")
+PERFILADO_CALLBACKS = os.getenv("PERFILADO_CALLBACKS", default="")
+DIRECTORIO_PERFILES = os.getenv("DIRECTORIO_PERFILES", default="perfiles")
+PERFILADO_TOP = int(os.getenv("PERFILADO_TOP", default="20"))
@@ -0,0 +1,175 @@
+from datetime import date
+from cache import data_cache
+from data.archive import VARIABLES, historical_archive, variable_key
+from data.file_managment import ArchivoNoEncontrado, convert_month, get_available_days, get_registro_diario
+from data.stations import SIN_CODIGO, station_registry
+from data.validation import mask_flagged
+import numpy as np
+import pandas as pd
+
+# Estaciones sin zona en los registros diarios
+SIN_ZONA = "SIN ZONA"
+
+
+def station_day_matrix(df_mes):
+    """
+    Valores del registro mensual como arreglo float32 (estación, día, variable),
+    con la fila i para la estación de código i y NaN donde no hay columna
+    """
+
+    matriz = np.full((len(station_registry.names), len(df_mes), len(VARIABLES)), np.nan, dtype=np.float32)
+    if not isinstance(df_mes.columns, pd.MultiIndex) or df_mes.columns.nlevels != 2:
+        return matriz
+
+    codigos = station_registry.codes(df_mes.columns.get_level_values(0))
+    variables = np.array([VARIABLES.index(v) if (v := variable_key(label)) else -1
+                          for label in df_mes.columns.get_level_values(1)], dtype=np.intp)
+    validas = np.flatnonzero((codigos != SIN_CODIGO) & (variables >= 0))
+    # Con columnas repetidas gana la primera, como en extract_station_data
+    _, primeras = np.unique(codigos[validas] * len(VARIABLES) + variables[validas], return_index=True)
+    posiciones = validas[primeras]
+
+    bloque = df_mes.iloc[:, posiciones]
+    if (bloque.dtypes == np.float32).all():
+        valores = bloque.to_numpy()
+    else:
+        valores = bloque.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
+    matriz[codigos[posiciones], :, variables[posiciones]] = valores.T
+    return matriz
+
+
+def normal_matrix():
+    """
+    Normales 1991-2020 como arreglo float32 (estación, mes, variable) alineado por
+    código; se arma una vez por versión de las normales
+    """
+
+    version = data_cache.get("NORMALES_VERSION")
+    cached = data_cache.get("NORMALES_MATRIZ")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    meses = [convert_month(month) for month in range(1, 13)]
+    matriz = np.stack([
+        data_cache[f"NORMAL_{variable}"][meses].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float32)
+        for variable in VARIABLES
+    ], axis=-1)
+    data_cache["NORMALES_MATRIZ"] = (version, matriz)
+    return matriz
+
+
+def anomaly_matrix(valores, fechas):
+    """
+    Anomalías (estación, día, variable) respecto de las normales del mes.
+
+    TMAX y TMIN se comparan día a día con la normal mensual. La normal de PP es un
+    total mensual, así que para PP la anomalía es el acumulado del mes hasta ese
+    día menos la normal prorrateada a los días transcurridos.
+    """
+
+    fechas = pd.DatetimeIndex(fechas)
+    normales = normal_matrix()[:, fechas.month.to_numpy() - 1]
+    anomalias = valores - normales
+
+    pp = VARIABLES.index("PP")
+    lluvia = valores[:, :, pp]
+    acumulado = np.nancumsum(lluvia, axis=1)
+    # Inicio de cada mes dentro del rango: el acumulado se reinicia ahí
+    inicio_mes = np.flatnonzero(np.r_[True, fechas.month.to_numpy()[1:] != fechas.month.to_numpy()[:-1]])
+    inicio_dia = inicio_mes[np.searchsorted(inicio_mes, np.arange(len(fechas)), side='right') - 1]
+    previo = np.where(inicio_dia > 0, acumulado[:, np.maximum(inicio_dia - 1, 0)], 0.0)
+    prorrateo = (fechas.day.to_numpy() / fechas.days_in_month.to_numpy()).astype(np.float32)
+    anomalias[:, :, pp] = np.where(np.isnan(lluvia), np.nan, acumulado - previo - normales[:, :, pp] * prorrateo)
+    return anomalias
+
+
+def daily_station_values(df_diario):
+    """
+    Valores de un registro diario como arreglo float32 (estación, 1, variable) alineado por código
+    """
+
+    valores = np.full((len(station_registry.names), 1, len(VARIABLES)), np.nan, dtype=np.float32)
+    codigos = df_diario["CODIGO"].to_numpy()
+    validos = codigos != SIN_CODIGO
+    valores[codigos[validos], 0] = df_diario[VARIABLES].to_numpy(dtype=np.float32)[validos]
+    return valores
+
+
+def period_summary(valores, fechas):
+    """
+    Resumen por estación de un rango de días (estación, variable): media de TMAX y
+    TMIN y total de PP, y su anomalía respecto de las normales en los mismos días
+    con dato (la normal mensual de PP se prorratea por día). NaN si no hay datos.
+    """
+
+    fechas = pd.DatetimeIndex(fechas)
+    normales = normal_matrix()[:, fechas.month.to_numpy() - 1]
+    pp = VARIABLES.index("PP")
+    normales[:, :, pp] /= fechas.days_in_month.to_numpy()
+
+    def summarize(arreglo):
+        conteo = np.isfinite(arreglo).sum(axis=1)
+        divisor = np.where(conteo > 0, conteo, np.nan)
+        divisor[:, pp] = np.where(conteo[:, pp] > 0, 1.0, np.nan)
+        return np.nansum(arreglo, axis=1) / divisor
+
+    resumen = summarize(valores)
+    anomalia = summarize(valores - normales)
+    return resumen, anomalia
+
+
+def station_zones(year, month):
+    """
+    Zona de cada estación por código según los registros diarios (SIN_ZONA si no
+    aparece). Usa las zonas del archivo histórico o, si no hay, un registro diario
+    del mes; el resultado queda en cache.
+    """
+
+    if data_cache.get("ZONAS_ESTACIONES") is not None:
+        return data_cache["ZONAS_ESTACIONES"]
+
+    zonas = np.full(len(station_registry.names), SIN_ZONA, dtype=object)
+    historical_archive.refresh()
+    for nombre, zona in historical_archive.meta["zonas"].items():
+        code = station_registry.code(nombre)
+        if code != SIN_CODIGO:
+            zonas[code] = zona
+
+    if (zonas == SIN_ZONA).all():
+        df_diario = cached_daily_frame()
+        if df_diario is None:
+            df_diario = latest_daily_frame(year, month)
+        if df_diario is None:
+            return zonas
+        codigos = df_diario["CODIGO"].to_numpy()
+        validos = codigos != SIN_CODIGO
+        zonas[codigos[validos]] = df_diario.index.get_level_values("ZONA")[validos]
+
+    data_cache["ZONAS_ESTACIONES"] = zonas
+    return zonas
+
+
+def cached_daily_frame():
+    """
+    Algún registro diario ya cargado por la vista diaria, o None
+    """
+
+    for value in list(data_cache.values()):
+        if isinstance(value, pd.DataFrame) and "CODIGO" in value and "ZONA" in value.index.names:
+            return value
+    return None
+
+
+def latest_daily_frame(year, month):
+    """
+    Último registro diario disponible del mes (queda en cache como en la vista diaria), o None
+    """
+
+    for day in sorted(get_available_days(year, month), reverse=True):
+        fecha = date(year, month, day).isoformat()
+        try:
+            data_cache[fecha] = mask_flagged(get_registro_diario(year=year, month=month, day=day))
+        except ArchivoNoEncontrado:
+            continue
+        return data_cache[fecha]
+    return None
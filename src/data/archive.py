@@ -0,0 +1,337 @@
+from datetime import date, datetime
+from threading import Lock
+from data.stations import normalize_station_name
+import config as cf
+import calendar
+import json
+import numpy as np
+import os
+import pandas as pd
+
+VARIABLES = ["TMAX", "TMIN", "PP"]
+FUENTES = ("diario", "mensual")
+ANIO_INICIO = 1985
+DIAS_ANIO = 366
+ARCHIVO_META = "meta.json"
+ARCHIVO_PROCEDENCIA = "procedencia.jsonl"
+# Capas por fuente y año: valores y, junto a ellos, las banderas de validación de cada celda
+CAPAS = {"valores": (".f32", np.float32, np.nan), "banderas": (".u8", np.uint8, 0)}
+
+
+def variable_key(label):
+    """
+    Variable (TMAX, TMIN o PP) que corresponde a un encabezado del registro mensual, o None
+    """
+
+    var_str = str(label).upper().strip()
+    if 'MAX' in var_str:
+        return 'TMAX'
+    if 'MIN' in var_str:
+        return 'TMIN'
+    if 'PP' in var_str or 'PREC' in var_str:
+        return 'PP'
+    return None
+
+
+def day_of_year(fecha):
+    """
+    Fila del día en el archivo del año (los años no bisiestos dejan libre la última fila)
+    """
+
+    return fecha.timetuple().tm_yday - 1
+
+
+class HistoricalArchive:
+    """
+    Archivo histórico local de solo anexado: un arreglo float32 memory-mapped por
+    fuente y año con forma (día, estación, variable), otro uint8 de la misma forma
+    con las banderas de validación de cada celda, un meta.json con las
+    estaciones (el código es la posición) y procedencia.jsonl con una línea por
+    archivo ingerido (ruta, eTag, fecha, estaciones).
+
+    El dashboard lo abre en solo lectura: los días y meses con procedencia al
+    día se sirven desde el mapa en memoria sin descargar ni parsear el libro.
+    """
+
+    def __init__(self, root, capacidad):
+        self.root = root
+        self.capacidad = capacidad
+        self.lock = Lock()
+        self.meta = {"capacidad": capacidad, "variables": VARIABLES, "estaciones": [], "zonas": {}}
+        self.codes = {}
+        self.provenance = {}
+        self.offset = 0
+        self.maps = {}
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def refresh(self):
+        """
+        Lee las líneas nuevas de procedencia.jsonl (y meta.json si cambió). Solo
+        consume líneas completas, así que no ve un archivo a medio escribir.
+        """
+
+        provenance_file = self.path(ARCHIVO_PROCEDENCIA)
+        try:
+            size = os.path.getsize(provenance_file)
+        except OSError:
+            return False
+        if size == self.offset:
+            return True
+
+        with self.lock:
+            with open(provenance_file, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read(size - self.offset)
+            completo = chunk.rfind(b"\n") + 1
+            if completo == 0:
+                return True
+            with open(self.path(ARCHIVO_META), 'r') as f:
+                self.load_meta(json.load(f))
+            for line in chunk[:completo].decode("utf-8").splitlines():
+                entry = json.loads(line)
+                self.provenance[entry["ruta"]] = entry
+            self.offset += completo
+        return True
+
+    def load_meta(self, meta):
+        self.meta = meta
+        self.capacidad = meta["capacidad"]
+        self.codes = {name: code for code, name in enumerate(meta["estaciones"])}
+
+    def year_map(self, fuente, year, writable=False, capa="valores"):
+        """
+        Arreglo memory-mapped (día, estación, variable) de una fuente, año y capa
+        (valores o banderas); en escritura lo crea lleno de NaN (o de ceros) si no
+        existe, en lectura devuelve None
+        """
+
+        key = (fuente, year, writable, capa)
+        if key in self.maps:
+            return self.maps[key]
+
+        extension, dtype, vacio = CAPAS[capa]
+        year_file = self.path(fuente, f"{year}{extension}")
+        shape = (DIAS_ANIO, self.capacidad, len(VARIABLES))
+        if not os.path.exists(year_file):
+            if not writable:
+                return None
+            os.makedirs(os.path.dirname(year_file), exist_ok=True)
+            nuevo = np.memmap(year_file + ".tmp", dtype=dtype, mode='w+', shape=shape)
+            nuevo[:] = vacio
+            nuevo.flush()
+            del nuevo
+            os.replace(year_file + ".tmp", year_file)
+
+        self.maps[key] = np.memmap(year_file, dtype=dtype, mode='r+' if writable else 'r', shape=shape)
+        return self.maps[key]
+
+    def flags_for(self, fuente, fecha, filas, codes):
+        """
+        Banderas (días, estaciones, variable) de un archivo ingerido, o None si el
+        archivo se ingirió antes de que existiera la capa de banderas
+        """
+
+        mapa = self.year_map(fuente, fecha.year, capa="banderas")
+        if mapa is None:
+            return None
+        fila = day_of_year(fecha)
+        return mapa[fila:fila + filas][:, codes]
+
+    def entry(self, ruta, version):
+        """
+        Procedencia de un archivo si está ingerido en esa versión (o en cualquiera si la versión no se conoce)
+        """
+
+        if not self.refresh():
+            return None
+        entry = self.provenance.get(ruta)
+        if entry is None or (version is not None and entry["version"] != version):
+            return None
+        return entry
+
+    def daily_frame(self, ruta, version, fecha):
+        """
+        Dataframe del registro diario (índice ZONA, ESTACION) desde el archivo, o None
+        """
+
+        entry = self.entry(ruta, version)
+        mapa = self.year_map("diario", fecha.year) if entry is not None else None
+        if mapa is None:
+            return None
+
+        codes = np.asarray(entry["estaciones"], dtype=np.intp)
+        nombres = [self.meta["estaciones"][code] for code in codes]
+        df = pd.DataFrame(mapa[day_of_year(fecha)][codes], columns=VARIABLES)
+        df.index = pd.MultiIndex.from_arrays([[self.meta["zonas"].get(name) for name in nombres], nombres],
+                                             names=["ZONA", "ESTACION"])
+        df.attrs["version"] = entry["version"]
+        banderas = self.flags_for("diario", fecha, 1, codes)
+        if banderas is not None:
+            from data.validation import attach_flags
+            attach_flags(df, banderas[0])
+        return df
+
+    def monthly_frame(self, ruta, version, year, month):
+        """
+        Dataframe del registro mensual (columnas estación, variable) desde el archivo, o None
+        """
+
+        entry = self.entry(ruta, version)
+        mapa = self.year_map("mensual", year) if entry is not None else None
+        if mapa is None:
+            return None
+
+        codes = np.asarray(entry["estaciones"], dtype=np.intp)
+        inicio = day_of_year(date(year, month, 1))
+        valores = mapa[inicio:inicio + entry["dias"]][:, codes]
+        df = pd.DataFrame(valores.reshape(entry["dias"], len(codes) * len(VARIABLES)))
+        df.columns = pd.MultiIndex.from_product([[self.meta["estaciones"][code] for code in codes], VARIABLES])
+        df.attrs["version"] = entry["version"]
+        banderas = self.flags_for("mensual", date(year, month, 1), entry["dias"], codes)
+        if banderas is not None:
+            from data.validation import attach_flags
+            attach_flags(df, banderas.reshape(entry["dias"], len(codes) * len(VARIABLES)))
+        return df
+
+    def read_range(self, fuente, estacion, desde, hasta):
+        """
+        Serie (fechas, arreglo días x variables) de una estación entre dos fechas.
+        Dentro de un mismo año el arreglo es una vista del mapa, sin copia.
+        """
+
+        self.refresh()
+        code = self.codes.get(normalize_station_name(estacion))
+        if code is None:
+            return None
+
+        fechas, partes = [], []
+        for year in range(desde.year, hasta.year + 1):
+            primero = max(desde, date(year, 1, 1))
+            ultimo = min(hasta, date(year, 12, 31))
+            dias = pd.date_range(primero, ultimo, freq='D')
+            mapa = self.year_map(fuente, year)
+            if mapa is None:
+                partes.append(np.full((len(dias), len(VARIABLES)), np.nan, dtype=np.float32))
+            else:
+                partes.append(mapa[day_of_year(primero):day_of_year(ultimo) + 1, code])
+            fechas.append(dias)
+
+        valores = partes[0] if len(partes) == 1 else np.concatenate(partes)
+        return pd.DatetimeIndex(np.concatenate(fechas)), valores
+
+    def station_codes(self, nombres, zonas=None):
+        """
+        Códigos del archivo para una lista de nombres, agregando al final las estaciones nuevas
+        """
+
+        codes = []
+        for i, nombre in enumerate(nombres):
+            code = self.codes.get(nombre)
+            if code is None:
+                if len(self.meta["estaciones"]) >= self.capacidad:
+                    raise ValueError(f"El archivo histórico admite {self.capacidad} estaciones; "
+                                     f"recréelo con ARCHIVO_HISTORICO_CAPACIDAD mayor")
+                code = self.codes[nombre] = len(self.meta["estaciones"])
+                self.meta["estaciones"].append(nombre)
+            if zonas is not None and isinstance(zonas[i], str):
+                self.meta["zonas"][nombre] = zonas[i]
+            codes.append(code)
+        return codes
+
+    def open_for_writing(self):
+        """
+        Carga el estado completo del archivo para continuar una ingesta
+        """
+
+        os.makedirs(self.root, exist_ok=True)
+        if os.path.exists(self.path(ARCHIVO_META)):
+            self.refresh()
+            with open(self.path(ARCHIVO_META), 'r') as f:
+                self.load_meta(json.load(f))
+
+    def write(self, extracted):
+        """
+        Escribe un lote de archivos extraídos y registra su procedencia. Los datos
+        se sincronizan a disco antes de anotar la procedencia: si la ingesta se
+        corta, los archivos sin procedencia se vuelven a procesar.
+        """
+
+        entries = []
+        for item in extracted:
+            codes = self.station_codes(item["nombres"], item.get("zonas"))
+            inicio = date.fromisoformat(item["fecha"])
+            mapa = self.year_map(item["fuente"], inicio.year, writable=True)
+            fila = day_of_year(inicio)
+            mapa[fila:fila + len(item["valores"]), codes] = item["valores"]
+            banderas = self.year_map(item["fuente"], inicio.year, writable=True, capa="banderas")
+            banderas[fila:fila + len(item["valores"]), codes] = item["banderas"]
+            entries.append({
+                "ruta": item["ruta"], "version": item["version"], "fuente": item["fuente"], "fecha": item["fecha"],
+                "dias": len(item["valores"]), "estaciones": codes, "bytes": item["bytes"],
+                "marcadas": item["marcadas"], "ingestado": datetime.now().isoformat(timespec="seconds"),
+            })
+
+        for (_, _, writable, _), mapa in self.maps.items():
+            if writable:
+                mapa.flush()
+
+        with open(self.path(ARCHIVO_META) + ".tmp", 'w') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(self.path(ARCHIVO_META) + ".tmp", self.path(ARCHIVO_META))
+
+        with open(self.path(ARCHIVO_PROCEDENCIA), 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            self.provenance[entry["ruta"]] = entry
+        self.offset = os.path.getsize(self.path(ARCHIVO_PROCEDENCIA))
+
+
+def extract_file(fuente, ruta, content, version, fecha):
+    """
+    Parsea un libro con el loader del dashboard y devuelve sus valores por
+    estación listos para el archivo (se ejecuta en los procesos de la ingesta)
+    """
+
+    from data.file_managment import parse_registro_diario, parse_registro_mensual
+    from data.validation import flag_counts, frame_flags, read_cells
+
+    if fuente == "diario":
+        df = parse_registro_diario(content, version)
+        estaciones = df.index.get_level_values("ESTACION")
+        filas = np.asarray(estaciones.map(lambda name: isinstance(name, str)), dtype=bool)
+        filas[filas] = ~estaciones[filas].duplicated()
+        banderas = frame_flags(df)[filas][np.newaxis]
+        df = df[filas]
+        nombres = df.index.get_level_values("ESTACION").tolist()
+        zonas = df.index.get_level_values("ZONA").tolist()
+        valores = read_cells(df[VARIABLES])[0].astype(np.float32)[np.newaxis]
+    else:
+        df = parse_registro_mensual(content, version, fecha.year, fecha.month)
+        dias = calendar.monthrange(fecha.year, fecha.month)[1]
+        banderas_libro = frame_flags(df)[:dias]
+        df = df.iloc[:dias]
+        columnas = {}
+        for posicion, (estacion, variable) in enumerate(df.columns):
+            variable = variable_key(variable)
+            if isinstance(estacion, str) and variable is not None:
+                columnas.setdefault(normalize_station_name(estacion), {}).setdefault(variable, posicion)
+        columnas = {nombre: vars_ for nombre, vars_ in columnas.items() if len(vars_) == len(VARIABLES)}
+        nombres, zonas = list(columnas), None
+        valores = np.empty((len(df), len(nombres), len(VARIABLES)), dtype=np.float32)
+        banderas = np.zeros(valores.shape, dtype=np.uint8)
+        for i, nombre in enumerate(nombres):
+            for j, variable in enumerate(VARIABLES):
+                valores[:, i, j] = pd.to_numeric(df.iloc[:, columnas[nombre][variable]], errors='coerce')
+                banderas[:, i, j] = banderas_libro[:, columnas[nombre][variable]]
+
+    return {"fuente": fuente, "ruta": ruta, "version": version, "fecha": fecha.isoformat(), "nombres": nombres,
+            "zonas": zonas, "valores": valores, "banderas": banderas, "marcadas": flag_counts(banderas),
+            "bytes": len(content)}
+
+
+historical_archive = HistoricalArchive(cf.DIRECTORIO_HISTORICO, cf.ARCHIVO_HISTORICO_CAPACIDAD)
@@ -1,3 +1,5 @@
+from config import GRAPH_ACCESS_TOKEN
+from metrics import token_refresh
 import msal
 import json
 import os
@@ -23,8 +25,12 @@ class TokenCache(msal.SerializableTokenCache):
 
 def get_access_token(client_id, tenant_id="common"):
     """
-    Obtiene token de acceso con persistencia
+    Obtiene token de acceso con persistencia (o GRAPH_ACCESS_TOKEN si está definido)
     """
+    if GRAPH_ACCESS_TOKEN:
+        token_refresh.inc(origen="estatico")
+        return GRAPH_ACCESS_TOKEN
+
     cache = TokenCache(TOKEN_CACHE_FILE)
 
     app = msal.PublicClientApplication(
@@ -41,6 +47,7 @@ def get_access_token(client_id, tenant_id="common"):
         result = app.acquire_token_silent(scopes, account=accounts[0])
         if result and "access_token" in result:
             print("Usuario encontrado en caché")
+            token_refresh.inc(origen="cache")
             return result["access_token"]
 
     print("No se encontró el token. Iniciando dispositivo de autenticación de código...")
@@ -55,6 +62,7 @@ def get_access_token(client_id, tenant_id="common"):
 
     if result and "access_token" in result:
         cache.save()
+        token_refresh.inc(origen="dispositivo")
         return result["access_token"]
     else:
         raise Exception(f"Authentication failed: {result.get('error_description')}")
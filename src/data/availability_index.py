@@ -0,0 +1,248 @@
+from urllib.parse import quote
+from threading import RLock
+from cache import data_cache, negative_cache
+import config as cf
+import requests
+import json
+import os
+import time
+
+SELECT_FIELDS = "id,name,size,eTag,lastModifiedDateTime,folder,file,parentReference,deleted"
+MAX_REINTENTOS_429 = 5
+
+
+def graph_get(url, headers=None, **kwargs):
+    """
+    GET a Graph que respeta Retry-After en las respuestas 429 (hasta MAX_REINTENTOS_429 veces)
+    """
+
+    for _ in range(MAX_REINTENTOS_429):
+        response = requests.get(url, headers=headers, **kwargs)
+        if response.status_code != 429:
+            return response
+        time.sleep(int(response.headers.get("Retry-After", 1)))
+    return response
+
+
+class AvailabilityIndex:
+    """
+    Índice local de los archivos de REGISTRO DIARIO, REGISTRO SEMANAL y PLANILLA
+    CLIMATOLOGICA construido desde los listados de carpetas de Graph.
+
+    Guarda id, tamaño, eTag y lastModified por ruta, persiste en un archivo JSON
+    y se actualiza con el endpoint delta de Graph.
+    """
+
+    def __init__(self, index_file, delta_interval, roots=None):
+        self.index_file = index_file
+        self.root_paths = roots
+        self.delta_interval = delta_interval
+        self.files = {}
+        self.folders = {}
+        self.paths_by_id = {}
+        self.delta_link = None
+        self.last_delta = 0.0
+        self.lock = RLock()
+
+    def roots(self):
+        if self.root_paths is not None:
+            return self.root_paths
+        return [f"{cf.DIRECTORIO_PRINCIPAL}/{directorio}" for directorio in
+                (cf.DIRECTORIO_REGISTRO_DIARIO, cf.DIRECTORIO_REGISTRO_SEMANAL, cf.DIRECTORIO_PLANILLA)]
+
+    def is_built(self):
+        return self.delta_link is not None
+
+    def load_or_build(self):
+        """
+        Carga el índice persistido y lo pone al día con delta, o lo construye desde cero
+        """
+
+        with self.lock:
+            if os.path.exists(self.index_file):
+                with open(self.index_file, 'r') as f:
+                    state = json.load(f)
+                self.files = state["files"]
+                self.folders = state["folders"]
+                self.delta_link = state["delta_link"]
+                self.paths_by_id = {entry["id"]: path for path, entry in self.files.items()}
+                self.paths_by_id.update({folder_id: path for path, folder_id in self.folders.items()})
+                self.update()
+            else:
+                self.build()
+
+    def build(self):
+        """
+        Recorre recursivamente las carpetas raíz. El enlace delta se pide antes del
+        recorrido y se reproduce al terminar, así los archivos subidos mientras se
+        recorría también quedan en el índice.
+        """
+
+        with self.lock:
+            self.files, self.folders, self.paths_by_id = {}, {}, {}
+            self.delta_link = self._get_json(f"{cf.GRAPH_DRIVE_URL}/root/delta?token=latest")["@odata.deltaLink"]
+            for root in self.roots():
+                response = graph_get(
+                    f"{cf.GRAPH_DRIVE_URL}/root:/{quote(root, safe='/')}?$select=id",
+                    headers=self._headers()
+                )
+                if response.status_code == 404:
+                    continue
+                if response.status_code != 200:
+                    raise Exception(f"Fallo al listar {root}: {response.status_code}")
+                self._register_folder(root, response.json()["id"])
+                self._walk(root)
+
+            self.update()
+            self.save()
+
+    def update(self):
+        """
+        Aplica los cambios de delta desde la última consulta
+
+        Returns:
+            Lista de rutas de archivo agregadas, modificadas o eliminadas
+        """
+
+        with self.lock:
+            if not self.is_built():
+                return []
+
+            changed = []
+            url = self.delta_link
+            while url:
+                body = self._get_json(url)
+                for item in body.get("value", []):
+                    changed += self._apply(item)
+                url = body.get("@odata.nextLink")
+                if "@odata.deltaLink" in body:
+                    self.delta_link = body["@odata.deltaLink"]
+
+            self.last_delta = time.monotonic()
+            if changed:
+                self.save()
+            for path in changed:
+                negative_cache.discard(path)
+            return changed
+
+    def refresh_if_stale(self):
+        if self.is_built() and time.monotonic() - self.last_delta > self.delta_interval:
+            self.update()
+
+    def get(self, path):
+        """
+        Entrada del archivo (id, size, eTag, lastModified) o None
+        """
+
+        return self.files.get(path)
+
+    def covers(self, path):
+        """
+        Indica si la ruta cae dentro de las carpetas raíz que se pudieron indexar; una
+        raíz que no existía al construir el índice no cuenta, así sus archivos se
+        consultan directamente en vez de darse por inexistentes
+        """
+
+        return self.is_built() and any(path.startswith(root + "/") for root in self.roots() if root in self.folders)
+
+    def list_names(self, folder_path):
+        """
+        Nombres de los archivos de una carpeta indexada
+        """
+
+        prefix = folder_path + "/"
+        return {path[len(prefix):] for path in self.files
+                if path.startswith(prefix) and "/" not in path[len(prefix):]}
+
+    def save(self):
+        tmp_file = f"{self.index_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"files": self.files, "folders": self.folders, "delta_link": self.delta_link}, f)
+        os.replace(tmp_file, self.index_file)
+
+    def _walk(self, folder_path):
+        url = (f"{cf.GRAPH_DRIVE_URL}/root:/{quote(folder_path, safe='/')}:/children"
+               f"?$select={SELECT_FIELDS}&$top=999")
+        while url:
+            body = self._get_json(url)
+            for item in body.get("value", []):
+                child_path = f"{folder_path}/{item['name']}"
+                if "folder" in item:
+                    self._register_folder(child_path, item["id"])
+                    self._walk(child_path)
+                else:
+                    self._register_file(child_path, item)
+            url = body.get("@odata.nextLink")
+
+    def _apply(self, item):
+        """
+        Aplica un elemento de delta y devuelve las rutas de archivo que cambiaron
+        """
+
+        item_id = item["id"]
+        old_path = self.paths_by_id.get(item_id)
+
+        if "deleted" in item:
+            if old_path is None:
+                return []
+            return self._remove(old_path)
+
+        parent_path = self.paths_by_id.get(item.get("parentReference", {}).get("id"))
+        if parent_path is None or parent_path not in self.folders:
+            return []
+
+        path = f"{parent_path}/{item['name']}"
+        changed = []
+        if old_path is not None and old_path != path:
+            changed += self._remove(old_path)
+        if "folder" in item:
+            self._register_folder(path, item_id)
+            if old_path != path:
+                # Delta informa la carpeta movida o renombrada pero no sus hijos: se vuelve a recorrer
+                before = set(self.files)
+                self._walk(path)
+                changed += [file_path for file_path in self.files if file_path not in before]
+            return changed
+        previous = self.files.get(path)
+        self._register_file(path, item)
+        if previous is not None and previous["eTag"] == item.get("eTag"):
+            return changed
+        return changed + [path]
+
+    def _register_folder(self, path, folder_id):
+        self.folders[path] = folder_id
+        self.paths_by_id[folder_id] = path
+
+    def _register_file(self, path, item):
+        self.files[path] = {
+            "id": item["id"],
+            "size": item.get("size"),
+            "eTag": item.get("eTag"),
+            "lastModified": item.get("lastModifiedDateTime"),
+        }
+        self.paths_by_id[item["id"]] = path
+
+    def _remove(self, path):
+        """
+        Quita una ruta y todo lo que cuelga de ella; devuelve las rutas de archivo quitadas
+        """
+
+        prefix = path + "/"
+        removed = [p for p in self.files if p == path or p.startswith(prefix)]
+        for file_path in removed:
+            self.paths_by_id.pop(self.files.pop(file_path)["id"], None)
+        for folder_path in [p for p in self.folders if p == path or p.startswith(prefix)]:
+            self.paths_by_id.pop(self.folders.pop(folder_path), None)
+        return removed
+
+    def _headers(self):
+        return {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
+
+    def _get_json(self, url):
+        response = graph_get(url, headers=self._headers())
+        if response.status_code != 200:
+            raise Exception(f"Fallo al consultar el índice de Graph: {response.status_code}")
+        return response.json()
+
+
+availability_index = AvailabilityIndex(cf.ARCHIVO_INDICE_DISPONIBILIDAD, cf.INDICE_INTERVALO_DELTA)
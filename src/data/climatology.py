@@ -0,0 +1,340 @@
+from datetime import date
+from data.archive import VARIABLES, day_of_year, historical_archive
+from data.stations import normalize_station_name
+import config as cf
+import json
+import numpy as np
+import os
+import pandas as pd
+
+ESTADISTICAS = ["MEDIA", "DESVIACION", "P10", "P50", "P90", "MAXIMO", "MINIMO"]
+PERCENTILES = {"P10": 0.10, "P50": 0.50, "P90": 0.90}
+DIAS_CLIMATOLOGIA = 366
+
+# Bordes de los histogramas con los que se estiman los percentiles (160 intervalos por variable)
+BORDES = {
+    "TMAX": np.linspace(-15, 35, 161),
+    "TMIN": np.linspace(-30, 20, 161),
+    "PP": np.concatenate([[0.0], np.geomspace(0.1, 150, 160)]),
+}
+
+# Quién aportó el valor de cada estación-día: el registro mensual reemplaza al diario
+SIN_APORTE, APORTE_DIARIO, APORTE_MENSUAL = 0, 1, 2
+APORTES = {"diario": APORTE_DIARIO, "mensual": APORTE_MENSUAL}
+
+ARCHIVO_ESTADO = "estado.json"
+ARCHIVO_DERIVADAS = "derivadas.npy"
+
+
+def climate_days(fechas):
+    """
+    Día del año en un calendario bisiesto (0-365): el 1 de marzo es siempre el día 60,
+    así los años no bisiestos no se desfasan un día después de febrero
+    """
+
+    fechas = pd.DatetimeIndex(fechas)
+    return (fechas.dayofyear - 1 + ((~fechas.is_leap_year) & (fechas.month > 2))).to_numpy()
+
+
+class Climatology:
+    """
+    Estadísticas por estación, día del año y variable a partir del archivo histórico.
+
+    Los acumuladores se actualizan en línea al ingerir cada archivo: conteo, media y
+    M2 de Welford (admiten retirar un valor cuando un archivo se vuelve a ingerir),
+    récords y un histograma por celda para los percentiles. Después de cada lote se
+    recalculan las tablas derivadas (ventana de ±VENTANA_CLIMATOLOGIA días) que el
+    dashboard consulta por índice. Los récords no se corrigen al retirar un valor;
+    --reconstruir-climatologia los recalcula desde el archivo.
+    """
+
+    def __init__(self, root, archive):
+        self.root = root
+        self.archive = archive
+        self.acumuladores = None
+        self.aportes = {}
+        self.derivadas = None
+        self.derivadas_mtime = None
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    # --- Escritura (ingesta) ---
+
+    def open_for_writing(self, ventana):
+        """
+        Abre o crea los acumuladores; si no corresponden a la procedencia del archivo
+        (ingesta cortada entre el archivo y la climatología) se reconstruyen
+        """
+
+        os.makedirs(self.path("aporte"), exist_ok=True)
+        self.ventana = ventana
+        shape = (DIAS_CLIMATOLOGIA, self.archive.capacidad, len(VARIABLES))
+        specs = {
+            "conteo": (shape, np.uint32, 0),
+            "media": (shape, np.float64, 0),
+            "m2": (shape, np.float64, 0),
+            "maximo": (shape, np.float32, -np.inf),
+            "minimo": (shape, np.float32, np.inf),
+            "histograma": (shape + (len(BORDES["TMAX"]) - 1,), np.uint16, 0),
+        }
+
+        nuevos = not os.path.exists(self.path(ARCHIVO_ESTADO))
+        self.acumuladores = {}
+        for nombre, (forma, dtype, inicial) in specs.items():
+            archivo = self.path(f"{nombre}.npy")
+            if nuevos or not os.path.exists(archivo):
+                self.acumuladores[nombre] = np.lib.format.open_memmap(archivo, mode='w+', dtype=dtype, shape=forma)
+                self.acumuladores[nombre][:] = inicial
+            else:
+                self.acumuladores[nombre] = np.load(archivo, mmap_mode='r+')
+
+        estado = {} if nuevos else self.load_state()
+        if estado.get("procedencia_bytes", 0) != self.archive.offset:
+            print("La climatología no corresponde al archivo histórico, se reconstruye")
+            self.rebuild()
+
+    def load_state(self):
+        with open(self.path(ARCHIVO_ESTADO), 'r') as f:
+            return json.load(f)
+
+    def contributions(self, year):
+        """
+        Aporte (ninguno, diario o mensual) de cada estación-día de un año
+        """
+
+        if year not in self.aportes:
+            archivo = self.path("aporte", f"{year}.npy")
+            if os.path.exists(archivo):
+                self.aportes[year] = np.load(archivo, mmap_mode='r+')
+            else:
+                self.aportes[year] = np.lib.format.open_memmap(archivo, mode='w+', dtype=np.uint8,
+                                                               shape=(DIAS_CLIMATOLOGIA, self.archive.capacidad))
+        return self.aportes[year]
+
+    def update(self, extracted):
+        """
+        Incorpora un lote de archivos extraídos antes de que se escriban en el archivo
+        histórico (los valores anteriores de un archivo reingerido se leen de ahí)
+        """
+
+        for item in extracted:
+            codes = np.asarray(self.archive.station_codes(item["nombres"], item.get("zonas")), dtype=np.intp)
+            inicio = date.fromisoformat(item["fecha"])
+            dias = len(item["valores"])
+            filas = day_of_year(inicio) + np.arange(dias)
+            cdias = climate_days(pd.date_range(inicio, periods=dias, freq='D'))
+            aporte_nuevo = APORTES[item["fuente"]]
+
+            aporte = self.contributions(inicio.year)
+            previo = aporte[filas][:, codes]
+
+            # Valores anteriores de la misma fuente o del diario que el mensual reemplaza
+            for aporte_previo, fuente_previa in ((APORTE_DIARIO, "diario"), (APORTE_MENSUAL, "mensual")):
+                retirar = previo == aporte_previo
+                if aporte_nuevo == APORTE_DIARIO and aporte_previo == APORTE_MENSUAL:
+                    continue
+                if retirar.any():
+                    anteriores = self.archive.year_map(fuente_previa, inicio.year, writable=True)[filas][:, codes]
+                    self.accumulate(cdias, codes, np.where(retirar[..., np.newaxis], anteriores, np.nan), -1)
+
+            # El diario no reemplaza días que ya aportó el mensual
+            omitir = (previo == APORTE_MENSUAL) & (aporte_nuevo == APORTE_DIARIO)
+            valores = np.where(omitir[..., np.newaxis], np.nan, item["valores"])
+            self.accumulate(cdias, codes, valores, +1)
+            aporte[filas[:, np.newaxis], codes[np.newaxis, :]] = np.where(omitir, previo, aporte_nuevo)
+
+    def accumulate(self, cdias, codes, valores, signo):
+        """
+        Agrega (signo +1) o retira (signo -1) valores (día, estación, variable); dentro
+        de un archivo cada celda aparece una sola vez, así que basta la indexación directa
+        """
+
+        acc = self.acumuladores
+        for j, variable in enumerate(VARIABLES):
+            x = valores[:, :, j].astype(np.float64)
+            validos = ~np.isnan(x)
+            if not validos.any():
+                continue
+            d_idx, e_idx = np.nonzero(validos)
+            d, e, x = cdias[d_idx], codes[e_idx], x[validos]
+
+            n = acc["conteo"][d, e, j].astype(np.int64)
+            media = acc["media"][d, e, j]
+            m2 = acc["m2"][d, e, j]
+            if signo > 0:
+                n_nuevo = n + 1
+                delta = x - media
+                media_nueva = media + delta / n_nuevo
+                m2_nuevo = m2 + delta * (x - media_nueva)
+                acc["maximo"][d, e, j] = np.fmax(acc["maximo"][d, e, j], x)
+                acc["minimo"][d, e, j] = np.fmin(acc["minimo"][d, e, j], x)
+            else:
+                n_nuevo = np.maximum(n - 1, 0)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    media_nueva = np.where(n_nuevo > 0, (media * n - x) / n_nuevo, 0.0)
+                m2_nuevo = np.where(n_nuevo > 0, np.maximum(m2 - (x - media_nueva) * (x - media), 0.0), 0.0)
+            acc["conteo"][d, e, j] = n_nuevo
+            acc["media"][d, e, j] = media_nueva
+            acc["m2"][d, e, j] = m2_nuevo
+
+            bordes = BORDES[variable]
+            intervalo = np.clip(np.searchsorted(bordes, x, side='right') - 1, 0, len(bordes) - 2)
+            histograma = acc["histograma"][d, e, j, intervalo].astype(np.int64) + signo
+            acc["histograma"][d, e, j, intervalo] = np.maximum(histograma, 0)
+
+    def save(self):
+        """
+        Sincroniza los acumuladores, recalcula las tablas derivadas y anota hasta
+        qué punto de la procedencia corresponden
+        """
+
+        for acumulador in list(self.acumuladores.values()) + list(self.aportes.values()):
+            acumulador.flush()
+
+        derivadas = self.compute_derived()
+        archivo = self.path(ARCHIVO_DERIVADAS)
+        np.save(archivo + ".tmp.npy", derivadas)
+        os.replace(archivo + ".tmp.npy", archivo)
+
+        with open(self.path(ARCHIVO_ESTADO) + ".tmp", 'w') as f:
+            json.dump({"procedencia_bytes": self.archive.offset, "ventana": self.ventana,
+                       "estaciones": len(self.archive.meta["estaciones"])}, f)
+        os.replace(self.path(ARCHIVO_ESTADO) + ".tmp", self.path(ARCHIVO_ESTADO))
+
+    def compute_derived(self):
+        """
+        Tablas (estadística, día, estación, variable): media, desviación y percentiles
+        sobre una ventana circular de ±ventana días; récords del día exacto
+        """
+
+        acc = self.acumuladores
+        w = self.ventana
+        derivadas = np.full((len(ESTADISTICAS),) + acc["conteo"].shape, np.nan, dtype=np.float32)
+
+        def window_sum(array):
+            # Suma móvil circular sobre el eje de días (incluye el 29 de febrero)
+            extendido = np.concatenate([array[-w:], array, array[:w]]) if w else array
+            acumulado = np.cumsum(extendido, axis=0, dtype=np.float64)
+            acumulado = np.concatenate([np.zeros((1,) + acumulado.shape[1:]), acumulado])
+            return acumulado[2 * w + 1:] - acumulado[:-(2 * w + 1)]
+
+        n = acc["conteo"].astype(np.float64)
+        s1 = window_sum(n * acc["media"])
+        s2 = window_sum(acc["m2"] + n * acc["media"] ** 2)
+        n = window_sum(n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media = s1 / n
+            varianza = (s2 - n * media ** 2) / (n - 1)
+        derivadas[ESTADISTICAS.index("MEDIA")] = np.where(n > 0, media, np.nan)
+        derivadas[ESTADISTICAS.index("DESVIACION")] = np.where(n > 1, np.sqrt(np.maximum(varianza, 0)), np.nan)
+        derivadas[ESTADISTICAS.index("MAXIMO")] = np.where(np.isfinite(acc["maximo"]), acc["maximo"], np.nan)
+        derivadas[ESTADISTICAS.index("MINIMO")] = np.where(np.isfinite(acc["minimo"]), acc["minimo"], np.nan)
+
+        for j, variable in enumerate(VARIABLES):
+            bordes = BORDES[variable]
+            histograma = window_sum(acc["histograma"][:, :, j, :])
+            acumulado = np.cumsum(histograma, axis=-1)
+            total = acumulado[..., -1]
+            for nombre, q in PERCENTILES.items():
+                objetivo = q * total
+                intervalo = np.minimum((acumulado < objetivo[..., np.newaxis]).sum(axis=-1), len(bordes) - 2)
+                hasta = np.take_along_axis(acumulado, intervalo[..., np.newaxis], axis=-1)[..., 0]
+                en_intervalo = np.take_along_axis(histograma, intervalo[..., np.newaxis], axis=-1)[..., 0]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    fraccion = np.clip((objetivo - (hasta - en_intervalo)) / en_intervalo, 0, 1)
+                valor = bordes[intervalo] + np.nan_to_num(fraccion) * (bordes[intervalo + 1] - bordes[intervalo])
+                derivadas[ESTADISTICAS.index(nombre), :, :, j] = np.where(total > 0, valor, np.nan)
+
+        return derivadas
+
+    def rebuild(self):
+        """
+        Recalcula los acumuladores desde el archivo histórico (primero los meses, luego los días)
+        """
+
+        self.acumuladores["conteo"][:] = 0
+        self.acumuladores["media"][:] = 0
+        self.acumuladores["m2"][:] = 0
+        self.acumuladores["maximo"][:] = -np.inf
+        self.acumuladores["minimo"][:] = np.inf
+        self.acumuladores["histograma"][:] = 0
+        for aporte in self.aportes.values():
+            aporte[:] = SIN_APORTE
+        for archivo in os.listdir(self.path("aporte")):
+            year = int(archivo.split(".")[0])
+            self.contributions(year)[:] = SIN_APORTE
+
+        entries = sorted(self.archive.provenance.values(), key=lambda entry: (entry["fuente"] != "mensual", entry["fecha"]))
+        for entry in entries:
+            inicio = date.fromisoformat(entry["fecha"])
+            mapa = self.archive.year_map(entry["fuente"], inicio.year)
+            if mapa is None:
+                continue
+            fila = day_of_year(inicio)
+            codes = np.asarray(entry["estaciones"], dtype=np.intp)
+            self.update([{
+                "fuente": entry["fuente"], "fecha": entry["fecha"],
+                "nombres": [self.archive.meta["estaciones"][code] for code in codes],
+                "valores": np.asarray(mapa[fila:fila + entry["dias"]][:, codes]),
+            }])
+        self.save()
+
+    # --- Lectura (dashboard) ---
+
+    def lookup(self, estacion, fechas):
+        """
+        Estadísticas de una estación para cada fecha: diccionario estadística ->
+        arreglo (fechas, variables), o None si no hay climatología para la estación
+        """
+
+        derivadas = self.load_derived()
+        if derivadas is None:
+            return None
+        code = self.archive.codes.get(normalize_station_name(estacion))
+        if code is None:
+            return None
+
+        dias = climate_days(fechas)
+        valores = derivadas[:, dias, code, :]
+        return {nombre: valores[i] for i, nombre in enumerate(ESTADISTICAS)}
+
+    def lookup_day(self, fecha, estaciones):
+        """
+        Estadísticas de varias estaciones para un día: diccionario estadística ->
+        arreglo (estaciones, variables) con NaN para las estaciones sin climatología
+        """
+
+        derivadas = self.load_derived()
+        if derivadas is None:
+            return None
+        codes = np.array([self.archive.codes.get(normalize_station_name(e), -1) for e in estaciones], dtype=np.intp)
+        fila = derivadas[:, climate_days([fecha])[0]]
+        valores = np.where((codes >= 0)[np.newaxis, :, np.newaxis], fila[:, np.maximum(codes, 0)], np.nan)
+        return {nombre: valores[i] for i, nombre in enumerate(ESTADISTICAS)}
+
+    def version(self):
+        """
+        Marca de la última actualización de las tablas derivadas (None si no hay climatología)
+        """
+
+        return self.derivadas_mtime if self.load_derived() is not None else None
+
+    def load_derived(self):
+        """
+        Tablas derivadas en solo lectura; se vuelven a abrir cuando la ingesta las reemplaza
+        """
+
+        archivo = self.path(ARCHIVO_DERIVADAS)
+        try:
+            mtime = os.stat(archivo).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self.derivadas_mtime:
+            self.archive.refresh()
+            self.derivadas = np.load(archivo, mmap_mode='r')
+            self.derivadas_mtime = mtime
+        return self.derivadas
+
+
+climatology = Climatology(os.path.join(cf.DIRECTORIO_HISTORICO, "climatologia"), historical_archive)
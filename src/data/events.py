@@ -0,0 +1,236 @@
+from datetime import date
+from threading import Lock
+from data.archive import VARIABLES, historical_archive
+from data.stations import SIN_CODIGO, normalize_station_name, station_registry
+import numpy as np
+import pandas as pd
+
+OPERADORES = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal}
+
+# Condiciones cuyas rachas se precalculan al construir el índice
+CONDICIONES = {
+    "helada": ("TMIN", "<", 0.0),
+    "seco": ("PP", "<", 1.0),
+    "lluvioso": ("PP", ">=", 1.0),
+}
+
+# Filas del índice ordenado que se revisan en la primera pasada de top_k (se cuadruplican si no alcanzan)
+BLOQUE_TOP = 4096
+
+
+class EventIndex:
+    """
+    Índice de eventos sobre las series estación x día del archivo histórico
+    (el registro mensual reemplaza al diario en las estaciones-día que tiene).
+
+    Por variable guarda los valores válidos ordenados junto con su posición
+    (día, estación), así una consulta por umbral es una búsqueda binaria y un
+    top-k lee un extremo del arreglo. Las rachas de CONDICIONES (heladas, días
+    secos y lluviosos) se guardan codificadas por longitud (estación, inicio,
+    días); las de otras condiciones se calculan al pedirlas y quedan en cache.
+    El índice se reconstruye cuando la ingesta agrega archivos.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.lock = Lock()
+        self.version = None
+        self.fechas = pd.DatetimeIndex([])
+        self.nombres = []
+        self.serie = None
+        self.ordenados = {}
+        self.posiciones = {}
+        self.rachas = {}
+
+    def ensure(self):
+        """
+        Construye el índice si no existe o si el archivo histórico cambió; False si no hay archivo
+        """
+
+        if not self.archive.refresh() or not self.archive.provenance:
+            return False
+        if self.version != self.archive.offset:
+            with self.lock:
+                if self.version != self.archive.offset:
+                    self.build()
+        return True
+
+    def build(self):
+        """
+        Arma la serie completa (día, estación, variable), los índices ordenados y las rachas precalculadas
+        """
+
+        version = self.archive.offset
+        years = sorted({int(entry["fecha"][:4]) for entry in self.archive.provenance.values()})
+        fechas = pd.date_range(date(years[0], 1, 1), date(years[-1], 12, 31), freq='D')
+        estaciones = list(self.archive.meta["estaciones"])
+        serie = np.full((len(fechas), len(estaciones), len(VARIABLES)), np.nan, dtype=np.float32)
+
+        inicio = 0
+        for year in range(years[0], years[-1] + 1):
+            dias = 366 if pd.Timestamp(year, 1, 1).is_leap_year else 365
+            for fuente in ("diario", "mensual"):
+                mapa = self.archive.year_map(fuente, year)
+                if mapa is not None:
+                    bloque = mapa[:dias, :len(estaciones)]
+                    validos = ~np.isnan(bloque)
+                    # Las celdas marcadas por la validación no cuentan como eventos
+                    banderas = self.archive.year_map(fuente, year, capa="banderas")
+                    if banderas is not None:
+                        validos &= banderas[:dias, :len(estaciones)] == 0
+                    np.copyto(serie[inicio:inicio + dias], bloque, where=validos)
+            inicio += dias
+
+        ordenados, posiciones = {}, {}
+        for j, variable in enumerate(VARIABLES):
+            valores = serie[:, :, j].ravel()
+            validos = np.flatnonzero(~np.isnan(valores))
+            orden = validos[np.argsort(valores[validos], kind='stable')]
+            posiciones[variable] = orden.astype(np.int32)
+            ordenados[variable] = valores[orden]
+
+        self.fechas, self.serie = fechas, serie
+        self.ordenados, self.posiciones = ordenados, posiciones
+        # Nombre canónico del registro cuando la estación está en LISTA_ESTACIONES
+        self.nombres = [station_registry.names[code] if (code := station_registry.code(nombre)) != SIN_CODIGO
+                        else nombre for nombre in estaciones]
+        self.rachas = {}
+        for condicion in CONDICIONES.values():
+            self.rachas[condicion] = self.compute_runs(*condicion)
+        self.version = version
+
+    # --- Utilidades ---
+
+    def station_mask(self, estaciones):
+        """
+        Máscara booleana por código de estación (todas si estaciones es None)
+        """
+
+        if not estaciones:
+            return np.ones(len(self.nombres), dtype=bool)
+        codes = [self.archive.codes.get(normalize_station_name(nombre)) for nombre in estaciones]
+        mask = np.zeros(len(self.nombres), dtype=bool)
+        mask[[code for code in codes if code is not None and code < len(mask)]] = True
+        return mask
+
+    def day_range(self, desde, hasta):
+        """
+        Días (posiciones en la serie) inicial y final, inclusive, de un rango de fechas
+        """
+
+        primero = 0 if desde is None else int(self.fechas.searchsorted(pd.Timestamp(desde)))
+        ultimo = len(self.fechas) - 1 if hasta is None else int(self.fechas.searchsorted(pd.Timestamp(hasta), side='right')) - 1
+        return primero, ultimo
+
+    def filter_positions(self, posiciones, desde, hasta, estaciones):
+        dias, codes = np.divmod(posiciones, len(self.nombres))
+        primero, ultimo = self.day_range(desde, hasta)
+        mask = (dias >= primero) & (dias <= ultimo) & self.station_mask(estaciones)[codes]
+        return dias[mask], codes[mask]
+
+    def events_frame(self, variable, dias, codes):
+        return pd.DataFrame({
+            "FECHA": self.fechas[dias],
+            "ESTACION": np.asarray(self.nombres, dtype=object)[codes],
+            variable: self.serie[dias, codes, VARIABLES.index(variable)],
+        })
+
+    # --- Consultas ---
+
+    def threshold(self, variable, operador, umbral, desde=None, hasta=None, estaciones=None):
+        """
+        Estaciones-día en que la variable cumple "operador umbral", ordenados por fecha
+        (p. ej. threshold("PP", ">", 20, desde=..., hasta=...))
+        """
+
+        if not self.ensure():
+            return None
+        ordenados = self.ordenados[variable]
+        if operador in (">", ">="):
+            corte = np.searchsorted(ordenados, umbral, side='right' if operador == ">" else 'left')
+            posiciones = self.posiciones[variable][corte:]
+        else:
+            corte = np.searchsorted(ordenados, umbral, side='left' if operador == "<" else 'right')
+            posiciones = self.posiciones[variable][:corte]
+
+        dias, codes = self.filter_positions(posiciones, desde, hasta, estaciones)
+        orden = np.lexsort((codes, dias))
+        return self.events_frame(variable, dias[orden], codes[orden])
+
+    def last(self, estacion, variable, operador, umbral, antes=None):
+        """
+        Último día (hasta la fecha antes) en que una estación cumplió "operador umbral", o None
+        """
+
+        eventos = self.threshold(variable, operador, umbral, hasta=antes, estaciones=[estacion])
+        if eventos is None or eventos.empty:
+            return None
+        return eventos.iloc[-1]
+
+    def top_k(self, variable, k=10, mayores=True, desde=None, hasta=None, estaciones=None):
+        """
+        Los k valores más altos (o más bajos) de la variable en el rango y estaciones pedidos
+        """
+
+        if not self.ensure():
+            return None
+        posiciones = self.posiciones[variable]
+        if mayores:
+            posiciones = posiciones[::-1]
+
+        # Se lee el extremo del índice en bloques crecientes hasta reunir k eventos
+        bloque = BLOQUE_TOP
+        while True:
+            dias, codes = self.filter_positions(posiciones[:bloque], desde, hasta, estaciones)
+            if len(dias) >= k or bloque >= len(posiciones):
+                break
+            bloque *= 4
+        return self.events_frame(variable, dias[:k], codes[:k])
+
+    def compute_runs(self, variable, operador, umbral):
+        """
+        Rachas de días consecutivos que cumplen la condición, codificadas por longitud:
+        arreglos (estación, día inicial, días). Un día sin dato corta la racha.
+        """
+
+        valores = self.serie[:, :, VARIABLES.index(variable)].T
+        with np.errstate(invalid='ignore'):
+            cumple = OPERADORES[operador](valores, umbral)
+        borde = np.zeros((cumple.shape[0], 1), dtype=np.int8)
+        cambios = np.diff(np.hstack([borde, cumple.astype(np.int8), borde]), axis=1)
+        # nonzero recorre por estación y luego por día, así inicios y fines quedan emparejados
+        codes, inicios = np.nonzero(cambios == 1)
+        _, fines = np.nonzero(cambios == -1)
+        return codes.astype(np.int32), inicios.astype(np.int32), (fines - inicios).astype(np.int32)
+
+    def runs(self, condicion, min_dias=1, desde=None, hasta=None, estaciones=None, k=None):
+        """
+        Rachas de una condición ("helada", "seco", "lluvioso" o una tupla (variable,
+        operador, umbral)) de al menos min_dias que se cruzan con el rango, de la más
+        larga a la más corta
+        """
+
+        if not self.ensure():
+            return None
+        condicion = CONDICIONES.get(condicion, condicion)
+        condicion = (condicion[0], condicion[1], float(condicion[2]))
+        if condicion not in self.rachas:
+            with self.lock:
+                self.rachas[condicion] = self.compute_runs(*condicion)
+        codes, inicios, dias = self.rachas[condicion]
+
+        primero, ultimo = self.day_range(desde, hasta)
+        mask = (dias >= min_dias) & (inicios <= ultimo) & (inicios + dias - 1 >= primero)
+        mask &= self.station_mask(estaciones)[codes]
+        seleccion = np.flatnonzero(mask)
+        seleccion = seleccion[np.lexsort((inicios[seleccion], -dias[seleccion]))][:k]
+
+        return pd.DataFrame({
+            "ESTACION": np.asarray(self.nombres, dtype=object)[codes[seleccion]],
+            "INICIO": self.fechas[inicios[seleccion]],
+            "FIN": self.fechas[inicios[seleccion] + dias[seleccion] - 1],
+            "DIAS": dias[seleccion],
+        })
+
+
+event_index = EventIndex(historical_archive)
@@ -1,146 +1,200 @@
-from urllib.parse import quote
+from datetime import date
+from functools import partial
 from io import BytesIO
-from cache import data_cache
+from data.archive import historical_archive
+from data.single_flight import coalesce, coalesce_many
+from data.stations import normalize_station_names, station_registry
+from data.storage import ArchivoNoEncontrado, storage
+from data.validation import (COLUMNAS_OCTAS_PLANILLA, COLUMNAS_TEXTO_PLANILLA, attach_flags, daily_flags,
+                             monthly_flags, planilla_flags)
+from metrics import file_type, stage
+from profiling import profiled
 import config as cf
+import numpy as np
 import pandas as pd
-import requests
 import calendar
 
+# Columnas de texto de la planilla (las de octas están en data.validation)
+COLUMNAS_CATEGORICAS_PLANILLA = ["DIRECCION VIENTO DIARIA", "FORMA DE NUBES BAJAS DIARIAS",
+                                 "FORMA DE NUBES MEDIAS DIARIAS", "FORMA DE NUBES ALTAS DIARIAS"]
+
+@coalesce
+@profiled("get_all_normales")
 def get_all_normales():
     """
     Obtener lista de Dataframes de valores normales para cada estación por mes
     """
 
-    headers = {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
-
     full_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_NORMAL}/{cf.ARCHIVO_EXCEL_NORMALES}"
-    encoded_path = quote(full_path, safe='/')
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{encoded_path}:/content"
-
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        content = BytesIO(response.content)
-        sheets = ["TMAX", "TMIN", "PP"]
-        normales = {}
-
-        for sheet in sheets:
-            df = pd.read_excel(
-                content,
-                sheet_name=sheet,
-                usecols='C,D,L:W',
-                header=1
-            )
-            df = df[df["DEPARTAMENTO"] == "PUNO"]
-            df = df.drop("DEPARTAMENTO", axis=1)
-            df = df.set_index('NOMBRE ESTACION', drop=True)
-            df.columns = df.columns.str.upper()
-            normales[sheet] = df
-
-        return normales
-    else:
-        raise Exception(f"Fallo al descargar {cf.ARCHIVO_EXCEL_NORMALES}: {response.status_code}")
+    return load_parsed(full_path, cf.ARCHIVO_EXCEL_NORMALES, parse_normales)
 
-def get_registro_diario(year, month, day):
+def parse_normales(content, version):
     """
-    Obtener un Dataframe de variables registradas por estación diario
+    Leer los Dataframes de normales (hojas TMAX, TMIN y PP) desde el contenido del archivo
     """
 
-    headers = {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
-    folder_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_DIARIO}"
-    month = convert_month(month)
-    if day < 10:
-        day = digit_to_string(day)
-
-    full_path = f"{folder_path}/{year}/{month}/SENAMHI_DZ13_Datos_{day}_{month}_{year}.xlsx"
-    encoded_path = quote(full_path, safe='/')
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{encoded_path}:/content"
+    content = BytesIO(content)
+    sheets = ["TMAX", "TMIN", "PP"]
+    normales = {}
 
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        content = BytesIO(response.content)
+    for sheet in sheets:
         df = pd.read_excel(
             content,
-            usecols='A,C:E,I',
-            nrows=42,
-            header=3
+            sheet_name=sheet,
+            usecols='C,D,L:W',
+            header=1
         )
-        df.columns = ["ZONA", "ESTACION", "TMAX", "TMIN", "PP"]
-        df['ZONA'] = df["ZONA"].ffill()
-        df["ESTACION"] = df["ESTACION"].str.translate(str.maketrans('áéíóú', 'aeiou'))
-        df["ESTACION"] = df["ESTACION"].str.upper()
-        df["ESTACION"] = df["ESTACION"].str.replace("TAHUACO - YUNGUYO", "TAHUACO YUNGUYO")
-        df = df.set_index(["ZONA", "ESTACION"])
-        return df
-    else:
-        raise Exception(f"Fallo al descargar el registro diario: {response.status_code}")
+        df = df[df["DEPARTAMENTO"] == "PUNO"]
+        df = df.drop("DEPARTAMENTO", axis=1)
+        df = df.set_index('NOMBRE ESTACION', drop=True)
+        df.columns = df.columns.str.upper()
+        normales[sheet] = df
 
+    return normales
+
+@coalesce
+@profiled("get_registro_diario")
+def get_registro_diario(year, month, day):
+    """
+    Obtener un Dataframe de variables registradas por estación diario
+    """
+
+    full_path = path_registro_diario(year, month, day)
+    df = historical_archive.daily_frame(full_path, current_version(full_path), date(year, month, day))
+    if df is None:
+        df = load_parsed(full_path, "el registro diario", parse_registro_diario)
+    # Código de estación por fila para alinear con las normales sin comparar nombres
+    df["CODIGO"] = station_registry.codes(df.index.get_level_values("ESTACION"), "registro diario").astype(np.int16)
+    return df
+
+def parse_registro_diario(content, version):
+    """
+    Leer el Dataframe del registro diario desde el contenido del archivo
+    """
+
+    content = BytesIO(content)
+    df = pd.read_excel(
+        content,
+        usecols='A,C:E,I',
+        nrows=42,
+        header=3
+    )
+    df.columns = ["ZONA", "ESTACION", "TMAX", "TMIN", "PP"]
+    df['ZONA'] = df["ZONA"].ffill()
+    df["ESTACION"] = normalize_station_names(df["ESTACION"])
+    # Validación antes de tipar: después el texto de una celda numérica ya no se distingue de un vacío
+    banderas = daily_flags(df)
+    df = compact_columns(df, ["TMAX", "TMIN", "PP"])
+    # El MultiIndex guarda zona y estación como códigos enteros sobre sus niveles (equivalente a categorical)
+    df = df.set_index(["ZONA", "ESTACION"])
+    df.attrs["version"] = version
+    return attach_flags(df, banderas)
+
+@coalesce
+@profiled("get_registro_mensual")
 def get_registro_mensual(year, month):
     """
     Obtener un Dataframe de los datos mensuales de todas las estaciones
     """
 
-    headers = {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
-    folder_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_SEMANAL}"
+    full_path = path_registro_mensual(year, month)
+    df = historical_archive.monthly_frame(full_path, current_version(full_path), year, month)
+    if df is not None:
+        return df
+    return load_parsed(full_path, "el registro mensual", partial(parse_registro_mensual, year=year, month=month))
 
-    name_month = convert_month(month)
-    if month < 10:
-        num_month = digit_to_string(month)
-    else:
-        num_month = month
+@profiled("get_registros_mensuales")
+def get_registros_mensuales(months):
+    """
+    Obtener los Dataframes de varios meses con una sola resolución por lotes
 
-    full_path = f"{folder_path}/{year}/{num_month}. {name_month} {year}.xlsx"
-    encoded_path = quote(full_path, safe='/')
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{encoded_path}:/content"
+    Returns:
+        Diccionario (año, mes) -> Dataframe, o ArchivoNoEncontrado si el mes no existe
+    """
 
-    response = requests.get(url, headers=headers)
+    result = {}
+    pending = []
+    for year, month in months:
+        full_path = path_registro_mensual(year, month)
+        archived = historical_archive.monthly_frame(full_path, current_version(full_path), year, month)
+        if archived is not None:
+            result[(year, month)] = archived
+        else:
+            pending.append((year, month))
+
+    # Cada mes se agrupa con las cargas en curso de get_registro_mensual y de otros lotes
+    result.update(coalesce_many("get_registro_mensual", pending, download_registros_mensuales))
+    return result
+
+def download_registros_mensuales(months):
+    """
+    Descargar por lotes y leer los meses (año, mes) que nadie más está cargando
+    """
 
-    if response.status_code == 200:
-        content = BytesIO(response.content)
-        df = pd.read_excel(
-            content,
-            sheet_name="METEO",
-            skiprows=4,
-            usecols='B:FU',
-            nrows=calendar.monthrange(year, month)[1] + 2
-        )
-        df.iloc[0] = df.iloc[0].ffill()
-        df.columns = pd.MultiIndex.from_arrays([df.iloc[0], df.iloc[1]])
-        df = df.iloc[2:].reset_index(drop=True)
-        return df
-    else:
-        raise Exception(f"Fallo al descargar el registro diario: {response.status_code}")
+    paths = {path_registro_mensual(year, month): (year, month) for year, month in months}
+    downloads = storage.read_many(list(paths), "el registro mensual")
+    result = {}
+    for full_path, (year, month) in paths.items():
+        downloaded = downloads[full_path]
+        if isinstance(downloaded, Exception):
+            result[(year, month)] = downloaded
+        else:
+            with stage("parseo", "mensual"):
+                result[(year, month)] = parse_registro_mensual(*downloaded, year=year, month=month)
+    return result
+
+def parse_registro_mensual(content, version, year, month):
+    """
+    Leer el Dataframe de la hoja METEO desde el contenido del archivo mensual
+    """
 
+    content = BytesIO(content)
+    df = pd.read_excel(
+        content,
+        sheet_name="METEO",
+        skiprows=4,
+        usecols='B:FU',
+        nrows=calendar.monthrange(year, month)[1] + 2
+    )
+    df.iloc[0] = df.iloc[0].ffill()
+    df.columns = pd.MultiIndex.from_arrays([df.iloc[0], df.iloc[1]])
+    # Las dos filas de encabezado dejan todas las columnas como object: se validan y se tipan una sola vez aquí
+    df = df.iloc[2:].reset_index(drop=True)
+    banderas = monthly_flags(df)
+    df = compact_columns(df)
+    df.attrs["version"] = version
+    return attach_flags(df, banderas)
+
+@coalesce
+@profiled("get_metadata")
 def get_metadata():
     """
     Obtener metadata en forma de Dataframe para los archivos excel
     """
 
-    headers = {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
-
     full_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_METADATA}/{cf.ARCHIVO_EXCEL_METADATA}"
-    encoded_path = quote(full_path, safe='/')
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{encoded_path}:/content"
-
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        content = BytesIO(response.content)
-        df = pd.read_excel(
-            content,
-            sheet_name="GEOGRAFICAS",
-            usecols='A:G',
-            header=0,
-            nrows=42
-        )
-        df["ESTACION"] = df["ESTACION"].str.translate(str.maketrans('áéíóú', 'aeiou'))
-        df["ESTACION"] = df["ESTACION"].str.upper()
-        df["ESTACION"] = df["ESTACION"].str.replace("TAHUACO - YUNGUYO", "TAHUACO YUNGUYO")
-        df = df.set_index('ESTACION', drop=True)
+    return load_parsed(full_path, cf.ARCHIVO_EXCEL_METADATA, parse_metadata)
 
-        return df
-    else:
-        raise Exception(f"Fallo al descargar {cf.ARCHIVO_EXCEL_METADATA}: {response.status_code}")
+def parse_metadata(content, version):
+    """
+    Leer el Dataframe de metadata (hoja GEOGRAFICAS) desde el contenido del archivo
+    """
 
+    content = BytesIO(content)
+    df = pd.read_excel(
+        content,
+        sheet_name="GEOGRAFICAS",
+        usecols='A:G',
+        header=0,
+        nrows=42
+    )
+    df["ESTACION"] = normalize_station_names(df["ESTACION"])
+    df = df.set_index('ESTACION', drop=True)
+
+    return df
+
+@coalesce
+@profiled("get_planilla_climatologica")
 def get_planilla_climatologica(station_name, year, month):
     """
     Obtener Dataframe de los datos Voz y Data de una estación para planilla
@@ -148,28 +202,206 @@ def get_planilla_climatologica(station_name, year, month):
     Nota: Falta implantar year en los archivos, se mantiene por ahora para demo.
     """
 
-    headers = {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
-    folder_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_PLANILLA}/{year}/{station_name}"
+    full_path = path_planilla(station_name, year, month)
+    return load_parsed(full_path, "planilla climatológica", partial(parse_planilla_climatologica, station_name=station_name))
 
-    month_name = convert_month(month)
-    file_name = f"{month_name}.xlsx"
-    full_path = f"{folder_path}/{file_name}"
-    encoded_path = quote(full_path, safe='/')
-    url = f"https://graph.microsoft.com/v1.0/me/drive/root:/{encoded_path}:/content"
+@profiled("get_planillas_climatologicas")
+def get_planillas_climatologicas(stations, year, month):
+    """
+    Obtener las planillas de varias estaciones para un mes con descargas por lotes
 
-    response = requests.get(url, headers=headers)
+    Returns:
+        Diccionario estación -> Dataframe, o ArchivoNoEncontrado si no existe
+    """
 
-    if response.status_code == 200:
-        content = BytesIO(response.content)
-        df = pd.read_excel(
-            content,
-            sheet_name=station_name,
-            usecols='A:U',
-            nrows=91
-        )
-        return df
+    # Cada planilla se agrupa con las cargas en curso de get_planilla_climatologica y de otros lotes
+    loaded = coalesce_many("get_planilla_climatologica", [(station, year, month) for station in stations],
+                           download_planillas_climatologicas)
+    return {station: df for (station, _, _), df in loaded.items()}
+
+def download_planillas_climatologicas(keys):
+    """
+    Descargar por lotes y leer las planillas (estación, año, mes) que nadie más está cargando
+    """
+
+    paths = {path_planilla(*key): key for key in keys}
+    downloads = storage.read_many(list(paths), "planilla climatológica")
+
+    result = {}
+    for full_path, key in paths.items():
+        downloaded = downloads[full_path]
+        if isinstance(downloaded, Exception):
+            result[key] = downloaded
+        else:
+            with stage("parseo", "planilla"):
+                result[key] = parse_planilla_climatologica(*downloaded, station_name=key[0])
+    return result
+
+def parse_planilla_climatologica(content, version, station_name):
+    """
+    Leer el Dataframe de la planilla de una estación desde el contenido del archivo
+    """
+
+    content = BytesIO(content)
+    df = pd.read_excel(
+        content,
+        sheet_name=station_name,
+        usecols='A:U',
+        nrows=91
+    )
+    banderas = planilla_flags(df)
+    # Las mediciones se mantienen en float64 para no alterar el redondeo de la planilla exportada;
+    # el texto en columnas numéricas queda marcado en las banderas y como vacío en los datos
+    for column in df.columns.difference(COLUMNAS_TEXTO_PLANILLA):
+        if df[column].dtype == object:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    for column in COLUMNAS_CATEGORICAS_PLANILLA:
+        if column in df:
+            df[column] = df[column].astype("category")
+    for column in COLUMNAS_OCTAS_PLANILLA:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors='coerce').round().astype("Int8")
+    return attach_flags(df, banderas)
+
+def compact_columns(df, columns=None):
+    """
+    Convierte las columnas indicadas (todas por defecto) a float32 si todos sus
+    valores son numéricos, o a category si contienen texto
+    """
+
+    compact = {}
+    for position, column in enumerate(df.columns):
+        values = df.iloc[:, position]
+        if (columns is not None and column not in columns) or values.dtype == np.float32:
+            compact[position] = values
+            continue
+        numeric = pd.to_numeric(values, errors='coerce')
+        if numeric.notna().sum() == values.notna().sum():
+            compact[position] = numeric.astype(np.float32)
+        else:
+            compact[position] = values.astype("category")
+
+    result = pd.concat(compact, axis=1)
+    result.columns = df.columns
+    result.attrs = df.attrs
+    return result
+
+def load_parsed(full_path, descripcion, parser):
+    """
+    Leer y parsear un archivo, usando la versión ya parseada que deja
+    sync_mirror --convertir si el backend la tiene al día
+    """
+
+    parsed = storage.read_parsed(full_path)
+    if parsed is not None:
+        return parsed
+    content, version = storage.read(full_path, descripcion)
+    with stage("parseo", file_type(full_path)):
+        return parser(content, version)
+
+def parser_for_path(full_path):
+    """
+    Función de parseo que corresponde a una ruta según las convenciones de carpetas
+
+    Returns:
+        Función (contenido, versión) -> Dataframe, o None si la ruta no es un libro conocido
+    """
+
+    parts = full_path.split("/")
+    if len(parts) < 3 or parts[0] != cf.DIRECTORIO_PRINCIPAL or not full_path.endswith(".xlsx"):
+        return None
+
+    folder, file_name = parts[1], parts[-1]
+    if full_path == f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_NORMAL}/{cf.ARCHIVO_EXCEL_NORMALES}":
+        return parse_normales
+    if full_path == f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_METADATA}/{cf.ARCHIVO_EXCEL_METADATA}":
+        return parse_metadata
+    if folder == cf.DIRECTORIO_REGISTRO_DIARIO and file_name.startswith("SENAMHI_DZ13_Datos_"):
+        return parse_registro_diario
+    if folder == cf.DIRECTORIO_REGISTRO_SEMANAL and len(parts) == 4:
+        year, month = int(parts[2]), int(file_name.split(".")[0])
+        return partial(parse_registro_mensual, year=year, month=month)
+    if folder == cf.DIRECTORIO_PLANILLA and len(parts) == 5:
+        return partial(parse_planilla_climatologica, station_name=parts[3])
+    return None
+
+def list_folder(folder_path):
+    """
+    Obtener los nombres de archivo de una carpeta (sin descargarlos)
+    """
+
+    return storage.list(folder_path)
+
+def get_available_days(year, month):
+    """
+    Días del mes que tienen registro diario
+    """
+
+    folder_path = path_registro_diario(year, month, 1).rsplit("/", 1)[0]
+    names = list_folder(folder_path)
+    return [day for day in range(1, calendar.monthrange(year, month)[1] + 1)
+            if path_registro_diario(year, month, day).rsplit("/", 1)[1] in names]
+
+def get_available_months(year):
+    """
+    Meses del año que tienen registro mensual
+    """
+
+    folder_path = path_registro_mensual(year, 1).rsplit("/", 1)[0]
+    names = list_folder(folder_path)
+    return [month for month in range(1, 13)
+            if path_registro_mensual(year, month).rsplit("/", 1)[1] in names]
+
+def is_planilla_available(station_name, year, month):
+    """
+    Indica si existe la planilla de una estación para el mes
+    """
+
+    folder_path, file_name = path_planilla(station_name, year, month).rsplit("/", 1)
+    return file_name in list_folder(folder_path)
+
+def path_registro_diario(year, month, day):
+    """
+    Ruta en OneDrive del registro diario de una fecha
+    """
+
+    folder_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_DIARIO}"
+    month = convert_month(month)
+    if day < 10:
+        day = digit_to_string(day)
+
+    return f"{folder_path}/{year}/{month}/SENAMHI_DZ13_Datos_{day}_{month}_{year}.xlsx"
+
+def path_registro_mensual(year, month):
+    """
+    Ruta en OneDrive del registro mensual (hoja METEO) de un mes
+    """
+
+    folder_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_SEMANAL}"
+
+    name_month = convert_month(month)
+    if month < 10:
+        num_month = digit_to_string(month)
     else:
-        raise Exception(f"Fallo al descargar planilla climatológica: {response.status_code}")
+        num_month = month
+
+    return f"{folder_path}/{year}/{num_month}. {name_month} {year}.xlsx"
+
+def path_planilla(station_name, year, month):
+    """
+    Ruta en OneDrive de la planilla de una estación para un mes
+    """
+
+    folder_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_PLANILLA}/{year}/{station_name}"
+    month_name = convert_month(month)
+    return f"{folder_path}/{month_name}.xlsx"
+
+def current_version(full_path):
+    """
+    eTag actual del archivo según el backend, sin descargarlo (None si no se conoce)
+    """
+
+    return storage.etag(full_path)
 
 def convert_month(month):
     """
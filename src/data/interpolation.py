@@ -0,0 +1,115 @@
+from cache import data_cache, weights_cache
+import config as cf
+import numpy as np
+import pandas as pd
+
+# Extensión de la malla por defecto (latitud mínima, latitud máxima, longitud mínima, longitud máxima)
+LIMITES_PUNO = (-17.4, -12.9, -71.2, -68.7)
+KM_POR_GRADO = 111.32
+
+
+def load_grid():
+    """
+    Malla regular del mapa: ejes de latitud y longitud y la altitud de cada punto.
+
+    Con ARCHIVO_ELEVACION (un .npz con latitud, longitud y altitud) la malla es la
+    del modelo de elevación; sin él es una malla de MAPA_RESOLUCION grados sobre
+    Puno sin altitud, y las temperaturas se llevan a ALTITUD_REFERENCIA.
+    """
+
+    if "MALLA_MAPA" in data_cache:
+        return data_cache["MALLA_MAPA"]
+
+    if cf.ARCHIVO_ELEVACION:
+        with np.load(cf.ARCHIVO_ELEVACION) as dem:
+            latitud, longitud = dem["latitud"].astype(np.float64), dem["longitud"].astype(np.float64)
+            altitud = dem["altitud"].astype(np.float32)
+    else:
+        lat_min, lat_max, lon_min, lon_max = LIMITES_PUNO
+        latitud = np.arange(lat_min, lat_max + cf.MAPA_RESOLUCION / 2, cf.MAPA_RESOLUCION)
+        longitud = np.arange(lon_min, lon_max + cf.MAPA_RESOLUCION / 2, cf.MAPA_RESOLUCION)
+        altitud = None
+
+    data_cache["MALLA_MAPA"] = {"latitud": latitud, "longitud": longitud, "altitud": altitud,
+                                "version": cf.ARCHIVO_ELEVACION or f"regular-{cf.MAPA_RESOLUCION}"}
+    return data_cache["MALLA_MAPA"]
+
+
+def station_coordinates():
+    """
+    Latitud, longitud y altitud por código de estación (desde METADATA, ya alineada al registro)
+    """
+
+    metadata = data_cache["METADATA"]
+    return tuple(pd.to_numeric(metadata[columna], errors='coerce').to_numpy(dtype=np.float64)
+                 for columna in ("LATITUD", "LONGITUD", "ALTITUD"))
+
+
+def neighbour_weights(lat_estaciones, lon_estaciones, grid, vecinos, potencia):
+    """
+    Matriz (puntos de la malla, estaciones) de pesos IDW normalizados, con peso
+    solo para las `vecinos` estaciones más cercanas a cada punto. Con unas decenas
+    de estaciones la búsqueda de vecinos es un argpartition sobre la matriz de
+    distancias, sin árbol.
+    """
+
+    lat_malla, lon_malla = np.meshgrid(grid["latitud"], grid["longitud"], indexing='ij')
+    lat_malla, lon_malla = lat_malla.ravel(), lon_malla.ravel()
+    # Proyección equirectangular centrada en la malla: basta para distancias de pocos cientos de km
+    escala_lon = np.cos(np.radians(grid["latitud"].mean()))
+    dy = (lat_malla[:, np.newaxis] - lat_estaciones[np.newaxis, :]) * KM_POR_GRADO
+    dx = (lon_malla[:, np.newaxis] - lon_estaciones[np.newaxis, :]) * KM_POR_GRADO * escala_lon
+    distancias = np.hypot(dx, dy)
+
+    k = min(vecinos, len(lat_estaciones))
+    cercanas = np.argpartition(distancias, k - 1, axis=1)[:, :k]
+    pesos_cercanas = 1.0 / np.maximum(np.take_along_axis(distancias, cercanas, axis=1), 1e-3) ** potencia
+    pesos_cercanas /= pesos_cercanas.sum(axis=1, keepdims=True)
+
+    pesos = np.zeros(distancias.shape, dtype=np.float32)
+    np.put_along_axis(pesos, cercanas, pesos_cercanas.astype(np.float32), axis=1)
+    return pesos
+
+
+def interpolation_weights(codes):
+    """
+    Pesos para un conjunto de estaciones (códigos con dato), calculados una vez por malla y conjunto
+    """
+
+    grid = load_grid()
+    key = (grid["version"], cf.MAPA_VECINOS, cf.MAPA_POTENCIA, codes.tobytes())
+    pesos = weights_cache.get(key)
+    if pesos is None:
+        latitud, longitud, _ = station_coordinates()
+        pesos = neighbour_weights(latitud[codes], longitud[codes], grid, cf.MAPA_VECINOS, cf.MAPA_POTENCIA)
+        weights_cache.set(key, pesos)
+    return pesos
+
+
+def interpolate(valores, corregir_altitud):
+    """
+    Interpola valores por código de estación (NaN = sin dato) a la malla; devuelve
+    un arreglo (latitud, longitud) o None si ninguna estación tiene dato.
+
+    Con corregir_altitud (temperaturas, no anomalías) los valores se reducen al
+    nivel del mar con GRADIENTE_TERMICO, se interpolan y se llevan a la altitud
+    de cada punto de la malla (o a ALTITUD_REFERENCIA si no hay modelo de elevación).
+    """
+
+    grid = load_grid()
+    latitud, longitud, altitud = station_coordinates()
+    validos = np.isfinite(valores) & np.isfinite(latitud) & np.isfinite(longitud)
+    if corregir_altitud:
+        validos &= np.isfinite(altitud)
+    codes = np.flatnonzero(validos)
+    if len(codes) == 0:
+        return None
+
+    pesos = interpolation_weights(codes)
+    valores = np.asarray(valores, dtype=np.float64)[codes]
+    if not corregir_altitud:
+        return (pesos @ valores).reshape(len(grid["latitud"]), len(grid["longitud"]))
+
+    altitud_malla = grid["altitud"].ravel() if grid["altitud"] is not None else cf.ALTITUD_REFERENCIA
+    campo = pesos @ (valores + cf.GRADIENTE_TERMICO * altitud[codes]) - cf.GRADIENTE_TERMICO * altitud_malla
+    return campo.reshape(len(grid["latitud"]), len(grid["longitud"]))
@@ -0,0 +1,165 @@
+from cache import histogram_cache
+from data.file_managment import (ArchivoNoEncontrado, current_version, get_planillas_climatologicas,
+                                 is_planilla_available, path_planilla)
+from data.validation import mask_flagged
+from metrics import timed
+import numpy as np
+import pandas as pd
+
+HORAS = [7, 13, 19]
+
+# Rosa de vientos: sectores de 45° centrados en N, NE, E, ... y clases de velocidad (m/s)
+SECTORES = ["N", "NE", "E", "SE", "S", "SO", "O", "NO"]
+LIMITES_VELOCIDAD = [0.5, 2.0, 4.0, 6.0, 8.0]
+CLASES_VELOCIDAD = ["0.5-2", "2-4", "4-6", "6-8", "≥8"]
+GRADOS_PUNTOS = {
+    "N": 0.0, "NNE": 22.5, "NE": 45.0, "ENE": 67.5, "E": 90.0, "ESE": 112.5, "SE": 135.0, "SSE": 157.5,
+    "S": 180.0, "SSW": 202.5, "SW": 225.0, "WSW": 247.5, "W": 270.0, "WNW": 292.5, "NW": 315.0, "NNW": 337.5,
+}
+# Nombres en español (O = oeste)
+GRADOS_PUNTOS.update({punto.replace("W", "O"): grados for punto, grados in GRADOS_PUNTOS.items() if "W" in punto})
+CALMA = {"C", "CALMA", "CALM", "0", "00"}
+
+NIVELES_NUBES = {
+    "BAJAS": ("FORMA DE NUBES BAJAS DIARIAS", "CANTIDAD DE NUBES BAJAS DIARIAS"),
+    "MEDIAS": ("FORMA DE NUBES MEDIAS DIARIAS", "CANTIDAD DE NUBES MEDIAS DIARIAS"),
+    "ALTAS": ("FORMA DE NUBES ALTAS DIARIAS", "CANTIDAD DE NUBES ALTAS DIARIAS"),
+}
+GENEROS_NUBES = ["Ci", "Cc", "Cs", "Ac", "As", "Ns", "Sc", "St", "Cu", "Cb", "Otro"]
+
+SIN_SECTOR = -1
+
+
+def direction_sectors(direcciones):
+    """
+    Sector de la rosa (0 = N) de cada dirección, SIN_SECTOR para faltantes y len(SECTORES)
+    para calma. Acepta puntos cardinales en inglés o español y grados; cada valor
+    distinto se interpreta una sola vez.
+    """
+
+    categorias = pd.Categorical(direcciones.astype("string").str.strip().str.upper())
+    ancho = 360.0 / len(SECTORES)
+    sectores = []
+    for valor in categorias.categories:
+        if valor in CALMA:
+            sectores.append(len(SECTORES))
+            continue
+        grados = GRADOS_PUNTOS.get(valor)
+        if grados is None:
+            grados = pd.to_numeric(valor, errors='coerce')
+        sectores.append(SIN_SECTOR if pd.isna(grados) else int(((grados + ancho / 2) % 360) // ancho))
+    return np.append(np.asarray(sectores, dtype=np.intp), SIN_SECTOR)[categorias.codes]
+
+
+def cloud_genera(formas):
+    """
+    Índice en GENEROS_NUBES de cada forma de nube (-1 si falta); las formas no reconocidas van a "Otro"
+    """
+
+    categorias = pd.Categorical(formas.astype("string").str.strip())
+    conocidos = {genero.upper(): i for i, genero in enumerate(GENEROS_NUBES[:-1])}
+    indices = [conocidos.get(valor.upper(), len(GENEROS_NUBES) - 1) for valor in categorias.categories]
+    return np.append(np.asarray(indices, dtype=np.intp), -1)[categorias.codes]
+
+
+@timed("transformacion", "rosa")
+def month_histograms(df_raw):
+    """
+    Histogramas parciales de una planilla (estación-mes), por hora de observación:
+    viento (hora, sector, clase de velocidad), calmas (hora), formas de nubes
+    (hora, nivel, género) y nubosidad total en octas (hora, 0-8). Como en el resto
+    de la planilla, la hora sale de la posición de la fila (3 filas por día).
+    """
+
+    hora = np.arange(len(df_raw)) % len(HORAS)
+
+    sector = direction_sectors(df_raw["DIRECCION VIENTO DIARIA"])
+    velocidad = pd.to_numeric(df_raw["VELOCIDAD DEL VIENTO DIARIO"], errors='coerce').to_numpy(dtype=np.float64)
+    calma = (sector == len(SECTORES)) | (velocidad < LIMITES_VELOCIDAD[0])
+    clase = np.searchsorted(LIMITES_VELOCIDAD, velocidad, side='right') - 1
+    con_viento = ~calma & (sector >= 0) & (sector < len(SECTORES)) & np.isfinite(velocidad)
+
+    forma_viento = (len(HORAS), len(SECTORES), len(CLASES_VELOCIDAD))
+    viento = np.bincount(np.ravel_multi_index((hora[con_viento], sector[con_viento], clase[con_viento]), forma_viento),
+                         minlength=np.prod(forma_viento)).reshape(forma_viento)
+    calmas = np.bincount(hora[calma], minlength=len(HORAS))
+
+    forma_nubes = (len(HORAS), len(NIVELES_NUBES), len(GENEROS_NUBES))
+    nubes = np.zeros(forma_nubes, dtype=np.int64)
+    total_octas = np.zeros(len(df_raw), dtype=np.float64)
+    observada = np.zeros(len(df_raw), dtype=bool)
+    for nivel, (columna_forma, columna_cantidad) in enumerate(NIVELES_NUBES.values()):
+        genero = cloud_genera(df_raw[columna_forma]) if columna_forma in df_raw else np.full(len(df_raw), -1)
+        validos = genero >= 0
+        nubes[:, nivel] = np.bincount(hora[validos] * len(GENEROS_NUBES) + genero[validos],
+                                      minlength=len(HORAS) * len(GENEROS_NUBES)).reshape(len(HORAS), -1)
+        if columna_cantidad in df_raw:
+            cantidad = pd.to_numeric(df_raw[columna_cantidad], errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            total_octas += np.nan_to_num(cantidad)
+            observada |= ~np.isnan(cantidad)
+
+    # Como en la planilla: la cantidad total es la suma de niveles con tope de 8 octas
+    octas = np.minimum(np.round(total_octas), 8).astype(np.intp)
+    octas = np.bincount(hora[observada] * 9 + octas[observada], minlength=len(HORAS) * 9).reshape(len(HORAS), 9)
+
+    return {"viento": viento.astype(np.int32), "calmas": calmas.astype(np.int32),
+            "nubes": nubes.astype(np.int32), "octas": octas.astype(np.int32)}
+
+
+def station_month_histograms(stations, year, month):
+    """
+    Histogramas de varias estaciones para un mes: desde histogram_cache (por
+    estación, mes y eTag) o descargando por lotes solo las planillas que faltan.
+    Las estaciones sin planilla se omiten.
+    """
+
+    result, faltantes = {}, {}
+    for station in stations:
+        key = (station, year, month, current_version(path_planilla(station, year, month)))
+        histogramas = histogram_cache.get(key)
+        if histogramas is not None:
+            result[station] = histogramas
+        elif is_planilla_available(station, year, month):
+            faltantes[station] = key
+
+    if faltantes:
+        for station, df_raw in get_planillas_climatologicas(list(faltantes), year, month).items():
+            if isinstance(df_raw, ArchivoNoEncontrado):
+                continue
+            if isinstance(df_raw, Exception):
+                raise df_raw
+            # Las celdas marcadas por la validación no entran a la rosa ni a las nubes
+            result[station] = month_histograms(mask_flagged(df_raw))
+            histogram_cache.set(faltantes[station], result[station])
+    return result
+
+
+def aggregate(stations, months, horas=None):
+    """
+    Rosa de vientos y frecuencias de nubes de varias estaciones y meses (año, mes)
+    para las horas pedidas (todas por defecto), sumando los histogramas parciales.
+
+    Returns:
+        Diccionario con viento (sector, clase), calmas, nubes (nivel, género),
+        octas (0-8), meses_con_datos y meses_sin_planilla
+    """
+
+    horas = [HORAS.index(hora) for hora in (horas or HORAS)]
+    total = None
+    con_datos, sin_planilla = 0, []
+    for year, month in months:
+        por_estacion = station_month_histograms(stations, year, month)
+        sin_planilla += [(station, year, month) for station in stations if station not in por_estacion]
+        for histogramas in por_estacion.values():
+            con_datos += 1
+            if total is None:
+                total = {nombre: valores.astype(np.int64) for nombre, valores in histogramas.items()}
+            else:
+                for nombre, valores in histogramas.items():
+                    total[nombre] += valores
+
+    if total is None:
+        return None
+    resultado = {nombre: valores[horas].sum(axis=0) for nombre, valores in total.items()}
+    resultado.update(meses_con_datos=con_datos, meses_sin_planilla=sin_planilla)
+    return resultado
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+# Fórmulas de la OMM (Guía de Instrumentos y Métodos de Observación, anexo 4.B):
+# tensión de saturación de Magnus y ecuación psicrométrica del psicrómetro ventilado
+MAGNUS_AGUA = (6.112, 17.62, 243.12)
+MAGNUS_HIELO = (6.112, 22.46, 272.62)
+COEFICIENTE_AGUA = 6.53e-4
+COEFICIENTE_HIELO = 5.75e-4
+
+VARIABLES_PSICROMETRICAS = ["HUMEDAD RELATIVA", "TENSION DE VAPOR", "PUNTO DE ROCIO"]
+
+
+def station_pressure(altitud):
+    """
+    Presión en hPa de la atmósfera estándar a la altitud de la estación (m); a
+    3800 m es ~630 hPa, un 38 % menos que al nivel del mar
+    """
+
+    return 1013.25 * (1.0 - 2.25577e-5 * np.asarray(altitud, dtype=np.float64)) ** 5.25588
+
+
+def saturation_vapour_pressure(temperatura, hielo=False):
+    """
+    Tensión de saturación en hPa sobre agua (o sobre hielo) para temperaturas en °C
+    """
+
+    a, b, c = MAGNUS_HIELO if hielo else MAGNUS_AGUA
+    return a * np.exp(b * temperatura / (c + temperatura))
+
+
+def psychrometrics(seco, humedo, altitud):
+    """
+    Humedad relativa (%), tensión de vapor (hPa) y punto de rocío (°C) a partir de
+    los termómetros seco y húmedo (°C) y la altitud (m).
+
+    Trabaja con arreglos de cualquier forma que se puedan combinar: una
+    estación-mes (días, horas) con una altitud escalar, o un lote de estaciones
+    (estaciones, días, horas) con altitud (estaciones, 1, 1). Con el bulbo húmedo
+    bajo 0 °C se usan las constantes sobre hielo. Las lecturas faltantes o
+    inconsistentes (tensión de vapor no positiva) dan NaN.
+    """
+
+    seco = np.asarray(seco, dtype=np.float64)
+    humedo = np.asarray(humedo, dtype=np.float64)
+    presion = station_pressure(altitud)
+
+    hielo = humedo < 0
+    coeficiente = np.where(hielo, COEFICIENTE_HIELO, COEFICIENTE_AGUA * (1 + 0.000944 * humedo))
+    saturacion_humedo = np.where(hielo, saturation_vapour_pressure(humedo, hielo=True),
+                                 saturation_vapour_pressure(humedo))
+    tension = saturacion_humedo - coeficiente * presion * (seco - humedo)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tension = np.where(tension > 0, tension, np.nan)
+        humedad = np.clip(100 * tension / saturation_vapour_pressure(seco), 0, 100)
+        logaritmo = np.log(tension / MAGNUS_AGUA[0])
+        rocio = MAGNUS_AGUA[2] * logaritmo / (MAGNUS_AGUA[1] - logaritmo)
+
+    return {"HUMEDAD RELATIVA": humedad, "TENSION DE VAPOR": tension, "PUNTO DE ROCIO": rocio}
+
+
+def planilla_psychrometrics(df_raw, altitud, num_days):
+    """
+    Variables psicrométricas de una planilla (3 lecturas por día: 7h, 13h y 19h)
+    como arreglos (días, horas)
+    """
+
+    filas = min(num_days, len(df_raw) // 3) * 3
+    lecturas = {}
+    for columna in ("TEMPERATURA DEL BULBO SECO DIARIO", "TEMPERATURA BULBO HUMEDO DIARIA"):
+        if columna in df_raw:
+            valores = pd.to_numeric(df_raw[columna].iloc[:filas], errors='coerce').to_numpy(dtype=np.float64)
+        else:
+            valores = np.full(filas, np.nan)
+        lecturas[columna] = valores.reshape(-1, 3)
+    return psychrometrics(lecturas["TEMPERATURA DEL BULBO SECO DIARIO"], lecturas["TEMPERATURA BULBO HUMEDO DIARIA"],
+                          altitud)
@@ -0,0 +1,135 @@
+from functools import wraps
+from threading import Event, Lock
+
+
+class _Call:
+    """
+    Descarga en curso compartida por todas las solicitudes con la misma llave
+    """
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas: solo la primera ejecuta la función,
+    las demás esperan y reciben el mismo resultado (o la misma excepción)
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def claim(self, key):
+        """
+        Llamada en curso para la llave (creada si no había) e indicador de si quien
+        pregunta es el líder que debe ejecutarla y cerrarla con finish
+        """
+
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self.calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def finish(self, key, call, result=None, error=None):
+        call.result, call.error = result, error
+        with self.lock:
+            del self.calls[key]
+        call.done.set()
+
+    @staticmethod
+    def wait(call):
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def do(self, key, fn, *args, **kwargs):
+        call, leader = self.claim(key)
+        if not leader:
+            return self.wait(call)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            # También KeyboardInterrupt o SystemExit: los que esperan no deben recibir None como si hubiera terminado bien
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self):
+        """
+        Descargas ejecutadas y descargas duplicadas evitadas
+        """
+
+        return {"executions": self.executions, "coalesced": self.coalesced}
+
+
+loader_flight = SingleFlight()
+
+
+def coalesce(fn):
+    """
+    Decorador para los loaders de file_managment: llamadas concurrentes con los
+    mismos argumentos comparten una sola descarga y lectura del archivo
+    """
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        return loader_flight.do(key, fn, *args, **kwargs)
+
+    return wrapper
+
+
+def coalesce_many(name, args_list, load_many):
+    """
+    Versión por lotes de coalesce: cada elemento de args_list se agrupa con las
+    llamadas en curso de name(*args), sean individuales o de otro lote. load_many
+    recibe solo los argumentos que nadie está cargando y devuelve args -> resultado
+    (una excepción como valor es el error de ese elemento).
+
+    Returns:
+        Diccionario args -> resultado o excepción
+    """
+
+    claimed, waiting = {}, {}
+    for args in args_list:
+        key = (name, args, ())
+        call, leader = loader_flight.claim(key)
+        (claimed if leader else waiting)[args] = (key, call)
+
+    result, error = {}, None
+    try:
+        if claimed:
+            result.update(load_many(list(claimed)))
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        for args, (key, call) in claimed.items():
+            value = result.get(args)
+            if isinstance(value, BaseException):
+                loader_flight.finish(key, call, error=value)
+            elif args in result:
+                loader_flight.finish(key, call, result=value)
+            else:
+                loader_flight.finish(key, call, error=error or RuntimeError(f"La carga por lotes de {name}{args} no devolvió resultado"))
+
+    for args, (key, call) in waiting.items():
+        try:
+            result[args] = loader_flight.wait(call)
+        except Exception as e:
+            result[args] = e
+    return result
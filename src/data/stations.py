@@ -0,0 +1,148 @@
+from threading import Lock
+import numpy as np
+import pandas as pd
+import re
+
+# Variantes de escritura que no distinguen estaciones: tildes, guiones y espacios
+_SIN_TILDES = str.maketrans("áéíóúÁÉÍÓÚäëïöüÄËÏÖÜ-_", "aeiouAEIOUaeiouAEIOU  ")
+_ESPACIOS = re.compile(r"\s+")
+
+SIN_CODIGO = -1
+
+
+def normalize_station_name(name):
+    """
+    Nombre de estación sin tildes, con guiones como espacios, espacios simples y en mayúsculas
+    ("Tahuaco - Yunguyo" -> "TAHUACO YUNGUYO")
+    """
+
+    if not isinstance(name, str):
+        return name
+    return _ESPACIOS.sub(" ", name.translate(_SIN_TILDES)).strip().upper()
+
+
+def normalize_station_names(names):
+    """
+    Normaliza una Serie de nombres (cada nombre distinto se normaliza una sola vez)
+    """
+
+    unicos = names.dropna().unique()
+    return names.map(dict(zip(unicos, map(normalize_station_name, unicos))))
+
+
+class StationRegistry:
+    """
+    Registro de estaciones con códigos enteros estables (posición en LISTA_ESTACIONES)
+    y tabla de alias normalizados. Los nombres que no coinciden con ninguna
+    estación se reportan una vez por fuente.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.aliases = {}
+        self.lookup = {}
+        self.mismatches = {}
+        self.lock = Lock()
+
+    def load(self, names):
+        """
+        Reinicia el registro con los nombres canónicos; el código de cada estación es su posición
+        """
+
+        with self.lock:
+            self.names = list(names)
+            self.aliases = {normalize_station_name(name): code for code, name in enumerate(self.names)}
+            self.lookup = {}
+            self.mismatches = {}
+
+    def add_alias(self, alias, name):
+        """
+        Registra una escritura alternativa de una estación que la normalización no cubre
+        """
+
+        with self.lock:
+            self.aliases[normalize_station_name(alias)] = self.aliases[normalize_station_name(name)]
+            self.lookup = {}
+
+    def code(self, name):
+        """
+        Código entero de una estación (SIN_CODIGO si no está registrada)
+        """
+
+        code = self.lookup.get(name)
+        if code is None:
+            code = self.lookup[name] = self.aliases.get(normalize_station_name(name), SIN_CODIGO)
+        return code
+
+    def codes(self, names, source=None):
+        """
+        Arreglo de códigos para una secuencia de nombres. Con source, los nombres
+        sin estación se reportan como discrepancias de esa fuente.
+        """
+
+        codes = np.fromiter((self.code(name) for name in names), dtype=np.int32, count=len(names))
+        if source is not None and self.names:
+            sin_codigo = {name for name, code in zip(names, codes) if code == SIN_CODIGO and isinstance(name, str)}
+            if sin_codigo:
+                self.report_mismatch(source, sin_codigo)
+        return codes
+
+    def categorical(self, names, source=None):
+        """
+        Nombres como Categorical con las estaciones canónicas como categorías (código = código de estación)
+        """
+
+        return pd.Categorical.from_codes(self.codes(names, source), categories=self.names)
+
+    def align(self, df, source):
+        """
+        Reordena las filas de un Dataframe indexado por nombre para que la fila i sea
+        la estación de código i (índice categórico). Las estaciones que faltan quedan
+        en NaN y las filas sin estación se descartan y se reportan.
+        """
+
+        codes = self.codes(df.index, source)
+        aligned = df[codes != SIN_CODIGO].copy()
+        aligned.index = codes[codes != SIN_CODIGO]
+        # Con nombres repetidos gana la primera fila, como en .loc
+        aligned = aligned[~aligned.index.duplicated()].reindex(range(len(self.names)))
+
+        presentes = set(codes.tolist())
+        faltantes = [name for code, name in enumerate(self.names) if code not in presentes]
+        if faltantes:
+            self.report_mismatch(f"{source} (sin datos)", faltantes)
+
+        aligned.index = pd.CategoricalIndex(self.names, categories=self.names, name=df.index.name)
+        aligned.attrs = df.attrs
+        return aligned
+
+    def report_mismatch(self, source, names):
+        """
+        Guarda y muestra los nombres de una fuente que no coinciden con el registro
+        """
+
+        with self.lock:
+            vistos = self.mismatches.setdefault(source, set())
+            nuevos = sorted(set(names) - vistos)
+            vistos.update(nuevos)
+        if nuevos:
+            print(f"Estaciones sin coincidencia en {source}: {', '.join(nuevos)}")
+
+    def mismatch_report(self):
+        """
+        Nombres sin coincidencia por fuente
+        """
+
+        with self.lock:
+            return {source: sorted(names) for source, names in self.mismatches.items()}
+
+
+def take_by_code(values, codes):
+    """
+    values[codes] para valores alineados por código, con NaN donde el código es SIN_CODIGO
+    """
+
+    return np.append(np.asarray(values, dtype=np.float64), np.nan)[codes]
+
+
+station_registry = StationRegistry()
@@ -0,0 +1,409 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from io import BytesIO
+from cache import data_cache, negative_cache, listing_cache
+from data.single_flight import coalesce
+from data.availability_index import MAX_REINTENTOS_429, graph_get
+from metrics import file_type, record_download, stage
+import config as cf
+import pandas as pd
+import requests
+import hashlib
+import os
+import time
+
+BATCH_MAX_REQUESTS = 20
+DESCARGA_TIMEOUT = (10, 120)
+DESCARGA_REINTENTOS = 3
+PARSED_SUFFIX = ".pkl"
+
+
+class ArchivoNoEncontrado(Exception):
+    """
+    El archivo solicitado no existe en el almacenamiento (404)
+    """
+
+    def __init__(self, path):
+        super().__init__(f"No se encontró el archivo {path}")
+        self.path = path
+
+
+class StorageBackend(ABC):
+    """
+    Interfaz de almacenamiento de los archivos del proyecto. Las rutas son
+    relativas a la raíz (DIRECTORIO_PRINCIPAL/...), con el mismo esquema en
+    todos los backends. Un backend que no implementa list, stat y read falla al
+    instanciarse.
+    """
+
+    requires_token = False
+
+    def initialize(self):
+        """
+        Preparación al iniciar la aplicación (autenticación, índices)
+        """
+
+    @abstractmethod
+    def list(self, folder_path):
+        """
+        Nombres de los archivos de una carpeta (conjunto vacío si no existe)
+        """
+
+    @abstractmethod
+    def stat(self, path):
+        """
+        Diccionario con size, eTag y lastModified del archivo, o None si no existe
+        """
+
+    @abstractmethod
+    def read(self, path, descripcion):
+        """
+        Contenido y eTag de un archivo; ArchivoNoEncontrado si no existe
+        """
+
+    def read_bytes(self, path, descripcion="el archivo"):
+        return self.read(path, descripcion)[0]
+
+    def read_many(self, paths, descripcion):
+        """
+        Diccionario ruta -> (contenido, eTag), o ArchivoNoEncontrado si no existe
+        """
+
+        result = {}
+        for path in paths:
+            try:
+                result[path] = self.read(path, descripcion)
+            except ArchivoNoEncontrado as e:
+                result[path] = e
+        return result
+
+    def etag(self, path):
+        """
+        eTag conocido del archivo sin descargarlo (None si no se conoce)
+        """
+
+        entry = self.stat(path)
+        return entry["eTag"] if entry is not None else None
+
+    def read_parsed(self, path):
+        """
+        Versión ya parseada del archivo, si el backend la tiene al día (None si no)
+        """
+
+        return None
+
+
+class LocalBackend(StorageBackend):
+    """
+    Espejo local del árbol de OneDrive (mismo esquema DIRECTORIO_PRINCIPAL/...)
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def full_path(self, path):
+        return os.path.join(self.root, *path.split("/"))
+
+    def list(self, folder_path):
+        folder = self.full_path(folder_path)
+        if not os.path.isdir(folder):
+            return set()
+        return {entry.name for entry in os.scandir(folder) if entry.is_file()}
+
+    def stat(self, path):
+        try:
+            st = os.stat(self.full_path(path))
+        except FileNotFoundError:
+            return None
+        return {
+            "size": st.st_size,
+            "eTag": f"{st.st_mtime_ns:x}-{st.st_size:x}",
+            "lastModified": st.st_mtime,
+        }
+
+    def read(self, path, descripcion):
+        try:
+            with stage("descarga", file_type(path)), open(self.full_path(path), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            raise ArchivoNoEncontrado(path)
+        record_download(path, content)
+        return content, self.etag(path)
+
+    def parsed_path(self, path):
+        return self.full_path(path) + PARSED_SUFFIX
+
+    def read_parsed(self, path):
+        """
+        Lee el .pkl que deja sync_mirror --convertir junto al libro, si fue
+        generado a partir de la versión actual del libro
+        """
+
+        parsed_file = self.parsed_path(path)
+        if not os.path.exists(parsed_file):
+            return None
+        parsed = pd.read_pickle(parsed_file)
+        if parsed["version"] != self.etag(path):
+            return None
+        return parsed["data"]
+
+    def write_parsed(self, path, data):
+        """
+        Guarda la versión parseada del libro junto a él (escritura atómica)
+        """
+
+        parsed_file = self.parsed_path(path)
+        pd.to_pickle({"version": self.etag(path), "data": data}, parsed_file + ".tmp")
+        os.replace(parsed_file + ".tmp", parsed_file)
+
+
+class GraphBackend(StorageBackend):
+    """
+    OneDrive a través de Microsoft Graph, con índice de disponibilidad,
+    cache negativa y resolución de descargas por lotes
+    """
+
+    requires_token = True
+
+    def __init__(self, index=None):
+        if index is None:
+            from data.availability_index import availability_index
+            index = availability_index
+        self.index = index
+
+    def initialize(self):
+        self.index.load_or_build()
+
+    def headers(self):
+        return {"Authorization" : f"Bearer {data_cache["ACCESS_TOKEN"]}"}
+
+    def stat(self, path):
+        return self.index.get(path)
+
+    def etag(self, path):
+        """
+        eTag actual del archivo según el índice de disponibilidad (None si no está indexado)
+        """
+
+        entry = self.index.get(path)
+        return entry["eTag"] if entry is not None else None
+
+    def read(self, full_path, descripcion):
+        """
+        Descargar un archivo de OneDrive
+
+        Si la ruta está en el índice de disponibilidad se descarga directo por id;
+        si cae en una carpeta indexada y no figura, no existe. Un 404 se recuerda en
+        negative_cache por CACHE_NEGATIVO_TTL segundos y se reporta como
+        ArchivoNoEncontrado sin volver a consultar a Graph.
+        """
+
+        if negative_cache.get(full_path):
+            raise ArchivoNoEncontrado(full_path)
+
+        self.index.refresh_if_stale()
+        entry = self.index.get(full_path)
+        if entry is None and self.index.covers(full_path):
+            negative_cache.set(full_path, True)
+            raise ArchivoNoEncontrado(full_path)
+
+        if entry is not None:
+            url = f"{cf.GRAPH_DRIVE_URL}/items/{entry['id']}/content"
+        else:
+            encoded_path = quote(full_path, safe='/')
+            url = f"{cf.GRAPH_DRIVE_URL}/root:/{encoded_path}:/content"
+
+        with stage("descarga", file_type(full_path)):
+            response = graph_get(url, headers=self.headers())
+        if response.status_code == 404:
+            negative_cache.set(full_path, True)
+            raise ArchivoNoEncontrado(full_path)
+        if response.status_code != 200:
+            raise Exception(f"Fallo al descargar {descripcion}: {response.status_code}")
+        record_download(full_path, response.content)
+
+        version = self.etag(full_path) or response.headers.get("ETag")
+        return response.content, version or hashlib.blake2b(response.content, digest_size=8).hexdigest()
+
+    def read_many(self, full_paths, descripcion):
+        """
+        Descargar varios archivos: las URL de descarga se resuelven con $batch de Graph
+        (hasta 20 por llamada) y los contenidos se bajan en paralelo desde esas URL
+        preautenticadas. Una descarga que falla queda como excepción en su ruta, igual
+        que ArchivoNoEncontrado.
+        """
+
+        result = {}
+        pending = []
+        for full_path in full_paths:
+            if negative_cache.get(full_path):
+                result[full_path] = ArchivoNoEncontrado(full_path)
+            else:
+                pending.append(full_path)
+
+        self.index.refresh_if_stale()
+        for full_path in list(pending):
+            if self.index.get(full_path) is None and self.index.covers(full_path):
+                negative_cache.set(full_path, True)
+                result[full_path] = ArchivoNoEncontrado(full_path)
+                pending.remove(full_path)
+
+        resolved = {}
+        for start in range(0, len(pending), BATCH_MAX_REQUESTS):
+            resolved.update(self.resolve_download_urls(pending[start:start + BATCH_MAX_REQUESTS]))
+
+        for full_path in pending:
+            if resolved.get(full_path) is None:
+                negative_cache.set(full_path, True)
+                result[full_path] = ArchivoNoEncontrado(full_path)
+
+        def fetch(full_path):
+            download_url, version = resolved[full_path]
+            try:
+                content = self.download(download_url, full_path, descripcion)
+            except Exception as e:
+                # Un archivo que falla no descarta el resto del lote
+                return e
+            record_download(full_path, content)
+            return content, version or hashlib.blake2b(content, digest_size=8).hexdigest()
+
+        to_fetch = [full_path for full_path in pending if resolved.get(full_path) is not None]
+        with ThreadPoolExecutor(max_workers=cf.DESCARGAS_PARALELAS) as executor:
+            for full_path, downloaded in zip(to_fetch, executor.map(fetch, to_fetch)):
+                result[full_path] = downloaded
+
+        return result
+
+    def download(self, download_url, full_path, descripcion):
+        """
+        Bajar el contenido de una URL preautenticada con timeout, reintentando hasta
+        DESCARGA_REINTENTOS veces los errores de red, 429 y 5xx
+        """
+
+        for intento in range(1, DESCARGA_REINTENTOS + 1):
+            try:
+                with stage("descarga", file_type(full_path)):
+                    response = requests.get(download_url, stream=True, timeout=DESCARGA_TIMEOUT)
+                    if response.status_code == 200:
+                        content = BytesIO()
+                        for chunk in response.iter_content(chunk_size=1 << 16):
+                            content.write(chunk)
+                        return content.getvalue()
+            except requests.RequestException as e:
+                if intento == DESCARGA_REINTENTOS:
+                    raise Exception(f"Fallo al descargar {descripcion} ({full_path}): {e}") from e
+                time.sleep(intento)
+                continue
+
+            if (response.status_code != 429 and response.status_code < 500) or intento == DESCARGA_REINTENTOS:
+                raise Exception(f"Fallo al descargar {descripcion} ({full_path}): {response.status_code}")
+            time.sleep(int(response.headers.get("Retry-After", intento)))
+
+    def resolve_download_urls(self, full_paths):
+        """
+        Resolver @microsoft.graph.downloadUrl y eTag de hasta 20 archivos en una llamada $batch
+
+        Returns:
+            Diccionario ruta -> (url de descarga, eTag), o None si el archivo no existe
+        """
+
+        drive_path = cf.GRAPH_DRIVE_URL[len(cf.GRAPH_URL):]
+        requests_batch = []
+        for i, full_path in enumerate(full_paths):
+            entry = self.index.get(full_path)
+            if entry is not None:
+                item_url = f"{drive_path}/items/{entry['id']}"
+            else:
+                item_url = f"{drive_path}/root:/{quote(full_path, safe='/')}:"
+            requests_batch.append({
+                "id": str(i),
+                "method": "GET",
+                "url": f"{item_url}?$select=id,eTag,@microsoft.graph.downloadUrl"
+            })
+
+        result = {}
+        intentos = 0
+        while requests_batch:
+            # Los 429 del $batch y de sus subsolicitudes comparten el tope de graph_get
+            intentos += 1
+            if intentos > MAX_REINTENTOS_429:
+                raise Exception(f"Fallo al resolver descargas por lotes: {len(requests_batch)} solicitudes limitadas (429)")
+
+            response = requests.post(f"{cf.GRAPH_URL}/$batch", headers=self.headers(), json={"requests": requests_batch})
+            if response.status_code == 429:
+                time.sleep(int(response.headers.get("Retry-After", 1)))
+                continue
+            if response.status_code != 200:
+                raise Exception(f"Fallo al resolver descargas por lotes: {response.status_code}")
+
+            throttled = []
+            retry_after = 0
+            for item in response.json()["responses"]:
+                full_path = full_paths[int(item["id"])]
+                if item["status"] == 200:
+                    result[full_path] = (item["body"]["@microsoft.graph.downloadUrl"], item["body"].get("eTag"))
+                elif item["status"] == 404:
+                    result[full_path] = None
+                elif item["status"] == 429:
+                    throttled.append(item["id"])
+                    retry_after = max(retry_after, int(item.get("headers", {}).get("Retry-After", 1)))
+                else:
+                    raise Exception(f"Fallo al resolver {full_path}: {item['status']}")
+
+            requests_batch = [request for request in requests_batch if request["id"] in throttled]
+            if requests_batch:
+                time.sleep(retry_after)
+
+        return result
+
+    def list(self, folder_path):
+        """
+        Las carpetas indexadas se responden desde el índice de disponibilidad. Un
+        archivo que aparece en el listado deja de estar en negative_cache.
+        """
+
+        if self.index.covers(f"{folder_path}/"):
+            self.index.refresh_if_stale()
+            return self.index.list_names(folder_path)
+        return self.list_remote(folder_path)
+
+    @coalesce
+    def list_remote(self, folder_path):
+        names = listing_cache.get(folder_path)
+        if names is not None:
+            return names
+
+        encoded_path = quote(folder_path, safe='/')
+        url = f"{cf.GRAPH_DRIVE_URL}/root:/{encoded_path}:/children?$select=name&$top=999"
+
+        names = set()
+        while url:
+            response = graph_get(url, headers=self.headers())
+            if response.status_code == 404:
+                break
+            if response.status_code != 200:
+                raise Exception(f"Fallo al listar {folder_path}: {response.status_code}")
+            body = response.json()
+            names.update(item["name"] for item in body.get("value", []))
+            url = body.get("@odata.nextLink")
+
+        for name in names:
+            negative_cache.discard(f"{folder_path}/{name}")
+        listing_cache.set(folder_path, names)
+        return names
+
+
+def create_backend(name):
+    """
+    Backend de almacenamiento según config.ALMACENAMIENTO ("graph" o "local")
+    """
+
+    if name == "graph":
+        return GraphBackend()
+    if name == "local":
+        return LocalBackend(cf.DIRECTORIO_ESPEJO)
+    raise ValueError(f"Backend de almacenamiento desconocido: {name}")
+
+
+storage = create_backend(cf.ALMACENAMIENTO)
@@ -0,0 +1,254 @@
+from datetime import date
+from data.archive import DIAS_ANIO, FUENTES, VARIABLES, variable_key
+from data.stations import normalize_station_name
+import numpy as np
+import pandas as pd
+
+# Un bit por regla: la bandera de una celda es la unión de las reglas que no cumple
+BANDERA_TEXTO = 1
+BANDERA_NEGATIVO = 2
+BANDERA_TMIN_TMAX = 4
+BANDERA_OCTAS = 8
+BANDERA_RANGO = 16
+REGLAS = {
+    BANDERA_TEXTO: "texto en celda numérica",
+    BANDERA_NEGATIVO: "precipitación negativa",
+    BANDERA_TMIN_TMAX: "TMIN mayor que TMAX",
+    BANDERA_OCTAS: "nubosidad fuera de 0-8 octas",
+    BANDERA_RANGO: "temperatura fuera de rango",
+}
+LIMITES_TEMPERATURA = (-35.0, 40.0)
+
+# Columnas de la planilla que se validan como números (el resto es fecha o texto)
+COLUMNAS_TEXTO_PLANILLA = ["FECHA", "DIRECCION VIENTO DIARIA", "FORMA DE NUBES BAJAS DIARIAS",
+                           "FORMA DE NUBES MEDIAS DIARIAS", "FORMA DE NUBES ALTAS DIARIAS"]
+COLUMNAS_OCTAS_PLANILLA = ["CANTIDAD DE NUBES BAJAS DIARIAS", "CANTIDAD DE NUBES MEDIAS DIARIAS",
+                           "CANTIDAD DE NUBES ALTAS DIARIAS"]
+COLUMNAS_TEMPERATURA_PLANILLA = ["TEMPERATURA MAXIMA DIARIA", "TEMPERATURA MINIMA DIARIA",
+                                 "TEMPERATURA DEL BULBO SECO DIARIO", "TEMPERATURA BULBO HUMEDO DIARIA"]
+
+
+def read_cells(df):
+    """
+    Valores float64 (filas, columnas) del Dataframe recién leído, NaN donde no hay
+    número, y las celdas con texto que no se puede leer como número. Se convierte
+    todo el bloque de una vez, antes de tipar las columnas (después el texto ya no
+    se distingue de un vacío).
+    """
+
+    celdas = pd.Series(df.to_numpy(dtype=object).ravel())
+    valores = pd.to_numeric(celdas, errors='coerce')
+    texto = (celdas.notna() & valores.isna()).to_numpy()
+    # Solo las pocas celdas candidatas se revisan una a una: los espacios en blanco son vacíos
+    for i in np.flatnonzero(texto):
+        texto[i] = str(celdas.iat[i]).strip() != ""
+    return valores.to_numpy(dtype=np.float64, na_value=np.nan).reshape(df.shape), texto.reshape(df.shape)
+
+
+def flag_values(valores, texto=None):
+    """
+    Banderas uint8 de un arreglo (..., variable) con TMAX, TMIN y PP en el orden
+    de VARIABLES: TMIN > TMAX (se marcan las dos), PP negativa y temperaturas
+    fuera de LIMITES_TEMPERATURA, más el texto de las celdas si se conoce
+    """
+
+    valores = np.asarray(valores, dtype=np.float32)
+    banderas = np.zeros(valores.shape, dtype=np.uint8)
+    if texto is not None:
+        banderas[texto] |= BANDERA_TEXTO
+
+    tmax, tmin, pp = (valores[..., VARIABLES.index(variable)] for variable in ("TMAX", "TMIN", "PP"))
+    temperaturas = [VARIABLES.index("TMAX"), VARIABLES.index("TMIN")]
+    with np.errstate(invalid='ignore'):
+        banderas[..., temperaturas] |= np.where((tmin > tmax)[..., np.newaxis], BANDERA_TMIN_TMAX, 0).astype(np.uint8)
+        banderas[..., VARIABLES.index("PP")] |= np.where(pp < 0, BANDERA_NEGATIVO, 0).astype(np.uint8)
+        fuera = (valores[..., temperaturas] < LIMITES_TEMPERATURA[0]) | (valores[..., temperaturas] > LIMITES_TEMPERATURA[1])
+        banderas[..., temperaturas] |= np.where(fuera, BANDERA_RANGO, 0).astype(np.uint8)
+    return banderas
+
+
+def daily_flags(df):
+    """
+    Banderas (filas, columnas) de las columnas TMAX, TMIN y PP del registro diario recién leído
+    """
+
+    return flag_values(*read_cells(df[VARIABLES]))
+
+
+def monthly_flags(df):
+    """
+    Banderas (días, columnas) del registro mensual recién leído (columnas estación,
+    variable); TMIN > TMAX compara las columnas de la misma estación
+    """
+
+    valores, texto = read_cells(df)
+    banderas = np.where(texto, BANDERA_TEXTO, 0).astype(np.uint8)
+
+    columnas = {}
+    for posicion, (estacion, variable) in enumerate(df.columns):
+        variable = variable_key(variable)
+        if isinstance(estacion, str) and variable is not None:
+            columnas.setdefault(normalize_station_name(estacion), {}).setdefault(variable, posicion)
+    completas = [vars_ for vars_ in columnas.values() if len(vars_) == len(VARIABLES)]
+    if completas:
+        posiciones = np.array([[vars_[variable] for variable in VARIABLES] for vars_ in completas])
+        banderas[:, posiciones] = flag_values(valores[:, posiciones], texto[:, posiciones])
+    return banderas
+
+
+def planilla_flags(df):
+    """
+    Banderas (filas, columnas) de una planilla recién leída (3 filas por día: 7h,
+    13h y 19h): texto en columnas numéricas, octas fuera de 0-8, precipitación
+    negativa, temperaturas fuera de rango y TMIN de las 7h mayor que TMAX de las 19h
+    """
+
+    numericas = [posicion for posicion, columna in enumerate(df.columns) if columna not in COLUMNAS_TEXTO_PLANILLA]
+    valores, texto = read_cells(df.iloc[:, numericas])
+    banderas = np.zeros(df.shape, dtype=np.uint8)
+    banderas[:, numericas] = np.where(texto, BANDERA_TEXTO, 0)
+
+    def column(nombre):
+        return valores[:, numericas.index(df.columns.get_loc(nombre))]
+
+    with np.errstate(invalid='ignore'):
+        for nombre in COLUMNAS_OCTAS_PLANILLA:
+            if nombre in df:
+                octas = column(nombre)
+                banderas[:, df.columns.get_loc(nombre)] |= np.where((octas < 0) | (octas > 8), BANDERA_OCTAS, 0).astype(np.uint8)
+        if "PRECIPITACION" in df:
+            banderas[:, df.columns.get_loc("PRECIPITACION")] |= np.where(column("PRECIPITACION") < 0, BANDERA_NEGATIVO, 0).astype(np.uint8)
+        for nombre in COLUMNAS_TEMPERATURA_PLANILLA:
+            if nombre in df:
+                temperatura = column(nombre)
+                fuera = (temperatura < LIMITES_TEMPERATURA[0]) | (temperatura > LIMITES_TEMPERATURA[1])
+                banderas[:, df.columns.get_loc(nombre)] |= np.where(fuera, BANDERA_RANGO, 0).astype(np.uint8)
+
+        if "TEMPERATURA MAXIMA DIARIA" in df and "TEMPERATURA MINIMA DIARIA" in df:
+            filas = len(df) // 3 * 3
+            tmax = column("TEMPERATURA MAXIMA DIARIA")[:filas].reshape(-1, 3)[:, 2]
+            tmin = column("TEMPERATURA MINIMA DIARIA")[:filas].reshape(-1, 3)[:, 0]
+            dias = np.flatnonzero(tmin > tmax) * 3
+            banderas[dias + 2, df.columns.get_loc("TEMPERATURA MAXIMA DIARIA")] |= BANDERA_TMIN_TMAX
+            banderas[dias, df.columns.get_loc("TEMPERATURA MINIMA DIARIA")] |= BANDERA_TMIN_TMAX
+    return banderas
+
+
+def attach_flags(df, banderas):
+    """
+    Guarda las banderas (filas, columnas) en df.attrs como (filas, columnas, bytes):
+    viajan con el Dataframe a las caches y al .pkl de sync_mirror, y a diferencia
+    de un arreglo se pueden comparar cuando pandas concatena Dataframes
+    """
+
+    banderas = np.ascontiguousarray(banderas, dtype=np.uint8)
+    df.attrs["banderas"] = (banderas.shape[0], banderas.shape[1], banderas.tobytes())
+    return df
+
+
+def frame_flags(df):
+    """
+    Banderas (filas, columnas) de un Dataframe como arreglo de solo lectura, sin
+    copia; None si no tiene o si sus filas ya no corresponden (p. ej. tras filtrar).
+    Las columnas agregadas después de la carga quedan fuera del arreglo.
+    """
+
+    banderas = df.attrs.get("banderas")
+    if banderas is None or banderas[0] != len(df) or banderas[1] > df.shape[1]:
+        return None
+    return np.frombuffer(banderas[2], dtype=np.uint8).reshape(banderas[0], banderas[1])
+
+
+def mask_flagged(df):
+    """
+    Copia del Dataframe con las celdas marcadas en NaN (las columnas con texto
+    quedan numéricas). Se aplica una vez al guardar el Dataframe en cache, así las
+    vistas no pagan nada por render; las banderas se conservan en attrs.
+    """
+
+    banderas = frame_flags(df)
+    if banderas is None or not banderas.any():
+        return df
+
+    df = df.copy()
+    for posicion in np.flatnonzero(banderas.any(axis=0)):
+        values = df.iloc[:, posicion]
+        dtype = values.dtype if pd.api.types.is_numeric_dtype(values.dtype) else np.float32
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        values = pd.to_numeric(values, errors='coerce').astype(dtype)
+        df.isetitem(posicion, values.where(banderas[:, posicion] == 0))
+    return df
+
+
+def flag_counts(banderas):
+    """
+    Celdas marcadas por regla ({nombre: conteo}, solo reglas con celdas)
+    """
+
+    banderas = np.asarray(banderas)
+    conteos = {nombre: int(np.count_nonzero(banderas & bit)) for bit, nombre in REGLAS.items()}
+    return {nombre: conteo for nombre, conteo in conteos.items() if conteo}
+
+
+def flag_rows(extracted):
+    """
+    Filas del reporte (fuente, estación, año, mes y conteo por regla) de los
+    archivos extraídos en un lote de la ingesta, solo estaciones con celdas marcadas
+    """
+
+    filas = []
+    for item in extracted:
+        fecha = date.fromisoformat(item["fecha"])
+        banderas = item["banderas"]
+        for i in np.flatnonzero(banderas.any(axis=(0, 2))):
+            filas.append({"fuente": item["fuente"], "estacion": item["nombres"][i], "anio": fecha.year,
+                          "mes": fecha.month, **flag_counts(banderas[:, i])})
+    return filas
+
+
+def archive_report(archive, year, month=None, fuentes=FUENTES):
+    """
+    Celdas marcadas por estación y mes desde los mapas de banderas del archivo
+    histórico; cuenta cada regla con un bincount sobre (mes, estación) del año
+
+    Returns:
+        Dataframe (fuente, estación, año, mes) x regla, solo filas con celdas marcadas
+    """
+
+    archive.refresh()
+    dias = pd.date_range(date(year, 1, 1), date(year, 12, 31), freq='D')
+    meses = np.full(DIAS_ANIO, -1, dtype=np.intp)
+    meses[:len(dias)] = dias.month - 1
+
+    filas = []
+    for fuente in fuentes:
+        mapa = archive.year_map(fuente, year, capa="banderas")
+        if mapa is None:
+            continue
+        n = len(archive.meta["estaciones"])
+        dia, estacion = np.nonzero(mapa[:, :n].any(axis=2) & (meses >= 0)[:, np.newaxis])
+        if month is not None:
+            en_mes = meses[dia] == month - 1
+            dia, estacion = dia[en_mes], estacion[en_mes]
+        celdas = np.asarray(mapa[dia, estacion])
+        clave = meses[dia] * n + estacion
+        conteos = {nombre: np.bincount(clave, weights=((celdas & bit) != 0).sum(axis=1), minlength=12 * n)
+                   for bit, nombre in REGLAS.items()}
+        for posicion in np.unique(clave):
+            filas.append({"fuente": fuente, "estacion": archive.meta["estaciones"][posicion % n], "anio": year,
+                          "mes": posicion // n + 1,
+                          **{nombre: int(valores[posicion]) for nombre, valores in conteos.items() if valores[posicion]}})
+    return report_frame(filas)
+
+
+def report_frame(filas):
+    """
+    Reporte por (fuente, estación, año, mes) con una columna por regla; suma las
+    filas del mismo mes (p. ej. los registros diarios de cada día)
+    """
+
+    claves, reglas = ["fuente", "estacion", "anio", "mes"], list(REGLAS.values())
+    df = pd.DataFrame(filas, columns=claves + reglas)
+    df[reglas] = df[reglas].fillna(0).astype(int)
+    return df.groupby(claves, as_index=False)[reglas].sum()
@@ -1,12 +1,27 @@
 import dash_mantine_components as dmc
 from dash import Dash, Input, Output, callback, html
 from dash_iconify import DashIconify
-
-from cache import init_cache
-from config import CLIENT_ID
+from flask import jsonify, request
+import mmap
+
+try:
+    import resource
+except ImportError:
+    # Windows no tiene el módulo resource
+    resource = None
+
+from cache import cache_stats, init_cache, monthly_memory
+from data.archive import historical_archive
+from data.stations import station_registry
+from data.validation import archive_report
+from metrics import init_metrics
+from profiling import init_profiling
+from config import CLIENT_ID, ALMACENAMIENTO, GRAPH_ACCESS_TOKEN, DASH_DEBUG, DASH_PUERTO
 from ui.control_diario import registro_diario_layout
 from ui.control_semanal import control_semanal_layout
+from ui.eventos import eventos_layout
 from ui.generacion_planilla import generacion_planilla_layout
+from ui.mapa_anomalias import anomalias_layout
 
 
 def create_navbar():
@@ -38,6 +53,14 @@ def create_navbar():
                         DashIconify(icon="mdi:calendar-range", width=18),
                         dmc.Text("Análisis Semanal")
                     ])},
+                    {"value": "anomalias", "label": dmc.Group(gap="xs", children=[
+                        DashIconify(icon="mdi:grid", width=18),
+                        dmc.Text("Anomalías")
+                    ])},
+                    {"value": "eventos", "label": dmc.Group(gap="xs", children=[
+                        DashIconify(icon="mdi:magnify", width=18),
+                        dmc.Text("Eventos")
+                    ])},
                     {"value": "planilla", "label": dmc.Group(gap="xs", children=[
                         DashIconify(icon="mdi:file-document-edit", width=18),
                         dmc.Text("Generar Planilla")
@@ -56,7 +79,8 @@ def create_multi_page_app():
     Crea la aplicación Dash multi-página
     """
 
-    app = Dash(__name__, suppress_callback_exceptions=True)
+    # compress=True comprime con gzip las respuestas de los callbacks (flask-compress)
+    app = Dash(__name__, suppress_callback_exceptions=True, compress=True)
 
     app.layout = dmc.MantineProvider(
         theme={"fontFamily": "Inter, sans-serif", "primaryColor": "blue", "defaultRadius": "md"},
@@ -68,8 +92,43 @@ def create_multi_page_app():
         ]
     )
 
+    # Métricas Prometheus en /metrics y tiempos por callback
+    init_metrics(app.server)
+    # Perfiles cProfile por solicitud (PERFILADO en config.py)
+    init_profiling(app.server)
+
+    # Estadísticas de caches y memoria del proceso (las usa src/tools/load_test.py)
+    @app.server.route("/_estadisticas")
+    def estadisticas():
+        return jsonify({"caches": cache_stats(), "rss_bytes": get_rss_bytes(), "memoria_mensual": monthly_memory(),
+                        "estaciones_sin_coincidencia": station_registry.mismatch_report()})
+
+    # Celdas marcadas por la validación por estación y mes, desde el archivo histórico (?anio=2024&mes=3)
+    @app.server.route("/_validacion")
+    def validacion():
+        anio = request.args.get("anio", type=int)
+        if anio is None:
+            return jsonify({"error": "Falta el parámetro anio"}), 400
+        reporte = archive_report(historical_archive, anio, request.args.get("mes", type=int))
+        return jsonify(reporte.to_dict("records"))
+
     return app
 
+
+def get_rss_bytes():
+    """
+    Memoria residente actual del proceso (máxima histórica si no hay /proc, None
+    si tampoco está el módulo resource)
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except OSError:
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
 # Callback para cambiar entre páginas
 @callback(
     Output("page-content", "children"),
@@ -80,6 +139,10 @@ def display_page(page):
         return registro_diario_layout()
     elif page == "semanal":
         return control_semanal_layout()
+    elif page == "anomalias":
+        return anomalias_layout()
+    elif page == "eventos":
+        return eventos_layout()
     elif page == "planilla":
         return generacion_planilla_layout()
     return html.Div("Página no encontrada")
@@ -91,7 +154,7 @@ def main():
 
     print("=== Dashboard de Datos Meteorológicos Puno ===\n")
 
-    if not CLIENT_ID:
+    if ALMACENAMIENTO == "graph" and not CLIENT_ID and not GRAPH_ACCESS_TOKEN:
         raise ValueError("CLIENT_ID no encontrado en archivo .env")
 
     # 1. Inicializar cache (autenticación + datos normales)
@@ -105,13 +168,15 @@ def main():
     print("    Aplicación creada\n")
 
     # 3. Ejecutando el dashboard
-    print("3. Abriendo dashboard en http://127.0.0.1:8050")
+    print(f"3. Abriendo dashboard en http://127.0.0.1:{DASH_PUERTO}")
     print("   Análisis Diario: Vista por zonas de Puno")
     print("   Análisis Semanal: Comparación entre estaciones")
+    print("   Anomalías: Estaciones x días de un mes o estación del año, por zona")
+    print("   Eventos: Umbrales, extremos y rachas en el archivo histórico")
     print("   Generar Planilla: Generación de planilla climatológica")
     print("   Presiona Ctrl+C para detener el servidor\n")
 
-    app.run(debug=True, host='127.0.0.1', port=8050)
+    app.run(debug=DASH_DEBUG, host='127.0.0.1', port=DASH_PUERTO)
 
 
 if __name__ == "__main__":
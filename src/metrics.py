@@ -0,0 +1,253 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from flask import Response, g, request
+import config as cf
+import pandas as pd
+import time
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+class Counter:
+    """
+    Contador con etiquetas en formato Prometheus
+    """
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Histograma acumulativo con etiquetas: por cada combinación guarda los conteos
+    por bucket, la suma y el total (una búsqueda binaria por observación)
+    """
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS_SEGUNDOS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self.lock = Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(label, "") for label in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                acumulado = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    acumulado += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (le,))} {acumulado}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+def format_labels(names, values):
+    """
+    Etiquetas en el formato {nombre="valor",...}
+    """
+
+    if not names:
+        return ""
+    pares = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return "{" + pares + "}"
+
+
+callback_seconds = Histogram("dashboard_callback_seconds", "Duración de los callbacks de Dash (incluye serialización)",
+                             ("callback",))
+callback_response_bytes = Counter("dashboard_callback_response_bytes_total", "Bytes de respuesta de los callbacks",
+                                  ("callback",))
+stage_seconds = Histogram("dashboard_stage_seconds", "Duración por etapa: descarga, parseo, transformacion, figura, serializacion",
+                          ("etapa", "tipo"))
+download_bytes = Counter("dashboard_download_bytes_total", "Bytes leídos del almacenamiento por tipo de archivo",
+                         ("tipo",))
+token_refresh = Counter("dashboard_token_refresh_total", "Obtenciones del token de acceso por origen", ("origen",))
+
+
+def stage(etapa, tipo=""):
+    """
+    Context manager que mide una etapa (dashboard_stage_seconds)
+    """
+
+    return stage_seconds.time(etapa=etapa, tipo=tipo)
+
+
+def timed(etapa, tipo=""):
+    """
+    Decorador que mide cada llamada a la función como una etapa
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage_seconds.time(etapa=etapa, tipo=tipo):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def file_type(path):
+    """
+    Tipo de archivo según la carpeta: diario, mensual, planilla, normales, metadata u otro
+    """
+
+    parts = path.split("/")
+    folder = parts[1] if len(parts) > 1 else ""
+    return {
+        cf.DIRECTORIO_REGISTRO_DIARIO: "diario",
+        cf.DIRECTORIO_REGISTRO_SEMANAL: "mensual",
+        cf.DIRECTORIO_PLANILLA: "planilla",
+        cf.DIRECTORIO_REGISTRO_NORMAL: "normales",
+        cf.DIRECTORIO_METADATA: "metadata",
+    }.get(folder, "otro")
+
+
+def record_download(path, content):
+    """
+    Suma los bytes leídos de un archivo a dashboard_download_bytes_total
+    """
+
+    download_bytes.inc(len(content), tipo=file_type(path))
+
+
+def approx_size(obj):
+    """
+    Tamaño aproximado en bytes de un valor cacheado (Dataframes, textos, tuplas)
+    """
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if isinstance(obj, (tuple, list)):
+        return sum(approx_size(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(approx_size(item) for item in obj.values())
+    return 0
+
+
+def render_cache_metrics():
+    """
+    Contadores y tamaño de cada área de cache, calculados al momento de la consulta
+    """
+
+    from cache import cache_stats, data_cache, figure_cache, listing_cache, monthly_memory, weights_cache, histogram_cache
+
+    stats = cache_stats()
+    tamanos = {
+        "figure_cache": approx_size(list(figure_cache.entries.values())),
+        "weights_cache": sum(pesos.nbytes for pesos in list(weights_cache.entries.values())),
+        "histogram_cache": sum(sum(valores.nbytes for valores in histogramas.values())
+                               for histogramas in list(histogram_cache.entries.values())),
+        "negative_cache": 0,
+        "listing_cache": approx_size([value for _, value in listing_cache.entries.values()]),
+        "data_cache": approx_size(list(data_cache.values())),
+    }
+
+    lines = []
+    for metric, campo, tipo in (("dashboard_cache_hits_total", "hits", "counter"),
+                                ("dashboard_cache_misses_total", "misses", "counter"),
+                                ("dashboard_cache_evictions_total", "evictions", "counter"),
+                                ("dashboard_cache_entries", "entries", "gauge")):
+        lines += [f"# HELP {metric} {campo} por área de cache", f"# TYPE {metric} {tipo}"]
+        for area, valores in stats.items():
+            if campo in valores:
+                lines.append(f'{metric}{{cache="{area}"}} {valores[campo]}')
+
+    lines += ["# HELP dashboard_cache_bytes Tamaño aproximado de cada área de cache",
+              "# TYPE dashboard_cache_bytes gauge"]
+    lines += [f'dashboard_cache_bytes{{cache="{area}"}} {size}' for area, size in tamanos.items()]
+
+    lines += ["# HELP dashboard_cache_month_bytes Tamaño de cada mes del registro mensual en cache",
+              "# TYPE dashboard_cache_month_bytes gauge"]
+    lines += [f'dashboard_cache_month_bytes{{mes="{mes}"}} {size}' for mes, size in sorted(monthly_memory().items())]
+
+    lines += ["# HELP dashboard_single_flight_total Descargas ejecutadas y agrupadas",
+              "# TYPE dashboard_single_flight_total counter"]
+    lines += [f'dashboard_single_flight_total{{resultado="{k}"}} {v}' for k, v in stats["loader_flight"].items()]
+    return lines
+
+
+def render():
+    """
+    Texto completo de /metrics en el formato de exposición de Prometheus
+    """
+
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    lines += render_cache_metrics()
+    return "\n".join(lines) + "\n"
+
+
+def init_metrics(server):
+    """
+    Registra la ruta /metrics y la medición de los callbacks en el servidor Flask de Dash
+    """
+
+    @server.before_request
+    def start_timer():
+        if request.path.endswith("/_dash-update-component"):
+            g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def record_callback(response):
+        inicio = g.pop("metrics_start", None)
+        if inicio is not None:
+            body = request.get_json(silent=True) or {}
+            nombre = str(body.get("output", "")).strip(".").split(".")[0] or "desconocido"
+            callback_seconds.observe(time.perf_counter() - inicio, callback=nombre)
+            if response.content_length is not None:
+                callback_response_bytes.inc(response.content_length, callback=nombre)
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4")
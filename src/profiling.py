@@ -0,0 +1,176 @@
+from functools import wraps
+from io import StringIO
+from threading import Lock, local
+from flask import g, request
+import config as cf
+import cProfile
+import os
+import pstats
+import re
+import time
+
+# Bibliotecas cuyo tiempo propio se resume aparte en cada perfil
+BIBLIOTECAS = ("openpyxl", "plotly", "pandas", "numpy", "msal", "requests")
+
+CABECERA_PERFILADO = "X-Perfilar"
+
+_activo = local()
+# Python 3.12 admite un solo perfilador activo por proceso: quien no obtiene el candado se ejecuta sin perfil
+_perfilador = Lock()
+
+
+def profiling_enabled():
+    """
+    Perfilado activo para todas las solicitudes (PERFILADO=1)
+    """
+
+    return cf.PERFILADO == "1"
+
+
+def profiling_allowed():
+    """
+    Perfilado disponible: siempre (PERFILADO=1) o por solicitud con la cabecera X-Perfilar (PERFILADO=cabecera)
+    """
+
+    return cf.PERFILADO in ("1", "cabecera")
+
+
+def start_profiler():
+    """
+    Crea y activa un perfil para el hilo actual, o devuelve None si el hilo ya
+    está perfilando o si otro hilo (u otra herramienta) tiene el perfilador
+    """
+
+    if getattr(_activo, "perfil", None) is not None or not _perfilador.acquire(blocking=False):
+        return None
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError:
+        # Otro perfilador fuera de este módulo (p. ej. un depurador) ya está activo
+        _perfilador.release()
+        return None
+    _activo.perfil = perfil
+    return perfil
+
+
+def stop_profiler(perfil):
+    """
+    Desactiva el perfil del hilo actual y libera el perfilador del proceso
+    """
+
+    try:
+        perfil.disable()
+    finally:
+        _activo.perfil = None
+        _perfilador.release()
+
+
+def run_profiled(nombre, fn, *args, **kwargs):
+    """
+    Ejecuta fn bajo cProfile, guarda el perfil en DIRECTORIO_PERFILES e imprime el resumen.
+    Si el hilo ya está perfilando (p. ej. un cargador dentro de un callback) o si
+    otro hilo está perfilando, solo ejecuta fn.
+    """
+
+    perfil = start_profiler()
+    if perfil is None:
+        return fn(*args, **kwargs)
+
+    inicio = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        stop_profiler(perfil)
+        save_profile(nombre, perfil, time.perf_counter() - inicio)
+
+
+def profiled(nombre):
+    """
+    Decorador para perfilar una función con PERFILADO=1. Con el perfilado desactivado
+    devuelve la función sin envolver, así que no agrega costo.
+    """
+
+    def decorator(fn):
+        if not profiling_enabled():
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            etiqueta = "_".join([nombre] + [str(arg) for arg in args])
+            return run_profiled(etiqueta, fn, *args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def save_profile(nombre, perfil, duracion):
+    """
+    Guarda el perfil (.prof, legible con pstats o snakeviz) e imprime las funciones
+    con más tiempo acumulado y el tiempo propio dentro de cada biblioteca
+    """
+
+    os.makedirs(cf.DIRECTORIO_PERFILES, exist_ok=True)
+    archivo = re.sub(r"[^\w.-]+", "_", f"{time.strftime('%Y%m%d-%H%M%S')}_{nombre}")[:150]
+    ruta = os.path.join(cf.DIRECTORIO_PERFILES, f"{archivo}_{os.getpid()}_{time.perf_counter_ns() % 10**6}.prof")
+    perfil.dump_stats(ruta)
+
+    print(f"[perfil] {nombre}: {duracion * 1000:.1f} ms -> {ruta}")
+    print(f"[perfil]   {library_summary(perfil)}")
+    salida = StringIO()
+    pstats.Stats(perfil, stream=salida).sort_stats("cumulative").print_stats(cf.PERFILADO_TOP)
+    # Solo la tabla de funciones, sin el encabezado de pstats
+    tabla = salida.getvalue().split("   ncalls", 1)
+    if len(tabla) == 2:
+        print("   ncalls" + tabla[1].rstrip())
+
+
+def library_summary(perfil):
+    """
+    Tiempo propio (tottime) agrupado por biblioteca según la ruta de cada función
+    """
+
+    tiempos = dict.fromkeys(BIBLIOTECAS, 0.0)
+    for (archivo, _, _), (_, _, tottime, _, _) in pstats.Stats(perfil).stats.items():
+        for biblioteca in BIBLIOTECAS:
+            if f"{os.sep}{biblioteca}{os.sep}" in archivo:
+                tiempos[biblioteca] += tottime
+                break
+    return ", ".join(f"{biblioteca} {segundos * 1000:.1f} ms" for biblioteca, segundos in tiempos.items() if segundos)
+
+
+def init_profiling(server):
+    """
+    Perfila las solicitudes de callbacks en el servidor Flask de Dash según PERFILADO.
+    Con PERFILADO=0 (por defecto) no registra nada.
+    """
+
+    if not profiling_allowed():
+        return
+
+    callbacks = {nombre.strip() for nombre in cf.PERFILADO_CALLBACKS.split(",") if nombre.strip()}
+
+    @server.before_request
+    def start_profile():
+        if not request.path.endswith("/_dash-update-component"):
+            return
+        if not profiling_enabled() and request.headers.get(CABECERA_PERFILADO) != "1":
+            return
+        body = request.get_json(silent=True) or {}
+        nombre = str(body.get("output", "")).strip(".").split(".")[0] or "desconocido"
+        if callbacks and nombre not in callbacks:
+            return
+        perfil = start_profiler()
+        if perfil is None:
+            return
+        g.perfil = perfil
+        g.perfil_nombre = nombre
+        g.perfil_inicio = time.perf_counter()
+
+    @server.teardown_request
+    def stop_profile(exception=None):
+        perfil = g.pop("perfil", None)
+        if perfil is None:
+            return
+        stop_profiler(perfil)
+        save_profile(g.pop("perfil_nombre"), perfil, time.perf_counter() - g.pop("perfil_inicio"))
@@ -0,0 +1,193 @@
+"""
+Sincroniza el árbol DIRECTORIO_PRINCIPAL de OneDrive a un directorio local
+(espejo para ALMACENAMIENTO=local).
+
+- Descargas en paralelo con un pool acotado (--workers)
+- Reanudable: cada archivo se escribe en .tmp y se renombra al terminar, y el
+  estado (eTag sincronizado por ruta) se guarda a medida que avanza
+- Incremental con delta de Graph: las siguientes ejecuciones solo bajan lo que cambió
+- --convertir deja junto a cada libro su versión parseada (.pkl) que el
+  dashboard carga directamente
+
+Pensado para ejecutarse desde cron, por ejemplo cada 10 minutos:
+    */10 * * * * cd /ruta/al/proyecto && python src/sync_mirror.py --convertir
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import argparse
+import fcntl
+import json
+import os
+import sys
+import time
+
+from cache import data_cache
+from config import CLIENT_ID, GRAPH_ACCESS_TOKEN
+from data.auth_module import get_access_token
+from data.availability_index import AvailabilityIndex
+from data.file_managment import parser_for_path
+from data.storage import (BATCH_MAX_REQUESTS, DESCARGA_REINTENTOS, DESCARGA_TIMEOUT, PARSED_SUFFIX, GraphBackend,
+                          LocalBackend)
+import config as cf
+import requests
+
+ARCHIVO_ESTADO = ".sync_estado.json"
+ARCHIVO_INDICE = ".sync_indice.json"
+ARCHIVO_BLOQUEO = ".sync.lock"
+GUARDAR_CADA = 50
+
+
+def load_state(destino):
+    state_file = os.path.join(destino, ARCHIVO_ESTADO)
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(destino, synced):
+    state_file = os.path.join(destino, ARCHIVO_ESTADO)
+    with open(state_file + ".tmp", 'w') as f:
+        json.dump(synced, f)
+    os.replace(state_file + ".tmp", state_file)
+
+
+def download_to(download_url, local_file):
+    """
+    Descarga en streaming a un archivo temporal y lo renombra al completar. Usa el
+    mismo timeout y los mismos reintentos (red, 429 y 5xx) que GraphBackend.download,
+    así una conexión colgada no retiene el bloqueo de cron indefinidamente.
+    """
+
+    os.makedirs(os.path.dirname(local_file), exist_ok=True)
+    tmp_file = local_file + ".tmp"
+    for intento in range(1, DESCARGA_REINTENTOS + 1):
+        try:
+            with requests.get(download_url, stream=True, timeout=DESCARGA_TIMEOUT) as response:
+                if response.status_code == 200:
+                    with open(tmp_file, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=1 << 16):
+                            f.write(chunk)
+                    os.replace(tmp_file, local_file)
+                    return
+        except requests.RequestException as e:
+            if intento == DESCARGA_REINTENTOS:
+                raise Exception(f"Fallo al descargar {local_file}: {e}") from e
+            time.sleep(intento)
+            continue
+
+        if (response.status_code != 429 and response.status_code < 500) or intento == DESCARGA_REINTENTOS:
+            raise Exception(f"Fallo al descargar {local_file}: {response.status_code}")
+        time.sleep(int(response.headers.get("Retry-After", intento)))
+
+
+def convert(destino, path):
+    """
+    Parsea el libro con el loader del dashboard y guarda el resultado junto a él
+    """
+
+    parser = parser_for_path(path)
+    if parser is None:
+        return path, False
+    espejo = LocalBackend(destino)
+    content, version = espejo.read(path, path)
+    espejo.write_parsed(path, parser(content, version))
+    return path, True
+
+
+def sync(destino, workers, convertir, completo):
+    index = AvailabilityIndex(os.path.join(destino, ARCHIVO_INDICE), 0, roots=[cf.DIRECTORIO_PRINCIPAL])
+    if completo:
+        index.build()
+    else:
+        index.load_or_build()
+
+    backend = GraphBackend(index)
+    espejo = LocalBackend(destino)
+    synced = {} if completo else load_state(destino)
+
+    # Archivos eliminados en OneDrive
+    removed = [path for path in synced if index.get(path) is None]
+    for path in removed:
+        for local_file in (espejo.full_path(path), espejo.parsed_path(path)):
+            if os.path.exists(local_file):
+                os.remove(local_file)
+        del synced[path]
+
+    pending = [path for path, entry in index.files.items()
+               if synced.get(path) != entry["eTag"] or not os.path.exists(espejo.full_path(path))]
+    print(f"{len(index.files)} archivos en OneDrive, {len(pending)} por descargar, {len(removed)} eliminados")
+
+    downloaded = []
+    errors = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), BATCH_MAX_REQUESTS):
+            chunk = pending[start:start + BATCH_MAX_REQUESTS]
+            urls = backend.resolve_download_urls(chunk)
+            futures = {
+                executor.submit(download_to, urls[path][0], espejo.full_path(path)): path
+                for path in chunk if urls.get(path) is not None
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    errors += 1
+                    print(f"    Error: {e}")
+                    continue
+                synced[path] = index.get(path)["eTag"]
+                downloaded.append(path)
+                if len(downloaded) % GUARDAR_CADA == 0:
+                    save_state(destino, synced)
+                    print(f"    {len(downloaded)}/{len(pending)} descargados")
+    save_state(destino, synced)
+    print(f"{len(downloaded)} archivos descargados, {errors} errores")
+
+    if convertir:
+        # Libros sin versión parseada al día (los recién descargados o convertidos antes de un corte)
+        to_convert = [path for path in synced if parser_for_path(path) is not None
+                      and (path in downloaded or not os.path.exists(espejo.parsed_path(path)))]
+        converted = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(convert, destino, path) for path in to_convert]
+            for future in as_completed(futures):
+                try:
+                    converted += future.result()[1]
+                except Exception as e:
+                    errors += 1
+                    print(f"    Error al convertir: {e}")
+        print(f"{converted} libros convertidos a {PARSED_SUFFIX}")
+
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destino", default=cf.DIRECTORIO_ESPEJO, help="Directorio del espejo local")
+    parser.add_argument("--workers", type=int, default=cf.DESCARGAS_PARALELAS, help="Descargas simultáneas")
+    parser.add_argument("--convertir", action="store_true", help="Guardar la versión parseada de cada libro")
+    parser.add_argument("--completo", action="store_true", help="Ignorar el estado y el enlace delta guardados")
+    args = parser.parse_args()
+
+    if not CLIENT_ID and not GRAPH_ACCESS_TOKEN:
+        raise ValueError("CLIENT_ID no encontrado en archivo .env")
+
+    os.makedirs(args.destino, exist_ok=True)
+    with open(os.path.join(args.destino, ARCHIVO_BLOQUEO), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print("Otra sincronización está en curso, se omite esta ejecución")
+            return 0
+
+        inicio = time.monotonic()
+        data_cache["ACCESS_TOKEN"] = get_access_token(CLIENT_ID)
+        errors = sync(args.destino, args.workers, args.convertir, args.completo)
+        print(f"Sincronización terminada en {time.monotonic() - inicio:.1f} s")
+
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
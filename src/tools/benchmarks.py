@@ -0,0 +1,231 @@
+"""
+Benchmarks de las rutas críticas: lectura de libros, transformación de series,
+construcción de figuras, planilla y exportación.
+
+Cada benchmark reporta la mediana y el mínimo de varias repeticiones y el pico de
+memoria (tracemalloc, en una corrida aparte). Con --baseline compara contra
+resultados guardados y termina con código 1 si algún benchmark empeora más que
+--umbral en tiempo o en memoria. Si se pide --umbral y no hay línea base termina
+con código 2, así el control no pasa en silencio en una copia recién clonada.
+
+Los datos se generan con src/tools/synthetic_workbooks.py (o se reusan con
+--datos) y se leen con el backend local.
+
+Uso:
+    python src/tools/benchmarks.py --guardar                      # crea/actualiza la línea base
+    python src/tools/benchmarks.py --umbral 0.25                  # compara contra la línea base
+    python src/tools/benchmarks.py --datos datos_bench --filtro semanal
+"""
+
+from pathlib import Path
+from statistics import median
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SRC = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SRC))
+
+ULTIMO_ANIO = 2024
+UMBRAL_POR_DEFECTO = 0.2
+
+
+def prepare_dataset(destino, anios, estaciones):
+    """
+    Genera el registro mensual de los últimos años, la planilla de la primera
+    estación y un registro diario (si el directorio aún no tiene datos)
+    """
+
+    import config as cf
+    from data.file_managment import path_registro_diario
+    from tools.synthetic_workbooks import build_series, build_stations, daily_rows, generate, save_workbook
+    import numpy as np
+    import pandas as pd
+
+    if os.path.isdir(os.path.join(destino, cf.DIRECTORIO_PRINCIPAL)):
+        return
+
+    print(f"Generando {anios} años de datos sintéticos en {destino}...")
+    generate(destino, ULTIMO_ANIO - anios + 1, ULTIMO_ANIO, estaciones, missing_rate=0.02, planillas=1,
+             diario=False)
+
+    rng = np.random.default_rng(0)
+    stations = build_stations(estaciones, rng)
+    fechas = pd.date_range(f"{ULTIMO_ANIO}-01-01", periods=1, freq="D")
+    series = build_series(stations, fechas, 0.02, rng)
+    save_workbook({"Hoja1": daily_rows(stations, series, 0, fechas[0])},
+                  os.path.join(destino, path_registro_diario(ULTIMO_ANIO, 1, 1)))
+
+
+def define_benchmarks(rangos):
+    """
+    Diccionario nombre -> función sin argumentos. Los datos de entrada se preparan
+    aquí para que solo se mida la ruta crítica.
+    """
+
+    from data.file_managment import (get_registro_diario, parse_normales, parse_planilla_climatologica,
+                                     parse_registro_diario, parse_registro_mensual, path_planilla, path_registro_diario,
+                                     path_registro_mensual, storage)
+    from cache import data_cache
+    from ui.control_diario import build_daily_payload
+    from ui.control_semanal import (extract_station_data, get_monthly_data_cached, get_normal_values,
+                                    make_precipitation_cumulative, update_graphs_semanal)
+    from ui.generacion_planilla import export_to_excel, transform_data_to_template
+    from plotly.io.json import to_json_plotly
+    from datetime import datetime
+    import config as cf
+    import pandas as pd
+
+    estaciones = data_cache["LISTA_ESTACIONES"]
+    estacion1, estacion2 = estaciones[0], estaciones[1]
+
+    normales_path = f"{cf.DIRECTORIO_PRINCIPAL}/{cf.DIRECTORIO_REGISTRO_NORMAL}/{cf.ARCHIVO_EXCEL_NORMALES}"
+    normales = storage.read(normales_path, "normales")
+    mensual = storage.read(path_registro_mensual(ULTIMO_ANIO, 1), "registro mensual")
+    diario = storage.read(path_registro_diario(ULTIMO_ANIO, 1, 1), "registro diario")
+    planilla = storage.read(path_planilla(estacion1, ULTIMO_ANIO, 1), "planilla")
+    df_planilla = parse_planilla_climatologica(*planilla, station_name=estacion1)
+    df_diario = get_registro_diario(ULTIMO_ANIO, 1, 1)
+
+    benchmarks = {
+        "lectura/normales": lambda: parse_normales(*normales),
+        "lectura/registro_mensual": lambda: parse_registro_mensual(*mensual, year=ULTIMO_ANIO, month=1),
+        "lectura/registro_diario": lambda: parse_registro_diario(*diario),
+        "lectura/planilla": lambda: parse_planilla_climatologica(*planilla, station_name=estacion1),
+        "diario/build_daily_payload": lambda: to_json_plotly(build_daily_payload(datetime(ULTIMO_ANIO, 1, 1), df_diario)),
+        "planilla/transform_data_to_template": lambda: transform_data_to_template(df_planilla, estacion1, ULTIMO_ANIO, 1),
+        "planilla/export_to_excel": lambda: export_to_excel(1, estacion1, f"{ULTIMO_ANIO}-01-01"),
+    }
+
+    for anios in rangos:
+        inicio = ULTIMO_ANIO - anios + 1
+        meses = [(year, month) for year in range(inicio, ULTIMO_ANIO + 1) for month in range(1, 13)]
+        # Los meses quedan en data_cache: el callback semanal se mide sin lecturas de archivos
+        for year, month in meses:
+            get_monthly_data_cached(year, month)
+        df = pd.concat([data_cache[f"MENSUAL_{y}_{m:02d}"][0] for y, m in meses], ignore_index=True)
+        fechas = pd.DatetimeIndex(pd.concat([pd.Series(data_cache[f"MENSUAL_{y}_{m:02d}"][1]) for y, m in meses]))
+        pp = extract_station_data(df, estacion1)["PP"]
+        rango = [f"{inicio}-01-01", f"{ULTIMO_ANIO}-12-31"]
+
+        benchmarks.update({
+            f"semanal/extract_station_data/{anios}a": lambda df=df: extract_station_data(df, estacion1),
+            f"semanal/get_normal_values/{anios}a": lambda fechas=fechas: get_normal_values(estacion1, fechas),
+            f"semanal/make_precipitation_cumulative/{anios}a":
+                lambda pp=pp, fechas=fechas: make_precipitation_cumulative(pp, fechas),
+            f"semanal/update_graphs_semanal/{anios}a":
+                lambda rango=rango: update_graphs_semanal(1, rango, estacion1, estacion2),
+        })
+
+    return benchmarks
+
+
+def measure(fn, repeticiones):
+    """
+    Mediana y mínimo en segundos (tras una corrida de calentamiento) y pico de memoria en MB
+    """
+
+    fn()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    fn()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"mediana_s": median(tiempos), "min_s": min(tiempos), "pico_mb": pico / 2**20}
+
+
+def compare(resultados, baseline, umbral):
+    """
+    Benchmarks que empeoran más que el umbral respecto de la línea base
+    """
+
+    regresiones = []
+    for nombre, actual in resultados.items():
+        anterior = baseline.get(nombre)
+        if anterior is None:
+            continue
+        for campo in ("mediana_s", "pico_mb"):
+            if anterior[campo] > 0 and actual[campo] > anterior[campo] * (1 + umbral):
+                regresiones.append((nombre, campo, anterior[campo], actual[campo]))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--datos", help="Directorio de datos sintéticos (se genera si no existe)")
+    parser.add_argument("--estaciones", type=int, default=42)
+    parser.add_argument("--rangos", default="1,10", help="Años de los rangos del análisis semanal")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--filtro", help="Ejecutar solo los benchmarks cuyo nombre contiene este texto")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="Archivo de línea base")
+    parser.add_argument("--umbral", type=float, help="Regresión tolerada (por defecto 0.2 = 20%%); exige línea base")
+    parser.add_argument("--guardar", action="store_true", help="Guardar los resultados como línea base")
+    parser.add_argument("--salida", help="Guardar los resultados en este archivo JSON")
+    args = parser.parse_args()
+
+    rangos = [int(r) for r in args.rangos.split(",")]
+    datos = os.path.abspath(args.datos or os.path.join(tempfile.gettempdir(), f"bench_puno_{args.estaciones}_{max(rangos)}"))
+    baseline_path = os.path.abspath(args.baseline)
+    os.environ["ALMACENAMIENTO"] = "local"
+    os.environ["DIRECTORIO_ESPEJO"] = datos
+    os.chdir(SRC.parent)  # la plantilla de la planilla se abre con ruta relativa a la raíz del repositorio
+
+    prepare_dataset(datos, max(rangos), args.estaciones)
+
+    from cache import init_cache
+    init_cache()
+    benchmarks = define_benchmarks(rangos)
+
+    resultados = {}
+    print(f"{'benchmark':<48} {'mediana':>10} {'mínimo':>10} {'pico mem':>10}")
+    for nombre, fn in benchmarks.items():
+        if args.filtro and args.filtro not in nombre:
+            continue
+        resultados[nombre] = measure(fn, args.repeticiones)
+        r = resultados[nombre]
+        print(f"{nombre:<48} {r['mediana_s'] * 1000:>8.1f}ms {r['min_s'] * 1000:>8.1f}ms {r['pico_mb']:>8.2f}MB")
+
+    salida = {"python": platform.python_version(), "maquina": platform.machine(), "resultados": resultados}
+    if args.salida:
+        with open(args.salida, 'w') as f:
+            json.dump(salida, f, indent=2)
+
+    if args.guardar:
+        baseline = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path, 'r') as f:
+                baseline = json.load(f)["resultados"]
+        baseline.update(resultados)
+        with open(baseline_path, 'w') as f:
+            json.dump({**salida, "resultados": baseline}, f, indent=2)
+        print(f"Línea base guardada en {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"Sin línea base en {baseline_path}; use --guardar para crearla")
+        return 2 if args.umbral is not None else 0
+
+    umbral = args.umbral if args.umbral is not None else UMBRAL_POR_DEFECTO
+    with open(baseline_path, 'r') as f:
+        regresiones = compare(resultados, json.load(f)["resultados"], umbral)
+    for nombre, campo, anterior, actual in regresiones:
+        print(f"REGRESIÓN {nombre} {campo}: {anterior:.4f} -> {actual:.4f} ({actual / anterior - 1:+.0%})")
+    if regresiones:
+        return 1
+    print(f"Sin regresiones mayores a {umbral:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,369 @@
+"""
+Servidor local que imita los endpoints de Microsoft Graph (OneDrive) que usa el
+proyecto, respaldado por un directorio con el mismo esquema DIRECTORIO_PRINCIPAL/...
+
+Endpoints (bajo /v1.0):
+    GET  /me/drive/root:/{ruta}[:]              metadata del elemento
+    GET  /me/drive/root:/{ruta}:/content        contenido (302 a la URL de descarga)
+    GET  /me/drive/root:/{ruta}:/children       listado paginado ($top, $skiptoken)
+    GET  /me/drive/items/{id}[/content]         metadata / contenido por id
+    GET  /me/drive/root/delta[?token=...]       cambios desde el token (token=latest)
+    POST /$batch                                hasta 20 solicitudes GET
+    GET  /descargas/{id}                        URL de descarga preautenticada
+
+Permite simular latencia, ancho de banda limitado y respuestas 429 con Retry-After.
+
+Uso:
+    python src/tools/fake_graph_server.py --raiz datos_prueba --puerto 8765 --latencia 80 --tasa-429 0.05
+
+Y el dashboard contra este servidor:
+    GRAPH_URL=http://127.0.0.1:8765/v1.0 GRAPH_ACCESS_TOKEN=prueba python src/main.py
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+from threading import Lock
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from datetime import datetime, timezone
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+BATCH_MAX_REQUESTS = 20
+PAGINA_MAX = 200
+SNAPSHOTS_MAX = 16
+CHUNK = 1 << 16
+
+
+class FakeDrive:
+    """
+    Vista tipo OneDrive de un directorio local: ids estables por ruta, eTag por
+    mtime/tamaño y snapshots para el endpoint delta (solo los SNAPSHOTS_MAX más
+    recientes; un token más viejo recibe todo el árbol, como un resync)
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.snapshots = {}
+        self.last_token = 0
+        self.lock = Lock()
+        self.paths_by_id = self.index_ids(self.walk())
+
+    def item_id(self, path):
+        return hashlib.blake2b(path.encode(), digest_size=10).hexdigest().upper()
+
+    def local_path(self, path):
+        return os.path.join(self.root, *[p for p in path.split("/") if p])
+
+    def item(self, path, base_url):
+        """
+        Representación JSON de un archivo o carpeta (None si no existe)
+        """
+
+        local = self.local_path(path)
+        if not os.path.exists(local):
+            return None
+        st = os.stat(local)
+        parent = path.rsplit("/", 1)[0] if "/" in path else ""
+        item = {
+            "id": self.item_id(path),
+            "name": os.path.basename(local),
+            "size": st.st_size,
+            "eTag": f"\"{{{st.st_mtime_ns:x}-{st.st_size:x}}},1\"",
+            "lastModifiedDateTime": datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat().replace("+00:00", "Z"),
+            "parentReference": {"id": self.item_id(parent) if parent else "ROOT"},
+        }
+        if os.path.isdir(local):
+            item["folder"] = {"childCount": len(os.listdir(local))}
+        else:
+            item["file"] = {"mimeType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"}
+            item["@microsoft.graph.downloadUrl"] = f"{base_url}/descargas/{item['id']}"
+        return item
+
+    def children(self, path):
+        local = self.local_path(path)
+        if not os.path.isdir(local):
+            return None
+        return sorted(f"{path}/{name}" if path else name for name in os.listdir(local)
+                      if not name.endswith(".tmp"))
+
+    def walk(self):
+        """
+        Todas las rutas (carpetas y archivos) bajo la raíz
+        """
+
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            rel = "" if rel == "." else rel
+            for name in dirnames + filenames:
+                if not name.endswith(".tmp"):
+                    paths.append(f"{rel}/{name}" if rel else name)
+        return paths
+
+    def index_ids(self, paths):
+        return {self.item_id(path): path for path in paths}
+
+    def path_by_id(self, item_id):
+        """
+        Ruta de un id desde el diccionario armado en el último snapshot; si no está
+        (archivo creado después) se vuelve a recorrer el árbol una vez
+        """
+
+        path = self.paths_by_id.get(item_id)
+        if path is None or not os.path.exists(self.local_path(path)):
+            self.paths_by_id = self.index_ids(self.walk())
+            path = self.paths_by_id.get(item_id)
+        return path
+
+    def snapshot(self):
+        """
+        Guarda el estado actual y devuelve su token
+        """
+
+        state = {}
+        for path in self.walk():
+            st = os.stat(self.local_path(path))
+            state[path] = (st.st_mtime_ns, st.st_size)
+        with self.lock:
+            self.last_token += 1
+            token = str(self.last_token)
+            self.snapshots[token] = state
+            self.snapshots.pop(str(self.last_token - SNAPSHOTS_MAX), None)
+            self.paths_by_id = self.index_ids(state)
+        return token, state
+
+    def delta(self, token, base_url):
+        previous = self.snapshots.get(token) if token != "latest" else None
+        new_token, current = self.snapshot()
+        if token == "latest":
+            return [], new_token
+
+        items = []
+        for path, signature in current.items():
+            if previous is None or previous.get(path) != signature:
+                items.append(self.item(path, base_url))
+        for path in (previous or {}):
+            if path not in current:
+                items.append({"id": self.item_id(path), "deleted": {"state": "deleted"}})
+        return items, new_token
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host')}"
+
+    def do_GET(self):
+        self.simulate_latency()
+        url = urlsplit(self.path)
+        if url.path.startswith("/descargas/"):
+            self.server.count("descargas")
+            return self.send_file(unquote(url.path[len("/descargas/"):]))
+        if not url.path.startswith("/v1.0/"):
+            return self.send_json(404, error_body("itemNotFound"))
+        if "Authorization" not in self.headers:
+            return self.send_json(401, error_body("InvalidAuthenticationToken"))
+        self.server.count("api")
+        if self.throttled():
+            self.server.count("429")
+            return self.send_json(429, error_body("activityLimitReached"), {"Retry-After": str(self.server.retry_after)})
+
+        status, headers, body = self.route("GET", url.path[len("/v1.0"):], url.query)
+        if status == 302:
+            self.send_response(302)
+            self.send_header("Location", headers["Location"])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(status, body, headers)
+
+    def do_POST(self):
+        self.simulate_latency()
+        url = urlsplit(self.path)
+        if url.path != "/v1.0/$batch":
+            return self.send_json(404, error_body("itemNotFound"))
+        if "Authorization" not in self.headers:
+            return self.send_json(401, error_body("InvalidAuthenticationToken"))
+
+        self.server.count("batch")
+        length = int(self.headers.get("Content-Length", 0))
+        batch = json.loads(self.rfile.read(length) or b"{}").get("requests", [])
+        if len(batch) > BATCH_MAX_REQUESTS:
+            return self.send_json(400, error_body("invalidRequest"))
+
+        responses = []
+        for request in batch:
+            if self.throttled():
+                self.server.count("429")
+                responses.append({"id": request["id"], "status": 429,
+                                  "headers": {"Retry-After": str(self.server.retry_after)},
+                                  "body": error_body("activityLimitReached")})
+                continue
+            sub_url = urlsplit(request["url"])
+            status, headers, body = self.route(request.get("method", "GET"), sub_url.path, sub_url.query)
+            responses.append({"id": request["id"], "status": status, "headers": headers, "body": body})
+        self.send_json(200, {"responses": responses})
+
+    def route(self, method, path, query):
+        """
+        Resuelve una solicitud Graph: (status, headers, cuerpo JSON)
+        """
+
+        drive = self.server.drive
+        path = unquote(path)
+        params = parse_qs(query)
+        if method != "GET":
+            return 405, {}, error_body("invalidRequest")
+
+        match = re.match(r"^/me/drive/root:/(.+?):/content$", path)
+        if match:
+            return self.content_redirect(match.group(1))
+
+        match = re.match(r"^/me/drive/root:/(.+?):/children$", path)
+        if match:
+            return self.list_children(match.group(1), params)
+
+        match = re.match(r"^/me/drive/root:/(.+?):?$", path)
+        if match:
+            item = drive.item(match.group(1), self.base_url())
+            return (200, {}, item) if item else (404, {}, error_body("itemNotFound"))
+
+        match = re.match(r"^/me/drive/items/([^/]+)(/content)?$", path)
+        if match:
+            item_path = drive.path_by_id(match.group(1))
+            if item_path is None:
+                return 404, {}, error_body("itemNotFound")
+            if match.group(2):
+                return self.content_redirect(item_path)
+            return 200, {}, drive.item(item_path, self.base_url())
+
+        if path == "/me/drive/root/delta":
+            token = params.get("token", ["0"])[0]
+            items, new_token = drive.delta(token, self.base_url())
+            return 200, {}, {"value": items,
+                             "@odata.deltaLink": f"{self.base_url()}/v1.0/me/drive/root/delta?token={new_token}"}
+
+        return 404, {}, error_body("itemNotFound")
+
+    def content_redirect(self, path):
+        item = self.server.drive.item(path, self.base_url())
+        if item is None or "file" not in item:
+            return 404, {}, error_body("itemNotFound")
+        return 302, {"Location": item["@microsoft.graph.downloadUrl"]}, None
+
+    def list_children(self, path, params):
+        drive = self.server.drive
+        children = drive.children(path)
+        if children is None:
+            return 404, {}, error_body("itemNotFound")
+
+        top = min(int(params.get("$top", [PAGINA_MAX])[0]), PAGINA_MAX)
+        skip = int(params.get("$skiptoken", [0])[0])
+        page = children[skip:skip + top]
+        body = {"value": [drive.item(child, self.base_url()) for child in page]}
+        if skip + top < len(children):
+            body["@odata.nextLink"] = (f"{self.base_url()}/v1.0/me/drive/root:/{quote(path)}:/children"
+                                       f"?$top={top}&$skiptoken={skip + top}")
+        return 200, {}, body
+
+    def send_file(self, item_id):
+        drive = self.server.drive
+        path = drive.path_by_id(item_id)
+        if path is None or not os.path.isfile(drive.local_path(path)):
+            return self.send_json(404, error_body("itemNotFound"))
+
+        with open(drive.local_path(path), 'rb') as f:
+            content = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("ETag", drive.item(path, self.base_url())["eTag"])
+        self.end_headers()
+
+        # Ancho de banda limitado: se envía por bloques respetando bytes por segundo
+        for start in range(0, len(content), CHUNK):
+            block = content[start:start + CHUNK]
+            self.wfile.write(block)
+            if self.server.bandwidth:
+                time.sleep(len(block) / self.server.bandwidth)
+
+    def send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def simulate_latency(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def throttled(self):
+        return self.server.throttle_rate > 0 and random.random() < self.server.throttle_rate
+
+
+def error_body(code):
+    return {"error": {"code": code, "message": code}}
+
+
+def create_server(root, host="127.0.0.1", port=8765, latency_ms=0, bandwidth=0, throttle_rate=0.0,
+                  retry_after=1, verbose=False):
+    """
+    Crea el servidor (sin iniciarlo); útil para usarlo desde benchmarks y pruebas de carga
+    """
+
+    server = ThreadingHTTPServer((host, port), FakeGraphHandler)
+    server.daemon_threads = True
+    server.drive = FakeDrive(root)
+    server.latency = latency_ms / 1000
+    server.bandwidth = bandwidth
+    server.throttle_rate = throttle_rate
+    server.retry_after = retry_after
+    server.verbose = verbose
+    server.solicitudes = Counter()
+    server.solicitudes_lock = Lock()
+
+    def count(kind):
+        with server.solicitudes_lock:
+            server.solicitudes[kind] += 1
+
+    server.count = count
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--raiz", required=True, help="Directorio con el esquema DIRECTORIO_PRINCIPAL/...")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0, help="Latencia por solicitud en ms")
+    parser.add_argument("--ancho-banda", type=int, default=0, help="Bytes por segundo por descarga (0 = sin límite)")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="Probabilidad de responder 429 por solicitud")
+    parser.add_argument("--retry-after", type=int, default=1, help="Segundos de Retry-After en las respuestas 429")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = create_server(args.raiz, args.host, args.puerto, args.latencia, args.ancho_banda,
+                           args.tasa_429, args.retry_after, args.verbose)
+    print(f"Graph simulado en http://{args.host}:{args.puerto}/v1.0 (raíz: {server.drive.root})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
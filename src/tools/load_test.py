@@ -0,0 +1,334 @@
+"""
+Prueba de carga de los callbacks del dashboard (/_dash-update-component).
+
+Simula usuarios concurrentes que presionan "Cargar Datos" en el análisis diario,
+el análisis semanal y la planilla (generación y exportación) con fechas, rangos
+y estaciones al azar. Por defecto levanta el Graph simulado sobre datos
+sintéticos y la aplicación en un subproceso; con --url se prueba un servidor ya
+iniciado.
+
+Reporta latencia p50/p95/p99 por tipo de solicitud, throughput, tasa de error,
+aciertos de cache (según /_estadisticas), solicitudes que llegaron a Graph y la
+memoria residente del servidor.
+
+Uso:
+    python src/tools/load_test.py --usuarios 16 --duracion 60 --latencia 80
+    python src/tools/load_test.py --mezcla diario=6,semanal=3,planilla=1,exportar=0
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Event, Lock, Thread
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(SRC))
+
+import numpy as np
+import pandas as pd
+import requests
+
+from tools.fake_graph_server import create_server
+from tools.synthetic_workbooks import generate, station_names
+
+MEZCLA_DEFECTO = "diario=5,semanal=3,planilla=1,exportar=1"
+
+
+def dash_body(outputs, inputs, state=(), changed=None):
+    """
+    Cuerpo de /_dash-update-component para un callback (outputs: lista de (id, propiedad))
+    """
+
+    def prop(id, property, value=None):
+        return {"id": id, "property": property, "value": value}
+
+    if len(outputs) == 1:
+        output = f"{outputs[0][0]}.{outputs[0][1]}"
+        outputs_body = {"id": outputs[0][0], "property": outputs[0][1]}
+    else:
+        output = ".." + "...".join(f"{id}.{property}" for id, property in outputs) + ".."
+        outputs_body = [{"id": id, "property": property} for id, property in outputs]
+
+    return {
+        "output": output,
+        "outputs": outputs_body,
+        "inputs": [prop(*i) for i in inputs],
+        "state": [prop(*s) for s in state],
+        "changedPropIds": [changed or f"{inputs[0][0]}.{inputs[0][1]}"],
+    }
+
+
+class Escenarios:
+    """
+    Generador de solicitudes realistas sobre los años y estaciones de los datos
+    """
+
+    def __init__(self, desde, hasta, estaciones, planillas, rng):
+        self.dias = pd.date_range(f"{desde}-01-01", f"{hasta}-12-31", freq="D")
+        self.meses = pd.date_range(f"{desde}-01-01", f"{hasta}-12-01", freq="MS")
+        self.estaciones = estaciones
+        self.planillas = estaciones[:planillas]
+        self.rng = rng
+
+    def diario(self):
+        fecha = self.dias[self.rng.randrange(len(self.dias))].strftime("%Y-%m-%d")
+        # La mayoría cambia la fecha; algunos vuelven a presionar "Cargar Datos"
+        changed = "cargar-datos-btn-diario.n_clicks" if self.rng.random() < 0.15 else "registro-diario-date-selector.value"
+        return dash_body(
+            [("registro-diario-store", "data"), ("loading-status-diario", "children")],
+            [("cargar-datos-btn-diario", "n_clicks", 1), ("registro-diario-date-selector", "value", fecha)],
+            changed=changed
+        )
+
+    def semanal(self):
+        # Rangos cortos frecuentes y algunos de varios años
+        largo = self.rng.choices([1, 3, 6, 12, 24, 60], weights=[30, 25, 20, 15, 7, 3])[0]
+        largo = min(largo, len(self.meses))
+        inicio = self.rng.randrange(len(self.meses) - largo + 1)
+        fin = self.meses[inicio + largo - 1] + pd.offsets.MonthEnd(0)
+        estacion1, estacion2 = self.rng.sample(self.estaciones, 2)
+        return dash_body(
+            [("temperatura-graph-semanal", "figure"), ("precipitacion-graph-semanal", "figure"),
+             ("loading-status-semanal", "children")],
+            [("cargar-datos-btn-semanal", "n_clicks", 1)],
+            [("date-range-semanal", "value", [self.meses[inicio].strftime("%Y-%m-%d"), fin.strftime("%Y-%m-%d")]),
+             ("estacion-selector-1-semanal", "value", estacion1),
+             ("estacion-selector-2-semanal", "value", estacion2 if self.rng.random() < 0.5 else None)]
+        )
+
+    def planilla(self):
+        return dash_body(
+            [("planilla-table-container", "children"), ("export-button-container", "children"),
+             ("loading-status-planilla", "children")],
+            [("generar-planilla-btn", "n_clicks", 1)],
+            self.planilla_state()
+        )
+
+    def exportar(self):
+        return dash_body([("download-planilla-excel", "data")], [("export-excel-btn", "n_clicks", 1)],
+                         self.planilla_state())
+
+    def planilla_state(self):
+        mes = self.meses[self.rng.randrange(len(self.meses))].strftime("%Y-%m-%d")
+        return [("station-selector-planilla", "value", self.rng.choice(self.planillas)),
+                ("month-year-selector-planilla", "value", mes)]
+
+
+def run_load(url, escenarios, mezcla, usuarios, duracion, solicitudes):
+    """
+    Ejecuta la carga con `usuarios` hilos hasta cumplir la duración o el número de solicitudes
+
+    Returns:
+        Lista de (tipo, latencia en s, error o None) y el tiempo transcurrido
+    """
+
+    tipos, pesos = zip(*mezcla.items())
+    resultados = []
+    lock = Lock()
+    enviadas = [0]
+    detener = Event()
+    inicio = time.perf_counter()
+
+    def usuario():
+        session = requests.Session()
+        while not detener.is_set():
+            with lock:
+                if solicitudes and enviadas[0] >= solicitudes:
+                    return
+                enviadas[0] += 1
+                tipo = escenarios.rng.choices(tipos, weights=pesos)[0]
+                body = getattr(escenarios, tipo)()
+            t0 = time.perf_counter()
+            try:
+                response = session.post(f"{url}/_dash-update-component", json=body, timeout=300,
+                                         headers={"Accept-Encoding": "gzip"})
+                error = None
+                if response.status_code not in (200, 204):
+                    error = f"HTTP {response.status_code}"
+                elif '"color": "red"' in response.text or '"color":"red"' in response.text:
+                    error = "alerta de error"
+            except requests.RequestException as e:
+                error = type(e).__name__
+            resultados.append((tipo, time.perf_counter() - t0, error))
+            if duracion and time.perf_counter() - inicio > duracion:
+                detener.set()
+
+    with ThreadPoolExecutor(max_workers=usuarios) as executor:
+        for future in [executor.submit(usuario) for _ in range(usuarios)]:
+            future.result()
+
+    return resultados, time.perf_counter() - inicio
+
+
+def sample_rss(url, detener, muestras):
+    while not detener.wait(1.0):
+        try:
+            muestras.append(requests.get(f"{url}/_estadisticas", timeout=5).json()["rss_bytes"])
+        except requests.RequestException:
+            pass
+
+
+def summarize(resultados, transcurrido):
+    """
+    Percentiles de latencia y errores por tipo de solicitud y en total
+    """
+
+    resumen = {}
+    por_tipo = {}
+    for tipo, latencia, error in resultados:
+        por_tipo.setdefault(tipo, []).append((latencia, error))
+    por_tipo["total"] = [(latencia, error) for _, latencia, error in resultados]
+
+    for tipo, filas in por_tipo.items():
+        latencias = np.array([latencia for latencia, _ in filas])
+        errores = sum(error is not None for _, error in filas)
+        resumen[tipo] = {
+            "solicitudes": len(filas),
+            "errores": errores,
+            "tasa_error": errores / len(filas),
+            "p50_ms": float(np.percentile(latencias, 50) * 1000),
+            "p95_ms": float(np.percentile(latencias, 95) * 1000),
+            "p99_ms": float(np.percentile(latencias, 99) * 1000),
+            "throughput_rps": len(filas) / transcurrido,
+        }
+    return resumen
+
+
+def wait_for_server(url, proceso, timeout):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso is not None and proceso.poll() is not None:
+            raise RuntimeError("La aplicación terminó antes de iniciar")
+        try:
+            return requests.get(f"{url}/_estadisticas", timeout=2).json()
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f"La aplicación no respondió en {timeout} s")
+
+
+def cache_delta(antes, despues):
+    """
+    Aciertos y fallos de cada cache durante la prueba
+    """
+
+    delta = {}
+    for nombre, stats in despues["caches"].items():
+        previos = antes["caches"].get(nombre, {})
+        delta[nombre] = {k: v - previos.get(k, 0) for k, v in stats.items() if k != "entries"}
+        if "hits" in delta[nombre]:
+            consultas = delta[nombre]["hits"] + delta[nombre]["misses"]
+            delta[nombre]["tasa_acierto"] = delta[nombre]["hits"] / consultas if consultas else None
+    return delta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Servidor ya iniciado (si no se indica, se levanta uno local)")
+    parser.add_argument("--datos", help="Directorio de datos sintéticos (se genera si no existe)")
+    parser.add_argument("--desde", type=int, default=2023)
+    parser.add_argument("--hasta", type=int, default=2024)
+    parser.add_argument("--estaciones", type=int, default=42)
+    parser.add_argument("--planillas", type=int, default=4, help="Estaciones con planilla en los datos")
+    parser.add_argument("--usuarios", type=int, default=8, help="Usuarios concurrentes")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos de carga (0 = usar --solicitudes)")
+    parser.add_argument("--solicitudes", type=int, default=0, help="Total de solicitudes")
+    parser.add_argument("--mezcla", default=MEZCLA_DEFECTO, help="Pesos por tipo de solicitud")
+    parser.add_argument("--latencia", type=float, default=50, help="Latencia del Graph simulado en ms")
+    parser.add_argument("--ancho-banda", type=int, default=0, help="Bytes por segundo del Graph simulado")
+    parser.add_argument("--tasa-429", type=float, default=0.0)
+    parser.add_argument("--puerto", type=int, default=8051)
+    parser.add_argument("--puerto-graph", type=int, default=8765)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Guardar el resumen en este archivo JSON")
+    args = parser.parse_args()
+
+    mezcla = {tipo: float(peso) for tipo, peso in (par.split("=") for par in args.mezcla.split(","))}
+    mezcla = {tipo: peso for tipo, peso in mezcla.items() if peso > 0}
+    escenarios = Escenarios(args.desde, args.hasta, station_names(args.estaciones), args.planillas,
+                            random.Random(args.semilla))
+
+    graph, proceso, url = None, None, args.url
+    if url is None:
+        datos = os.path.abspath(args.datos or os.path.join(
+            tempfile.gettempdir(), f"carga_puno_{args.estaciones}_{args.desde}_{args.hasta}"))
+        if not os.path.isdir(datos):
+            print(f"Generando datos sintéticos en {datos}...")
+            generate(datos, args.desde, args.hasta, args.estaciones, missing_rate=0.02, missing_days_rate=0.03,
+                     planillas=args.planillas, workers=os.cpu_count())
+
+        graph = create_server(datos, port=args.puerto_graph, latency_ms=args.latencia, bandwidth=args.ancho_banda,
+                              throttle_rate=args.tasa_429)
+        Thread(target=graph.serve_forever, daemon=True).start()
+
+        env = dict(os.environ,
+                   ALMACENAMIENTO="graph",
+                   GRAPH_URL=f"http://127.0.0.1:{args.puerto_graph}/v1.0",
+                   GRAPH_ACCESS_TOKEN="prueba-de-carga",
+                   ARCHIVO_INDICE_DISPONIBILIDAD=os.path.join(tempfile.mkdtemp(), "indice.json"),
+                   DASH_PUERTO=str(args.puerto),
+                   DASH_DEBUG="0")
+        log_path = os.path.join(tempfile.gettempdir(), "load_test_app.log")
+        print(f"Registro de la aplicación en {log_path}")
+        with open(log_path, 'w') as log:
+            proceso = subprocess.Popen([sys.executable, str(SRC / "main.py")], cwd=SRC.parent, env=env,
+                                       stdout=log, stderr=subprocess.STDOUT)
+        url = f"http://127.0.0.1:{args.puerto}"
+
+    try:
+        antes = wait_for_server(url, proceso, timeout=300)
+        muestras_rss = [antes["rss_bytes"]]
+        detener = Event()
+        Thread(target=sample_rss, args=(url, detener, muestras_rss), daemon=True).start()
+        solicitudes_graph = dict(graph.solicitudes) if graph else {}
+
+        print(f"Carga: {args.usuarios} usuarios, mezcla {mezcla}")
+        resultados, transcurrido = run_load(url, escenarios, mezcla, args.usuarios,
+                                            args.duracion if not args.solicitudes else 0, args.solicitudes)
+        detener.set()
+        despues = requests.get(f"{url}/_estadisticas", timeout=5).json()
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+        if graph is not None:
+            graph.shutdown()
+
+    resumen = {
+        "latencias": summarize(resultados, transcurrido),
+        "caches": cache_delta(antes, despues),
+        "graph": {k: v - solicitudes_graph.get(k, 0) for k, v in graph.solicitudes.items()} if graph else None,
+        "rss_mb": {"inicio": antes["rss_bytes"] / 2**20, "max": max(muestras_rss + [despues["rss_bytes"]]) / 2**20,
+                   "fin": despues["rss_bytes"] / 2**20},
+        "duracion_s": transcurrido,
+    }
+
+    print(f"\n{'tipo':<10} {'solic.':>7} {'errores':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'req/s':>7}")
+    for tipo, r in resumen["latencias"].items():
+        print(f"{tipo:<10} {r['solicitudes']:>7} {r['errores']:>8} {r['p50_ms']:>7.0f}ms {r['p95_ms']:>7.0f}ms "
+              f"{r['p99_ms']:>7.0f}ms {r['throughput_rps']:>7.2f}")
+    figuras = resumen["caches"]["figure_cache"]
+    if figuras.get("tasa_acierto") is not None:
+        print(f"\nCache de figuras: {figuras['hits']} aciertos / {figuras['misses']} fallos "
+              f"({figuras['tasa_acierto']:.0%})")
+    print(f"Descargas agrupadas (single-flight): {resumen['caches']['loader_flight']['coalesced']}")
+    if resumen["graph"] is not None:
+        print(f"Solicitudes a Graph: {resumen['graph']}")
+    rss = resumen["rss_mb"]
+    print(f"RSS del servidor: {rss['inicio']:.0f} MB al inicio, {rss['max']:.0f} MB máximo, {rss['fin']:.0f} MB al final")
+
+    if args.salida:
+        with open(args.salida, 'w') as f:
+            json.dump(resumen, f, indent=2)
+
+    return 1 if resumen["latencias"]["total"]["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Mide el tamaño de la respuesta del callback de análisis semanal.
+
+Compara el JSON con arreglos tipados (bdata float32 y fechas x0/dx) contra el
+equivalente con listas de floats y fechas ISO que se enviaba antes, con y sin gzip.
+
+Uso: python src/tools/payload_size.py [--meses 12] [--estaciones 42]
+"""
+
+from pathlib import Path
+import argparse
+import base64
+import gzip
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_month(year, month, estaciones, rng):
+    """
+    Dataframe mensual con la forma de get_registro_mensual (MultiIndex estación/variable)
+    """
+
+    dias = pd.Period(f"{year}-{month:02d}").days_in_month
+    columnas = pd.MultiIndex.from_tuples([(e, v) for e in estaciones for v in ("TMAX", "TMIN", "PP")])
+    valores = np.column_stack([
+        rng.normal(m, 2, dias).round(1) for _ in estaciones for m in (16, -2, 2)
+    ])
+    return pd.DataFrame(valores, columns=columnas)
+
+
+def expand_typed_arrays(obj):
+    """
+    Reemplaza arreglos tipados y ejes x0/dx por listas, como se serializaban antes
+    """
+
+    if isinstance(obj, dict):
+        if set(obj) == {"dtype", "bdata"}:
+            valores = np.frombuffer(base64.b64decode(obj["bdata"]), dtype=obj["dtype"])
+            return [None if np.isnan(v) else float(str(v)) for v in valores]
+        obj = {k: expand_typed_arrays(v) for k, v in obj.items()}
+        if "x0" in obj and "dx" in obj and isinstance(obj.get("y"), list):
+            inicio = pd.Timestamp(obj.pop("x0"))
+            paso = pd.Timedelta(milliseconds=obj.pop("dx"))
+            obj["x"] = [(inicio + i * paso).isoformat() for i in range(len(obj["y"]))]
+        return obj
+    if isinstance(obj, list):
+        return [expand_typed_arrays(v) for v in obj]
+    return obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--estaciones", type=int, default=42)
+    args = parser.parse_args()
+
+    from cache import data_cache
+    from data.file_managment import convert_month
+    from main import create_multi_page_app
+
+    rng = np.random.default_rng(0)
+    estaciones = [f"ESTACION {i:02d}" for i in range(args.estaciones)]
+    meses = [convert_month(m) for m in range(1, 13)]
+    for var in ("TMAX", "TMIN", "PP"):
+        data_cache[f"NORMAL_{var}"] = pd.DataFrame(rng.normal(8, 5, (len(estaciones), 12)), index=estaciones, columns=meses)
+
+    fechas = pd.date_range("2023-01-01", periods=args.meses, freq="MS")
+    for inicio in fechas:
+        df_mes = synthetic_month(inicio.year, inicio.month, estaciones, rng)
+        data_cache[f"MENSUAL_{inicio.year}_{inicio.month:02d}"] = (
+            df_mes, pd.date_range(inicio, periods=len(df_mes), freq="D")
+        )
+    fin = (fechas[-1] + pd.offsets.MonthEnd(0)).strftime("%Y-%m-%d")
+
+    app = create_multi_page_app()
+    client = app.server.test_client()
+    body = {
+        "output": "..temperatura-graph-semanal.figure...precipitacion-graph-semanal.figure...loading-status-semanal.children..",
+        "outputs": [
+            {"id": "temperatura-graph-semanal", "property": "figure"},
+            {"id": "precipitacion-graph-semanal", "property": "figure"},
+            {"id": "loading-status-semanal", "property": "children"},
+        ],
+        "inputs": [{"id": "cargar-datos-btn-semanal", "property": "n_clicks", "value": 1}],
+        "state": [
+            {"id": "date-range-semanal", "property": "value", "value": [fechas[0].strftime("%Y-%m-%d"), fin]},
+            {"id": "estacion-selector-1-semanal", "property": "value", "value": estaciones[0]},
+            {"id": "estacion-selector-2-semanal", "property": "value", "value": estaciones[1]},
+        ],
+        "changedPropIds": ["cargar-datos-btn-semanal.n_clicks"],
+    }
+
+    plano = client.post("/_dash-update-component", json=body)
+    comprimido = client.post("/_dash-update-component", json=body, headers={"Accept-Encoding": "gzip"})
+    tipado = plano.get_data()
+    listas = json.dumps(expand_typed_arrays(json.loads(tipado))).encode()
+
+    print(f"Rango: {args.meses} meses, 2 estaciones")
+    print(f"  listas JSON (antes):        {len(listas):>10,} bytes | gzip {len(gzip.compress(listas)):>9,} bytes")
+    print(f"  arreglos tipados (ahora):   {len(tipado):>10,} bytes | gzip {len(comprimido.get_data()):>9,} bytes "
+          f"({comprimido.headers.get('Content-Encoding')})")
+
+
+if __name__ == "__main__":
+    main()
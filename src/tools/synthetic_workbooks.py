@@ -0,0 +1,368 @@
+"""
+Genera libros Excel sintéticos con los formatos que leen los loaders de
+data/file_managment.py, bajo el esquema de carpetas DIRECTORIO_PRINCIPAL/...
+
+    REGISTRO DIARIO/AAAA/MES/SENAMHI_DZ13_Datos_DD_MES_AAAA.xlsx  (encabezado fila 4, zonas en A)
+    REGISTRO SEMANAL/AAAA/NN. MES AAAA.xlsx                        (hoja METEO B:FU, estación/variable)
+    PLANILLA CLIMATOLOGICA/AAAA/ESTACION/MES.xlsx                  (3 lecturas por día, A:U)
+    NORMALES CLIMÁTICAS/NORMALES 1991-2020_ME.xlsx                 (hojas TMAX, TMIN y PP)
+    COORDENADAS DE ESTACIONES/COORDENADAS UTM-GEOGRAFICAS.xlsx     (hoja GEOGRAFICAS)
+
+Los valores diarios de cada estación salen de una sola serie por estación, así
+el registro diario, el mensual y la planilla son coherentes entre sí.
+
+El directorio resultante sirve como DIRECTORIO_ESPEJO (ALMACENAMIENTO=local) o
+como raíz de src/tools/fake_graph_server.py.
+
+Uso:
+    python src/tools/synthetic_workbooks.py --destino datos_prueba --desde 2023 --hasta 2024 --estaciones 42 --faltantes 0.02
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import argparse
+import calendar
+import os
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from openpyxl import Workbook
+import numpy as np
+import pandas as pd
+
+import config as cf
+from data.file_managment import convert_month, path_registro_diario, path_registro_mensual, path_planilla
+
+ZONAS = ["SELVA Y VALLES INTERANDINOS", "ALTIPLANO NORTE", "ALTIPLANO CENTRO", "ALTIPLANO SUR"]
+NOMBRES_ESTACIONES = [
+    "SANDIA", "CUYOCUYO", "TAMBOPATA", "SAN GABAN", "LIMBANI", "CRUCERO", "AYAVIRI", "NUÑOA",
+    "AZANGARO", "PROGRESO", "MUÑANI", "PUTINA", "HUANCANE", "LAMPA", "CABANILLAS", "PAMPAHUTA",
+    "JULIACA", "TARACO", "ARAPA", "PUNO", "MAÑAZO", "CAPACHICA", "ILAVE", "JULI", "DESAGUADERO",
+    "POMATA", "TAHUACO YUNGUYO", "MAZOCRUZ", "LARAQUERI", "CAPAZO", "PIZACOMA", "KELLUYO",
+]
+COLUMNAS_METEO = 175  # C:FU después de la columna del día (B)
+DIRECCIONES_VIENTO = ["N", "NE", "E", "SE", "S", "SW", "W", "NW", "C"]
+FORMAS_NUBES = {"BAJAS": ["Cu", "Sc", "St", "Cb"], "MEDIAS": ["Ac", "As", "Ns"], "ALTAS": ["Ci", "Cs", "Cc"]}
+COLUMNAS_PLANILLA = [
+    "FECHA", "HORA",
+    "TEMPERATURA MAXIMA DIARIA", "TEMPERATURA MINIMA DIARIA",
+    "TEMPERATURA DEL BULBO SECO DIARIO", "TEMPERATURA BULBO HUMEDO DIARIA",
+    "HUMEDAD RELATIVA DIARIA", "PRESION ATMOSFERICA DIARIA",
+    "DIRECCION VIENTO DIARIA", "VELOCIDAD DEL VIENTO DIARIO",
+    "PRECIPITACION", "EVAPORACION DIARIA",
+    "FORMA DE NUBES BAJAS DIARIAS", "CANTIDAD DE NUBES BAJAS DIARIAS", "ALTURA DE NUBES BAJAS DIARIAS",
+    "FORMA DE NUBES MEDIAS DIARIAS", "CANTIDAD DE NUBES MEDIAS DIARIAS",
+    "FORMA DE NUBES ALTAS DIARIAS", "CANTIDAD DE NUBES ALTAS DIARIAS",
+    "VISIBILIDAD PREVALECIENTE DIARIA", "ESTADO DEL TIEMPO DIARIO",
+]
+
+
+def station_names(count):
+    """
+    Nombres de estaciones (mayúsculas y sin tildes, como los normaliza el registro diario)
+    """
+
+    names = NOMBRES_ESTACIONES[:count]
+    names += [f"ESTACION {i:03d}" for i in range(len(names) + 1, count + 1)]
+    return names
+
+
+def build_stations(count, rng):
+    """
+    Dataframe de estaciones con zona, coordenadas, altitud y normales mensuales
+    """
+
+    names = station_names(count)
+    zonas = np.array_split(np.arange(count), len(ZONAS))
+    zona = np.empty(count, dtype=object)
+    for z, indices in zip(ZONAS, zonas):
+        zona[indices] = z
+
+    # La selva y valles son más bajos y cálidos que el altiplano
+    altitud = np.where(zona == ZONAS[0], rng.uniform(900, 3000, count), rng.uniform(3800, 4600, count)).round()
+    meses = np.arange(12)
+    estacional = np.cos(2 * np.pi * (meses - 0.5) / 12)  # máximo en verano austral (ene-feb)
+    tmax_base = 16 - 0.006 * (altitud - 3800) + rng.normal(0, 0.7, count)
+    tmin_base = -1 - 0.006 * (altitud - 3800) + rng.normal(0, 1.0, count)
+    pp_anual = rng.uniform(450, 900, count) * np.where(zona == ZONAS[0], 2.5, 1.0)
+    pp_reparto = np.array([0.20, 0.17, 0.14, 0.05, 0.01, 0.005, 0.005, 0.01, 0.03, 0.06, 0.09, 0.155])
+
+    stations = pd.DataFrame({
+        "ESTACION": names,
+        "ZONA": zona,
+        "LATITUD": rng.uniform(-17.2, -13.2, count).round(4),
+        "LONGITUD": rng.uniform(-71.0, -68.8, count).round(4),
+        "ALTITUD": altitud,
+    })
+    stations["TMAX"] = list((tmax_base[:, None] + 1.5 * estacional[None, :]).round(1))
+    stations["TMIN"] = list((tmin_base[:, None] + 4.0 * estacional[None, :]).round(1))
+    stations["PP"] = list((pp_anual[:, None] * pp_reparto[None, :]).round(1))
+    return stations
+
+
+def build_series(stations, fechas, missing_rate, rng):
+    """
+    Serie diaria TMAX, TMIN y PP de cada estación (arreglos estaciones x días)
+    """
+
+    meses = fechas.month.to_numpy() - 1
+    dias_mes = fechas.days_in_month.to_numpy()
+    tmax_normal = np.stack(stations["TMAX"].to_numpy())[:, meses]
+    tmin_normal = np.stack(stations["TMIN"].to_numpy())[:, meses]
+    pp_normal = np.stack(stations["PP"].to_numpy())[:, meses] / dias_mes
+
+    shape = (len(stations), len(fechas))
+    tmax = tmax_normal + rng.normal(0, 1.8, shape)
+    tmin = np.minimum(tmin_normal + rng.normal(0, 2.2, shape), tmax - 2)
+    # Días con lluvia según la normal del mes; la cantidad conserva el total mensual esperado
+    prob_lluvia = np.clip(pp_normal / 6, 0.02, 0.8)
+    llueve = rng.random(shape) < prob_lluvia
+    pp = np.where(llueve, rng.gamma(1.2, np.maximum(pp_normal, 0.1) / prob_lluvia / 1.2), 0.0)
+
+    series = {"TMAX": tmax.round(1), "TMIN": tmin.round(1), "PP": pp.round(1)}
+    for values in series.values():
+        values[rng.random(shape) < missing_rate] = np.nan
+    return series
+
+
+def cell(value):
+    """
+    Valor para openpyxl: los NaN quedan como celdas vacías
+    """
+
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def save_workbook(sheets, full_path):
+    """
+    Escribe un libro con openpyxl en modo write_only (hojas: nombre -> filas)
+    """
+
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    wb = Workbook(write_only=True)
+    for name, rows in sheets.items():
+        ws = wb.create_sheet(name)
+        for row in rows:
+            ws.append([cell(v) for v in row])
+    wb.save(full_path + ".tmp")
+    os.replace(full_path + ".tmp", full_path)
+
+
+def daily_rows(stations, series, day_index, fecha):
+    """
+    Registro diario: títulos, encabezado en la fila 4 y zona solo en la primera estación de cada zona
+    """
+
+    rows = [
+        [f"REGISTRO DIARIO - DIRECCION ZONAL 13 PUNO"],
+        [f"FECHA: {fecha:%d/%m/%Y}"],
+        [],
+        ["ZONA", "N°", "ESTACIÓN", "TMAX (°C)", "TMIN (°C)", "ANOM. TMAX", "ANOM. TMIN", "PP NORMAL", "PP (mm)"],
+    ]
+    mes = fecha.month - 1
+    zona_anterior = None
+    for i, station in enumerate(stations.itertuples()):
+        tmax, tmin, pp = (series[v][i, day_index] for v in ("TMAX", "TMIN", "PP"))
+        rows.append([
+            station.ZONA if station.ZONA != zona_anterior else None,
+            i + 1,
+            station.ESTACION,
+            tmax,
+            tmin,
+            round(tmax - station.TMAX[mes], 1),
+            round(tmin - station.TMIN[mes], 1),
+            round(station.PP[mes] / fecha.days_in_month, 1),
+            pp,
+        ])
+        zona_anterior = station.ZONA
+    return rows
+
+
+def monthly_rows(stations, series, day_slice, year, month):
+    """
+    Hoja METEO: fila de estaciones (celdas combinadas) y fila de variables. Las
+    columnas de B:FU que sobran van en un bloque OBSERVACIONES con variables
+    distintas, para que el MultiIndex que arma el loader no tenga duplicados.
+    """
+
+    names = stations["ESTACION"].tolist()
+    sobrantes = max(COLUMNAS_METEO - 3 * len(names), 0)
+    rows = [
+        [None, f"REGISTRO METEOROLOGICO MENSUAL - {convert_month(month)} {year}"],
+        [],
+        [],
+        [],
+        [None, "DIA"] + [f"COL {i}" for i in range(1, max(COLUMNAS_METEO, 3 * len(names)) + 1)],
+        [None, None] + [v for name in names for v in (name, None, None)] + (["OBSERVACIONES"] + [None] * (sobrantes - 1) if sobrantes else []),
+        [None, "DIA"] + ["TMAX", "TMIN", "PP"] * len(names) + [f"OBS {i}" for i in range(1, sobrantes + 1)],
+    ]
+    for offset, day_index in enumerate(range(day_slice.start, day_slice.stop)):
+        rows.append([None, offset + 1] + [series[v][i, day_index] for i in range(len(names))
+                                          for v in ("TMAX", "TMIN", "PP")])
+    return rows
+
+
+def planilla_rows(station_index, series, day_slice, fechas, rng):
+    """
+    Tres lecturas por día (7, 13 y 19 h): TMIN a las 7 h, TMAX a las 19 h y PP a las 7 y 19 h
+    """
+
+    rows = [COLUMNAS_PLANILLA]
+    for day_index in range(day_slice.start, day_slice.stop):
+        tmax, tmin, pp = (series[v][station_index, day_index] for v in ("TMAX", "TMIN", "PP"))
+        base = tmin if not np.isnan(tmin) else 0.0
+        amplitud = (tmax - tmin) if not (np.isnan(tmax) or np.isnan(tmin)) else 12.0
+        for hora, fraccion in ((7, 0.15), (13, 0.9), (19, 0.45)):
+            seco = round(base + fraccion * amplitud, 1)
+            humedo = round(seco - rng.uniform(0.5, 5.0), 1)
+            nubes = {nivel: int(rng.integers(0, 5)) for nivel in FORMAS_NUBES}
+            rows.append([
+                f"{fechas[day_index]:%d/%m/%Y}",
+                f"{hora:02d}",
+                tmax if hora == 19 else np.nan,
+                tmin if hora == 7 else np.nan,
+                seco,
+                humedo,
+                int(rng.integers(20, 95)),
+                round(rng.uniform(600, 650), 1),
+                DIRECCIONES_VIENTO[int(rng.integers(len(DIRECCIONES_VIENTO)))],
+                round(rng.gamma(2.0, 1.5), 1),
+                round(pp / 2, 1) if hora in (7, 19) and not np.isnan(pp) else np.nan,
+                round(rng.uniform(1, 6), 1),
+                FORMAS_NUBES["BAJAS"][int(rng.integers(4))] if nubes["BAJAS"] else None,
+                nubes["BAJAS"],
+                int(rng.integers(0, 10)) if nubes["BAJAS"] else None,
+                FORMAS_NUBES["MEDIAS"][int(rng.integers(3))] if nubes["MEDIAS"] else None,
+                nubes["MEDIAS"],
+                FORMAS_NUBES["ALTAS"][int(rng.integers(3))] if nubes["ALTAS"] else None,
+                nubes["ALTAS"],
+                round(rng.uniform(5, 30), 1),
+                int(rng.integers(0, 100)),
+            ])
+    return rows
+
+
+def normales_rows(stations, variable):
+    """
+    Hoja de normales: encabezado en la fila 2, departamento en C, estación en D y meses en L:W
+    """
+
+    rows = [
+        [f"NORMALES CLIMATICAS 1991-2020 - {variable}"],
+        ["N°", "CODIGO", "DEPARTAMENTO", "NOMBRE ESTACION", "PROVINCIA", "DISTRITO", "LATITUD",
+         "LONGITUD", "ALTITUD", "TIPO", "PERIODO"] + [convert_month(m).capitalize() for m in range(1, 13)],
+    ]
+    for i, station in enumerate(stations.itertuples()):
+        rows.append([i + 1, f"{100000 + i}", "PUNO", station.ESTACION, "PUNO", "PUNO", station.LATITUD,
+                     station.LONGITUD, station.ALTITUD, "CO", "1991-2020"] + list(getattr(station, variable)))
+    # Estaciones de otros departamentos que el loader descarta
+    rows.append([len(stations) + 1, "200000", "CUSCO", "SICUANI", "CANCHIS", "SICUANI", -14.25, -71.23,
+                 3574, "CO", "1991-2020"] + [0.0] * 12)
+    return rows
+
+
+def metadata_rows(stations):
+    """
+    Hoja GEOGRAFICAS con las columnas que usa la planilla (A:G)
+    """
+
+    rows = [["ESTACION", "LATITUD", "LONGITUD", "ALTITUD", "DEPARTAMENTO", "PROVINCIA", "DISTRITO"]]
+    for station in stations.itertuples():
+        rows.append([station.ESTACION, station.LATITUD, station.LONGITUD, station.ALTITUD, "PUNO", "PUNO", "PUNO"])
+    return rows
+
+
+def write_month(destino, stations, series, fechas, year, month, missing_days, planillas, diario, seed):
+    """
+    Escribe los archivos diarios, el mensual y las planillas de un mes
+
+    Returns:
+        Cantidad de archivos escritos
+    """
+
+    rng = np.random.default_rng([seed, year, month])
+    inicio = fechas.get_loc(pd.Timestamp(year, month, 1))
+    day_slice = slice(inicio, inicio + calendar.monthrange(year, month)[1])
+    written = 0
+
+    for day_index in range(day_slice.start, day_slice.stop):
+        if not diario or day_index in missing_days:
+            continue
+        fecha = fechas[day_index]
+        rows = daily_rows(stations, series, day_index, fecha)
+        save_workbook({"Hoja1": rows}, os.path.join(destino, path_registro_diario(year, month, fecha.day)))
+        written += 1
+
+    rows = monthly_rows(stations, series, day_slice, year, month)
+    save_workbook({"METEO": rows}, os.path.join(destino, path_registro_mensual(year, month)))
+    written += 1
+
+    for i, station in enumerate(stations["ESTACION"][:planillas]):
+        rows = planilla_rows(i, series, day_slice, fechas, rng)
+        save_workbook({station: rows}, os.path.join(destino, path_planilla(station, year, month)))
+        written += 1
+
+    return written
+
+
+def generate(destino, desde, hasta, estaciones, missing_rate=0.0, missing_days_rate=0.0, planillas=None,
+             diario=True, workers=1, seed=0):
+    """
+    Genera todos los libros para los años [desde, hasta]
+
+    Returns:
+        Cantidad de archivos escritos
+    """
+
+    if estaciones < len(ZONAS):
+        raise ValueError(f"Se necesitan al menos {len(ZONAS)} estaciones (una por zona)")
+    if estaciones * 3 > COLUMNAS_METEO:
+        print(f"Aviso: la hoja METEO tendrá {estaciones * 3} columnas; el loader solo lee B:FU "
+              f"({COLUMNAS_METEO // 3} estaciones)")
+
+    rng = np.random.default_rng(seed)
+    stations = build_stations(estaciones, rng)
+    fechas = pd.date_range(f"{desde}-01-01", f"{hasta}-12-31", freq="D")
+    series = build_series(stations, fechas, missing_rate, rng)
+    missing_days = set(np.flatnonzero(rng.random(len(fechas)) < missing_days_rate).tolist())
+    planillas = estaciones if planillas is None else planillas
+
+    principal = os.path.join(destino, cf.DIRECTORIO_PRINCIPAL)
+    save_workbook({variable: normales_rows(stations, variable) for variable in ("TMAX", "TMIN", "PP")},
+                  os.path.join(principal, cf.DIRECTORIO_REGISTRO_NORMAL, cf.ARCHIVO_EXCEL_NORMALES))
+    save_workbook({"GEOGRAFICAS": metadata_rows(stations)},
+                  os.path.join(principal, cf.DIRECTORIO_METADATA, cf.ARCHIVO_EXCEL_METADATA))
+
+    months = [(year, month) for year in range(desde, hasta + 1) for month in range(1, 13)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_month, destino, stations, series, fechas, year, month,
+                                   missing_days, planillas, diario, seed) for year, month in months]
+        return 2 + sum(future.result() for future in futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destino", required=True, help="Directorio de salida")
+    parser.add_argument("--desde", type=int, required=True, help="Primer año")
+    parser.add_argument("--hasta", type=int, help="Último año (por defecto igual a --desde)")
+    parser.add_argument("--estaciones", type=int, default=42)
+    parser.add_argument("--faltantes", type=float, default=0.0, help="Proporción de valores faltantes")
+    parser.add_argument("--dias-faltantes", type=float, default=0.0, help="Proporción de días sin registro diario")
+    parser.add_argument("--planillas", type=int, help="Estaciones con planilla (por defecto todas)")
+    parser.add_argument("--sin-diario", action="store_true", help="No generar el registro diario")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    written = generate(args.destino, args.desde, args.hasta or args.desde, args.estaciones, args.faltantes,
+                       args.dias_faltantes, args.planillas, not args.sin_diario, args.workers, args.semilla)
+    print(f"{written} archivos generados en {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
-from data.file_managment import get_registro_diario, convert_month
-from dash import Output, Input, State, callback, dcc, html
+from data.file_managment import (ArchivoNoEncontrado, get_registro_diario, get_available_days, convert_month,
+                                 current_version, path_registro_diario)
+from dash import ClientsideFunction, Output, Input, State, callback, clientside_callback, ctx, dcc, html
 from dash_iconify import DashIconify
 from plotly.subplots import make_subplots
 from datetime import date, datetime
-from cache import data_cache
+from cache import data_cache, figure_cache
+from data.anomalies import daily_station_values, period_summary
+from data.archive import VARIABLES
+from data.climatology import climatology
+from data.stations import take_by_code
+from data.validation import flag_counts, frame_flags, mask_flagged
+from metrics import stage
+from plotly.io.json import to_json_plotly
+from ui.encoding import encode_float32
+from ui.mapa_interpolado import build_map_figure, create_map_paper
 import dash_mantine_components as dmc
 import plotly.graph_objects as go
 
@@ -13,6 +23,11 @@ DICCIONARIO_VARIABLES = {
     'PP' : 'precipitación'
 }
 
+ZONAS = ["SELVA Y VALLES INTERANDINOS", "ALTIPLANO NORTE", "ALTIPLANO CENTRO", "ALTIPLANO SUR"]
+
+# Meses, terminando en el de la fecha elegida, cuyas fechas sin registro se deshabilitan
+MESES_FECHAS_FALTANTES = 12
+
 def registro_diario_layout():
     content = dmc.MantineProvider([
         dmc.Container([
@@ -36,7 +51,9 @@ def registro_diario_layout():
                                 id="registro-diario-date-selector",
                                 label="Selecciona una fecha a analizar",
                                 minDate=date(1985, 1, 1),
+                                maxDate=date.today(),
                                 value=None,
+                                disabledDates=[],
                                 size="lg",
                                 w=400
                             )
@@ -44,7 +61,16 @@ def registro_diario_layout():
                         cols=2,
                         spacing="md"
                     ),
-                    dmc.Group(justify="flex-end", children=[
+                    dmc.Group(justify="space-between", children=[
+                        dmc.SegmentedControl(
+                            id="tipo-grafico-diario",
+                            value="auto",
+                            data=[
+                                {"value" : "auto", "label" : "Automático"},
+                                {"value" : "lineas", "label" : "Líneas"},
+                                {"value" : "barras", "label" : "Barras"},
+                            ]
+                        ),
                         dmc.Button("Cargar Datos", id='cargar-datos-btn-diario',
                                   leftSection=DashIconify(icon="mdi:refresh", width=20), size="md", variant="filled")
                     ]),
@@ -54,148 +80,234 @@ def registro_diario_layout():
         ],
         strategy="grid",
         fluid=True),
-        dcc.Graph(id="registro-diario-graph")
+        dcc.Store(id="registro-diario-store"),
+        dcc.Store(id="registro-diario-layout-base", data=get_base_layout()),
+        dcc.Graph(id="registro-diario-graph", figure=go.Figure(layout=dict(
+            title="Selecciona una fecha y presiona 'Cargar Datos'",
+            template='plotly_white'
+        ))),
+        create_map_paper("diario", variable_selector=False)
     ])
 
     return content
 
 
-@callback(
-    [Output('registro-diario-graph', 'figure'), Output('loading-status-diario', 'children')],
-    [Input('cargar-datos-btn-diario', 'n_clicks')],
-    [State('variable-selector', 'value'), State('registro-diario-date-selector', 'value')]
-)
-def create_graph(n_clicks, variable, fecha):
-    if not n_clicks or not fecha:
-        empty_fig = go.Figure(layout=dict(
-            title="Selecciona una fecha y presiona 'Cargar Datos'",
-            template='plotly_white'
-        ))
-        return empty_fig, None
-    formato_fecha = "%Y-%m-%d"
-    nuevo_formato_fecha = "%d/%m/%Y"
-    fecha_obj = datetime.strptime(fecha, formato_fecha)
-    zonas = ["SELVA Y VALLES INTERANDINOS", "ALTIPLANO NORTE", "ALTIPLANO CENTRO", "ALTIPLANO SUR"]
+def get_missing_dates(fecha_obj):
+    """
+    Fechas sin registro diario en los MESES_FECHAS_FALTANTES meses que terminan en
+    el de fecha_obj, para deshabilitarlas en el selector. Usa solo el listado de
+    carpetas (el índice de disponibilidad cuando está activo).
+    """
+
+    indice_mes = fecha_obj.year * 12 + fecha_obj.month - 1
+    meses = [date(indice // 12, indice % 12 + 1, 1) for indice in range(indice_mes - MESES_FECHAS_FALTANTES + 1, indice_mes + 1)]
+    missing = []
+
+    for mes in meses:
+        try:
+            available = set(get_available_days(mes.year, mes.month))
+        except ArchivoNoEncontrado:
+            continue
+        dia = mes
+        while dia.month == mes.month and dia <= date.today():
+            if dia.day not in available:
+                missing.append(dia.isoformat())
+            dia = date.fromordinal(dia.toordinal() + 1)
+
+    return missing
 
-    if data_cache.get(fecha) is None:
-        data_cache[fecha] = get_registro_diario(
-            year=fecha_obj.year,
-            month=fecha_obj.month,
-            day=fecha_obj.day,
+
+def get_base_layout():
+    """
+    Layout de la figura de 4 zonas, construido una sola vez por proceso.
+
+    El navegador lo recibe con la página y solo le agrega las trazas y el título.
+    """
+
+    if "LAYOUT_DIARIO" not in data_cache:
+        fig = make_subplots(
+                rows=2,
+                cols=2,
+                subplot_titles=ZONAS,
+                vertical_spacing=0.12,
+                horizontal_spacing=0.08,
+            )
+
+        fig.update_layout(
+            title={
+                'x' : 0.5,
+                'xanchor' : 'center',
+                'font' : { 'size' : 35 }
+            },
+            height=1400,
+            showlegend=True,
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1,
+                xanchor="center",
+                x=0.5
+            ),
+            margin=dict(t=100, b=50, l=50, r=50)
         )
 
-    data_registro_diario = data_cache[fecha]
-    data_normal = data_cache[f"NORMAL_{variable}"][convert_month(fecha_obj.month)]
+        fig.update_xaxes(
+            tickangle=-45,
+            showgrid=True,
+            gridwidth=1,
+            gridcolor='lightgray'
+        )
 
-    fig = make_subplots(
-            rows=2,
-            cols=2,
-            subplot_titles=zonas,
-            vertical_spacing=0.12,
-            horizontal_spacing=0.08,
+        fig.update_yaxes(
+            showgrid=True,
+            gridwidth=1,
+            gridcolor='lightgray'
         )
 
-    color_registro = '#636EFA'
-    color_normal = '#EF553B'
-
-    for i in range(len(zonas)):
-        data_zona = data_registro_diario.loc[zonas[i], variable]
-        estaciones_zona = data_zona.index.to_numpy()
-        data_normal_zona = data_normal.reindex(estaciones_zona)
-
-        if variable == 'PP':
-            # Use bar plot for precipitation
-            fig.add_trace(
-                go.Bar(
-                    x=estaciones_zona,
-                    y=data_zona,
-                    name=f"Registro {fecha_obj.strftime(nuevo_formato_fecha)}",
-                    legendgroup="registro",
-                    showlegend=(i == 0),
-                    marker=dict(color=color_registro)
-                ),
-                row=(i // 2) + 1,
-                col=(i % 2) + 1
-            )
+        data_cache["LAYOUT_DIARIO"] = fig.to_plotly_json()["layout"]
 
-            fig.add_trace(
-                go.Bar(
-                    x=estaciones_zona,
-                    y=data_normal_zona,
-                    name=f"Normal histórica ({convert_month(fecha_obj.month)})",
-                    legendgroup="normal",
-                    showlegend=(i == 0),
-                    marker=dict(color=color_normal)
-                ),
-                row=(i // 2) + 1,
-                col=(i % 2) + 1
-            )
-        else:
-            # Use line plot for temperature
-            fig.add_trace(
-                go.Scatter(
-                    x=estaciones_zona,
-                    y=data_zona,
-                    mode='lines+markers',
-                    name=f"Registro {fecha_obj.strftime(nuevo_formato_fecha)}",
-                    legendgroup="registro",
-                    showlegend=(i == 0),
-                    line=dict(color=color_registro, width=2),
-                    marker=dict(size=8)
-                ),
-                row=(i // 2) + 1,
-                col=(i % 2) + 1
-            )
+    return data_cache["LAYOUT_DIARIO"]
+
+
+def build_daily_payload(fecha_obj, data_registro_diario):
+    """
+    Arma el payload compacto de un día: valores por zona de las tres variables
+    y las normales del mes, como arreglos float32 en base64. Si hay climatología
+    agrega P10/P90 del día del año y la anomalía respecto de su media.
+    """
+
+    nuevo_formato_fecha = "%d/%m/%Y"
+    mes = convert_month(fecha_obj.month)
+    variables = list(DICCIONARIO_VARIABLES)
+
+    payload = {
+        "fecha" : fecha_obj.strftime(nuevo_formato_fecha),
+        "mes" : mes,
+        "estaciones" : [],
+        "registro" : {variable: [] for variable in variables},
+        "normal" : {variable: [] for variable in variables}
+    }
+    if climatology.version() is not None:
+        for clave in ("p10", "p90", "anomalia"):
+            payload[clave] = {variable: [] for variable in variables}
 
-            fig.add_trace(
-                go.Scatter(
-                    x=estaciones_zona,
-                    y=data_normal_zona,
-                    mode='lines+markers',
-                    name=f"Normal histórica ({convert_month(fecha_obj.month)})",
-                    legendgroup="normal",
-                    showlegend=(i == 0),
-                    line=dict(color=color_normal, width=2),
-                    marker=dict(size=8)
-                ),
-                row=(i // 2) + 1,
-                col=(i % 2) + 1
+    for zona in ZONAS:
+        data_zona = data_registro_diario.loc[zona]
+        codigos_zona = data_zona["CODIGO"].to_numpy()
+        payload["estaciones"].append(data_zona.index.tolist())
+
+        for variable in variables:
+            data_normal = data_cache[f"NORMAL_{variable}"][mes].to_numpy()
+            payload["registro"][variable].append(encode_float32(data_zona[variable].to_numpy()))
+            payload["normal"][variable].append(encode_float32(take_by_code(data_normal, codigos_zona)))
+
+        if "p10" in payload:
+            clima = climatology.lookup_day(fecha_obj, data_zona.index.tolist())
+            for variable in variables:
+                j = VARIABLES.index(variable)
+                payload["p10"][variable].append(encode_float32(clima["P10"][:, j]))
+                payload["p90"][variable].append(encode_float32(clima["P90"][:, j]))
+                anomalia = data_zona[variable].to_numpy(dtype=float) - clima["MEDIA"][:, j]
+                payload["anomalia"][variable].append(encode_float32(anomalia))
+
+    return payload
+
+
+@callback(
+    [Output('registro-diario-store', 'data'), Output('loading-status-diario', 'children')],
+    [Input('cargar-datos-btn-diario', 'n_clicks'), Input('registro-diario-date-selector', 'value')]
+)
+def load_daily_payload(n_clicks, fecha):
+    if not fecha:
+        return None, None
+    formato_fecha = "%Y-%m-%d"
+    nuevo_formato_fecha = "%d/%m/%Y"
+    fecha_obj = datetime.strptime(fecha, formato_fecha)
+
+    # "Cargar Datos" vuelve a descargar el archivo del día por si fue modificado;
+    # también se descarga de nuevo si el índice reporta otro eTag
+    recargar = ctx.triggered_id == 'cargar-datos-btn-diario'
+    version_indice = current_version(path_registro_diario(fecha_obj.year, fecha_obj.month, fecha_obj.day))
+    if version_indice is not None and data_cache.get(fecha) is not None:
+        recargar = recargar or data_cache[fecha].attrs.get("version") != version_indice
+    if recargar or data_cache.get(fecha) is None:
+        try:
+            data_cache[fecha] = mask_flagged(get_registro_diario(
+                year=fecha_obj.year,
+                month=fecha_obj.month,
+                day=fecha_obj.day,
+            ))
+        except ArchivoNoEncontrado:
+            return None, dmc.Alert(
+                f"No hay registro diario para {fecha_obj.strftime(nuevo_formato_fecha)}",
+                color="yellow",
+                icon=DashIconify(icon="mdi:alert")
             )
 
-    fig.update_layout(
-        title={
-            'text' : f"Análisis de {DICCIONARIO_VARIABLES[variable]} - {fecha_obj.strftime(nuevo_formato_fecha)}",
-            'x' : 0.5,
-            'xanchor' : 'center',
-            'font' : { 'size' : 35 }
-        },
-        height=1400,
-        showlegend=True,
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1,
-            xanchor="center",
-            x=0.5
-        ),
-        margin=dict(t=100, b=50, l=50, r=50)
-    )
+    version_diario = data_cache[fecha].attrs.get("version")
+    if recargar:
+        figure_cache.invalidate(lambda key: key[0] == fecha and key[2] != version_diario)
 
-    fig.update_xaxes(
-        tickangle=-45,
-        showgrid=True,
-        gridwidth=1,
-        gridcolor='lightgray'
-    )
+    cache_key = (fecha, data_cache.get("NORMALES_VERSION"), version_diario, climatology.version())
+    payload = figure_cache.get(cache_key)
+    if payload is None:
+        with stage("figura", "diario"):
+            payload = build_daily_payload(fecha_obj, data_cache[fecha])
+        with stage("serializacion", "diario"):
+            payload = to_json_plotly(payload)
+        figure_cache.set(cache_key, payload)
 
-    fig.update_yaxes(
-        showgrid=True,
-        gridwidth=1,
-        gridcolor='lightgray'
-    )
+    banderas = frame_flags(data_cache[fecha])
+    marcadas = flag_counts(banderas) if banderas is not None else {}
+    if marcadas:
+        detalle = ", ".join(f"{nombre}: {conteo}" for nombre, conteo in marcadas.items())
+        return payload, dmc.Alert(
+            f"Datos cargados para {fecha_obj.strftime(nuevo_formato_fecha)} | "
+            f"Valores omitidos por validación ({detalle})",
+            color="yellow",
+            icon=DashIconify(icon="mdi:alert")
+        )
 
-    return fig, dmc.Alert(
+    return payload, dmc.Alert(
         f"Datos cargados para {fecha_obj.strftime(nuevo_formato_fecha)}",
         color="green",
         icon=DashIconify(icon="mdi:check-circle")
     )
+
+
+@callback(
+    Output('mapa-diario', 'figure'),
+    [Input('registro-diario-store', 'data'), Input('variable-selector', 'value'), Input('modo-mapa-diario', 'value')],
+    State('registro-diario-date-selector', 'value'),
+    prevent_initial_call=True
+)
+def update_daily_map(payload, variable, modo, fecha):
+    if not payload or not fecha or data_cache.get(fecha) is None:
+        return go.Figure(layout=dict(title="Carga datos para ver el mapa", template='plotly_white'))
+
+    # Los pesos de interpolación quedan en cache: cambiar de fecha o variable es un producto matriz-vector
+    fecha_obj = datetime.strptime(fecha, "%Y-%m-%d")
+    resumen, anomalia = period_summary(daily_station_values(data_cache[fecha]), [fecha_obj])
+    titulo = f"{DICCIONARIO_VARIABLES[variable]} del {fecha_obj.strftime('%d/%m/%Y')}"
+    return build_map_figure(resumen, anomalia, variable, modo, titulo)
+
+
+@callback(
+    Output('registro-diario-date-selector', 'disabledDates'),
+    Input('registro-diario-date-selector', 'value')
+)
+def update_disabled_dates(fecha):
+    # También corre al cargar la página, así el layout no lista el almacenamiento en cada render
+    if not fecha:
+        return get_missing_dates(date.today())
+    return get_missing_dates(datetime.strptime(fecha, "%Y-%m-%d").date())
+
+
+# El cambio de variable o de tipo de gráfico se resuelve en el navegador
+# (assets/control_diario.js) a partir del payload ya descargado.
+clientside_callback(
+    ClientsideFunction(namespace="diario", function_name="render_figure"),
+    Output('registro-diario-graph', 'figure'),
+    [Input('registro-diario-store', 'data'), Input('variable-selector', 'value'), Input('tipo-grafico-diario', 'value')],
+    State('registro-diario-layout-base', 'data')
+)
@@ -3,8 +3,18 @@ import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 import plotly.graph_objects as go
 from datetime import datetime
-from data.file_managment import get_registro_mensual, convert_month
+from data.file_managment import (ArchivoNoEncontrado, get_registro_mensual, get_registros_mensuales, get_available_months, convert_month,
+                                 current_version, path_registro_mensual)
 from cache import data_cache
+from data.anomalies import period_summary, station_day_matrix
+from data.archive import ANIO_INICIO, VARIABLES, variable_key
+from data.climatology import climatology
+from data.stations import SIN_CODIGO, station_registry
+from data.validation import mask_flagged
+from metrics import timed
+from ui.encoding import encode_dates
+from ui.mapa_interpolado import build_map_figure, create_map_paper
+import numpy as np
 import pandas as pd
 
 COLORS = {
@@ -40,17 +50,77 @@ def get_monthly_data_cached(year, month):
     Obtiene datos mensuales con cache por mes
     """
 
+    if not is_monthly_data_cached(year, month):
+        store_monthly_data(year, month, get_registro_mensual(year, month))
+
+    return data_cache[f"MENSUAL_{year}_{month:02d}"]
+
+
+def is_monthly_data_cached(year, month):
+    """
+    Indica si el mes está en cache y coincide con el eTag del índice
+    """
+
     cache_key = f"MENSUAL_{year}_{month:02d}"
 
-    if cache_key not in data_cache:
-        df_mes = get_registro_mensual(year, month)
-        days_in_month = len(df_mes)
-        fechas_mes = pd.date_range(start=f"{year}-{month:02d}-01", periods=days_in_month, freq='D')
-        data_cache[cache_key] = (df_mes, fechas_mes.tolist())
+    # Si el índice reporta un eTag distinto, el archivo cambió en OneDrive
+    version = current_version(path_registro_mensual(year, month))
+    if cache_key in data_cache and version is not None and data_cache[cache_key][0].attrs.get("version") != version:
+        del data_cache[cache_key]
+
+    return cache_key in data_cache
+
+
+def store_monthly_data(year, month, df_mes):
+    """
+    Guarda en cache el Dataframe del mes junto con sus fechas, con las celdas
+    marcadas por la validación ya en NaN
+    """
+
+    df_mes = mask_flagged(df_mes)
+    days_in_month = len(df_mes)
+    fechas_mes = pd.date_range(start=f"{year}-{month:02d}-01", periods=days_in_month, freq='D')
+    data_cache[f"MENSUAL_{year}_{month:02d}"] = (df_mes, fechas_mes)
+
+
+def prefetch_monthly_data(months):
+    """
+    Descarga por lotes los meses que faltan en cache (una resolución $batch
+    y descargas en paralelo en vez de una solicitud por archivo)
+    """
+
+    to_fetch = [(year, month) for year, month in months if not is_monthly_data_cached(year, month)]
+    if len(to_fetch) < 2:
+        return
+
+    for (year, month), df_mes in get_registros_mensuales(to_fetch).items():
+        if not isinstance(df_mes, Exception):
+            store_monthly_data(year, month, df_mes)
+
+
+def load_months(months):
+    """
+    Dataframes y fechas de los meses (año, mes) con registro, desde la cache o
+    descargados por lotes, y los nombres de los meses sin registro
+    """
+
+    # Meses sin archivo según el índice, antes de descargar nada
+    available = {year: set(get_available_months(year)) for year in {year for year, _ in months}}
+    missing = [f"{convert_month(month)} {year}" for year, month in months if month not in available[year]]
+    prefetch_monthly_data([(year, month) for year, month in months if month in available[year]])
 
-    return data_cache[cache_key]
+    frames = []
+    for year, month in months:
+        if month not in available[year]:
+            continue
+        try:
+            frames.append(get_monthly_data_cached(year, month))
+        except ArchivoNoEncontrado:
+            missing.append(f"{convert_month(month)} {year}")
+    return frames, missing
 
 
+@timed("transformacion", "mensual")
 def extract_station_data(df, estacion):
     """
     Extrae TMAX, TMIN, PP de una estación desde DataFrame con MultiIndex
@@ -58,104 +128,127 @@ def extract_station_data(df, estacion):
 
     result = {'TMAX': None, 'TMIN': None, 'PP': None}
 
-    for col in df.columns:
-        if isinstance(col, tuple) and len(col) == 2:
-            estacion_col, variable_col = col
-            if estacion_col == estacion:
-                var_str = str(variable_col).upper().strip()
-                if 'MAX' in var_str and result['TMAX'] is None:
-                    result['TMAX'] = pd.to_numeric(df[col], errors='coerce').tolist()
-                elif 'MIN' in var_str and result['TMIN'] is None:
-                    result['TMIN'] = pd.to_numeric(df[col], errors='coerce').tolist()
-                elif ('PP' in var_str or 'PREC' in var_str) and result['PP'] is None:
-                    result['PP'] = pd.to_numeric(df[col], errors='coerce').tolist()
-
-    if None in result.values():
+    codigo = station_registry.code(estacion)
+    if codigo == SIN_CODIGO or not isinstance(df.columns, pd.MultiIndex) or df.columns.nlevels != 2:
+        return None
+
+    # Columnas de la estación por código, sin comparar nombres columna por columna
+    codigos_columnas = station_registry.codes(df.columns.get_level_values(0))
+    for posicion in np.flatnonzero(codigos_columnas == codigo):
+        variable = variable_key(df.columns[posicion][1])
+        if variable is not None and result[variable] is None:
+            result[variable] = column_values(df, posicion)
+
+    if any(values is None for values in result.values()):
         return None
     return result
 
 
-def get_normal_values(estacion, fechas):
+def column_values(df, posicion):
     """
-    Obtiene valores normales para una estación en rango de fechas
+    Valores float32 de una columna; las columnas del registro mensual ya vienen
+    tipadas desde la carga, solo las que tienen texto se convierten aquí
     """
 
-    df_tmax = data_cache.get('NORMAL_TMAX')
-    df_tmin = data_cache.get('NORMAL_TMIN')
-    df_pp = data_cache.get('NORMAL_PP')
+    values = df.iloc[:, posicion]
+    if values.dtype == np.float32:
+        return values.to_numpy()
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float32)
+
 
-    result = {'TMAX': [], 'TMIN': [], 'PP': []}
+@timed("transformacion", "mensual")
+def get_normal_values(estacion, fechas):
+    """
+    Obtiene valores normales para una estación en rango de fechas
+    """
 
-    for fecha in fechas:
-        fecha_ts = pd.Timestamp(fecha) if not isinstance(fecha, pd.Timestamp) else fecha
-        mes_nombre = convert_month(fecha_ts.month)
+    meses = pd.DatetimeIndex(fechas).month.to_numpy() - 1
+    codigo = station_registry.code(estacion)
+    result = {}
 
-        for var_name, df_normal in [('TMAX', df_tmax), ('TMIN', df_tmin), ('PP', df_pp)]:
-            if df_normal is not None and estacion in df_normal.index:
-                val = df_normal.loc[estacion, mes_nombre]
-                result[var_name].append(val if pd.notna(val) else None)
-            else:
-                result[var_name].append(None)
+    for var_name in ['TMAX', 'TMIN', 'PP']:
+        df_normal = data_cache.get(f'NORMAL_{var_name}')
+        if df_normal is not None and codigo != SIN_CODIGO:
+            normales_mes = pd.to_numeric(df_normal[[convert_month(m) for m in range(1, 13)]].iloc[codigo], errors='coerce')
+            result[var_name] = normales_mes.to_numpy(dtype=np.float32)[meses]
+        else:
+            result[var_name] = np.full(len(meses), np.nan, dtype=np.float32)
 
     return result
 
 
+@timed("transformacion", "mensual")
 def make_precipitation_cumulative(pp_values, fechas):
     """
     Convierte valores de precipitación a acumulativo por mes.
     Resetea el acumulado al inicio de cada mes.
 
     Args:
-        pp_values: Lista de valores de precipitación
-        fechas: Lista de fechas correspondientes
+        pp_values: Arreglo de valores de precipitación
+        fechas: Fechas correspondientes
 
     Returns:
-        Lista de valores acumulativos por mes
+        Arreglo float32 de valores acumulativos por mes (NaN mientras el acumulado es 0)
     """
-    if not pp_values or not fechas or len(pp_values) != len(fechas):
+    if pp_values is None or fechas is None or len(pp_values) == 0 or len(pp_values) != len(fechas):
         return pp_values
 
-    cumulative = []
-    current_month = None
-    month_sum = 0
-
-    for i, fecha in enumerate(fechas):
-        fecha_ts = pd.Timestamp(fecha) if not isinstance(fecha, pd.Timestamp) else fecha
-        month_key = (fecha_ts.year, fecha_ts.month)
+    fechas = pd.DatetimeIndex(fechas)
+    pp = pd.Series(np.nan_to_num(np.asarray(pp_values, dtype=np.float32), nan=0.0))
+    cumulative = pp.groupby([fechas.year, fechas.month]).cumsum().to_numpy(dtype=np.float32)
+    cumulative[cumulative <= 0] = np.nan
 
-        # Si cambiamos de mes, reiniciar el acumulado
-        if current_month != month_key:
-            current_month = month_key
-            month_sum = 0
+    return cumulative
 
-        # Acumular valor actual
-        val = pp_values[i]
-        if pd.notna(val) and val is not None:
-            month_sum += val
 
-        cumulative.append(month_sum if month_sum > 0 else None)
+def band_color(hex_color, alpha=0.15):
+    """
+    Color hexadecimal como rgba semitransparente para rellenar bandas
+    """
 
-    return cumulative
+    r, g, b = (int(hex_color[i:i + 2], 16) for i in (1, 3, 5))
+    return f'rgba({r}, {g}, {b}, {alpha})'
 
 
-def add_graph_traces(fig, fechas, data_real, data_normal, estacion, color_key, var_names):
+@timed("figura", "mensual")
+def add_graph_traces(fig, fechas, data_real, data_normal, estacion, color_key, var_names, clima=None):
     """
-    Agrega trazas de datos reales y normales al gráfico
+    Agrega trazas de datos reales y normales al gráfico. Con clima (climatology.lookup)
+    agrega la banda P10-P90 y la anomalía respecto de la media climatológica en el hover.
     """
 
     colors = COLORS[color_key]
     is_station2 = (color_key == 'station2')
 
+    eje_x = encode_dates(fechas)
+
     for var in var_names:
+        if clima is not None:
+            j = VARIABLES.index(var)
+            fig.add_trace(go.Scatter(
+                **eje_x, y=clima["P10"][:, j], mode='lines', line=dict(width=0),
+                legendgroup=f'{estacion}-{var}-clima', showlegend=False, hoverinfo='skip'
+            ))
+            fig.add_trace(go.Scatter(
+                **eje_x, y=clima["P90"][:, j], mode='lines', line=dict(width=0),
+                fill='tonexty', fillcolor=band_color(colors[var.lower()]),
+                name=f'{estacion} - {var} P10–P90', legendgroup=f'{estacion}-{var}-clima', hoverinfo='skip'
+            ))
+
+        extra = {}
+        if clima is not None:
+            extra = dict(customdata=data_real[var] - clima["MEDIA"][:, VARIABLES.index(var)],
+                         hovertemplate='%{y:.1f} (anomalía %{customdata:+.1f})')
         fig.add_trace(go.Scatter(
-            x=fechas, y=data_real[var], mode='lines+markers',
+            **eje_x, y=data_real[var], mode='lines+markers',
             name=f'{estacion} - {var}',
             line=dict(color=colors[var.lower()], width=2, dash='dot' if is_station2 else 'solid'),
-            marker=dict(size=4 if var != 'PP' else 6, symbol='square' if is_station2 else 'circle')
+            marker=dict(size=4 if var != 'PP' else 6, symbol='square' if is_station2 else 'circle'),
+            **extra
         ))
 
         fig.add_trace(go.Scatter(
-            x=fechas, y=data_normal[var], mode='lines',
+            **eje_x, y=data_normal[var], mode='lines',
             name=f'{estacion} - {var} Normal (1991-2020)',
             line=dict(color=colors[f'{var.lower()}_normal'], width=3, dash='dashdot' if is_station2 else 'dash'),
             line_shape='hv'
@@ -234,7 +327,7 @@ def control_semanal_layout():
                                         id="date-range-semanal",
                                         type="range",
                                         value=[],
-                                        minDate=datetime(2020, 1, 1).date(),
+                                        minDate=datetime(ANIO_INICIO, 1, 1).date(),
                                         size="lg"
                                     )
                                 )
@@ -247,19 +340,21 @@ def control_semanal_layout():
                         dmc.Button("Cargar Datos", id='cargar-datos-btn-semanal',
                                   leftSection=DashIconify(icon="mdi:refresh", width=20), size="md", variant="filled")
                     ]),
-                    html.Div(id='loading-status-semanal')
+                    html.Div(id='loading-status-semanal'),
+                    dcc.Store(id='rango-cargado-semanal')
                 ])
             ]),
 
             create_graph_paper("Temperaturas (Máxima y Mínima)", "temperatura-graph-semanal", '500px'),
             create_graph_paper("Precipitación", "precipitacion-graph-semanal", '400px'),
+            create_map_paper("semanal", variable_selector=True),
         ])
     ])
 
 
 @callback(
     [Output('temperatura-graph-semanal', 'figure'), Output('precipitacion-graph-semanal', 'figure'),
-     Output('loading-status-semanal', 'children')],
+     Output('rango-cargado-semanal', 'data'), Output('loading-status-semanal', 'children')],
     [Input('cargar-datos-btn-semanal', 'n_clicks')],
     [State('date-range-semanal', 'value'), State('estacion-selector-1-semanal', 'value'), State('estacion-selector-2-semanal', 'value')]
 )
@@ -269,47 +364,51 @@ def update_graphs_semanal(n_clicks, date_range, estacion1, estacion2):
             title="Selecciona un rango de fechas y presiona 'Cargar Datos'",
             template='plotly_white'
         ))
-        return empty_fig, empty_fig, None
+        return empty_fig, empty_fig, None, no_update
 
     start_date = datetime.fromisoformat(date_range[0]) if isinstance(date_range[0], str) else datetime.combine(date_range[0], datetime.min.time())
     end_date = datetime.fromisoformat(date_range[1]) if isinstance(date_range[1], str) else datetime.combine(date_range[1], datetime.min.time())
 
     if start_date > end_date:
-        return no_update, no_update, dmc.Alert(
+        return no_update, no_update, no_update, dmc.Alert(
             "La fecha de inicio debe ser anterior a la fecha fin", color="red",
             icon=DashIconify(icon="mdi:alert")
         )
     if estacion2 and estacion1 == estacion2:
-        return no_update, no_update, dmc.Alert(
+        return no_update, no_update, no_update, dmc.Alert(
             "Las estaciones deben ser diferentes para comparar", color="yellow",
             icon=DashIconify(icon="mdi:alert")
         )
 
     months_to_load = get_month_range(start_date, end_date)
-    all_data = []
-    all_fechas = []
+    frames, missing_months = load_months(months_to_load)
+    all_data = [df_mes for df_mes, _ in frames]
+    all_fechas = [fechas_mes for _, fechas_mes in frames]
 
-    for year, month in months_to_load:
-        df_mes, fechas_mes = get_monthly_data_cached(year, month)
-        all_data.append(df_mes)
-        all_fechas.extend(fechas_mes)
+    if not all_data:
+        return no_update, no_update, no_update, dmc.Alert(
+            f"No hay registro mensual para: {', '.join(missing_months)}", color="yellow",
+            icon=DashIconify(icon="mdi:alert")
+        )
 
+    # El mapa se dibuja desde este rango con los meses ya en cache, sin volver a descargarlos
+    rango = [start_date.isoformat(), end_date.isoformat()]
     df_combined = pd.concat(all_data, ignore_index=True)
 
-    fechas_series = pd.Series(all_fechas, name='fecha')
+    fechas_series = pd.Series(pd.DatetimeIndex(np.concatenate(all_fechas)), name='fecha')
     mask = (fechas_series >= start_date) & (fechas_series <= end_date)
     df_filtrado = df_combined[mask].reset_index(drop=True)
-    fechas_filtradas = fechas_series[mask].reset_index(drop=True).tolist()
+    fechas_filtradas = pd.DatetimeIndex(fechas_series[mask])
 
     if len(df_filtrado) == 0:
-        return no_update, no_update, dmc.Alert(
+        return no_update, no_update, rango, dmc.Alert(
             "No se encontraron datos en el rango seleccionado", color="yellow",
             icon=DashIconify(icon="mdi:alert")
         )
 
     data1 = extract_station_data(df_filtrado, estacion1)
     if not data1:
-        return no_update, no_update, dmc.Alert(
+        return no_update, no_update, rango, dmc.Alert(
             f"No se encontraron datos para la estación {estacion1}", color="yellow",
             icon=DashIconify(icon="mdi:alert")
         )
@@ -323,7 +422,9 @@ def update_graphs_semanal(n_clicks, date_range, estacion1, estacion2):
     fig_temp = go.Figure()
     fig_pp = go.Figure()
 
-    add_graph_traces(fig_temp, fechas_filtradas, data1, normal1, estacion1, 'station1', ['TMAX', 'TMIN'])
+    # La precipitación se grafica acumulada por mes, así que las bandas diarias solo aplican a temperatura
+    add_graph_traces(fig_temp, fechas_filtradas, data1, normal1, estacion1, 'station1', ['TMAX', 'TMIN'],
+                     climatology.lookup(estacion1, fechas_filtradas))
     add_graph_traces(fig_pp, fechas_filtradas, data1_pp_cumulative, normal1, estacion1, 'station1', ['PP'])
 
     if estacion2:
@@ -335,18 +436,19 @@ def update_graphs_semanal(n_clicks, date_range, estacion1, estacion2):
             data2_pp_cumulative = data2.copy()
             data2_pp_cumulative['PP'] = make_precipitation_cumulative(data2['PP'], fechas_filtradas)
 
-            add_graph_traces(fig_temp, fechas_filtradas, data2, normal2, estacion2, 'station2', ['TMAX', 'TMIN'])
+            add_graph_traces(fig_temp, fechas_filtradas, data2, normal2, estacion2, 'station2', ['TMAX', 'TMIN'],
+                             climatology.lookup(estacion2, fechas_filtradas))
             add_graph_traces(fig_pp, fechas_filtradas, data2_pp_cumulative, normal2, estacion2, 'station2', ['PP'])
 
     fig_temp.update_layout(
-        xaxis=dict(title="Fecha", tickformat='%d/%m/%Y'),
+        xaxis=dict(title="Fecha", type='date', tickformat='%d/%m/%Y'),
         yaxis=dict(title="Temperatura (°C)"),
         hovermode='x unified', template='plotly_white', height=500,
         legend=dict(orientation="v", yanchor="top", y=0.99, xanchor="left", x=1.01)
     )
 
     fig_pp.update_layout(
-        xaxis=dict(title="Fecha", tickformat='%d/%m/%Y'),
+        xaxis=dict(title="Fecha", type='date', tickformat='%d/%m/%Y'),
         yaxis=dict(title="Precipitación Acumulada por Mes (mm)"),
         hovermode='x unified', template='plotly_white', height=400,
         legend=dict(orientation="v", yanchor="top", y=0.99, xanchor="left", x=1.01)
@@ -359,5 +461,33 @@ def update_graphs_semanal(n_clicks, date_range, estacion1, estacion2):
         status_msg = f" Datos cargados: {len(fechas_filtradas)} días de {num_meses} meses"
     if estacion2 and data2:
         status_msg += " | Comparando 2 estaciones"
+    if missing_months:
+        status_msg += f" | Sin registro: {', '.join(missing_months)}"
+        return fig_temp, fig_pp, rango, dmc.Alert(status_msg, color="yellow", icon=DashIconify(icon="mdi:alert"))
+
+    return fig_temp, fig_pp, rango, dmc.Alert(status_msg, color="green", icon=DashIconify(icon="mdi:check-circle"))
+
 
-    return fig_temp, fig_pp, dmc.Alert(status_msg, color="green", icon=DashIconify(icon="mdi:check-circle"))
+@callback(
+    Output('mapa-semanal', 'figure'),
+    [Input('rango-cargado-semanal', 'data'), Input('variable-mapa-semanal', 'value'),
+     Input('modo-mapa-semanal', 'value')],
+    prevent_initial_call=True
+)
+def update_map_semanal(rango, variable, modo):
+    if not rango:
+        return no_update
+
+    start_date, end_date = (datetime.fromisoformat(fecha) for fecha in rango)
+    frames, _ = load_months(get_month_range(start_date, end_date))
+    if not frames:
+        return go.Figure(layout=dict(title="No hay registro mensual en el rango", template='plotly_white'))
+
+    valores = np.concatenate([station_day_matrix(df_mes) for df_mes, _ in frames], axis=1)
+    fechas = pd.DatetimeIndex(np.concatenate([fechas_mes for _, fechas_mes in frames]))
+    mask = (fechas >= start_date) & (fechas <= end_date)
+    resumen, anomalia = period_summary(valores[:, mask], fechas[mask])
+
+    titulo = (f"{'precipitación total' if variable == 'PP' else f'{variable} media'} "
+              f"del {start_date:%d/%m/%Y} al {end_date:%d/%m/%Y}")
+    return build_map_figure(resumen, anomalia, variable, modo, titulo)
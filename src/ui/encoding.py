@@ -0,0 +1,33 @@
+import base64
+import pandas as pd
+
+
+def encode_float32(values):
+    """
+    Codifica una secuencia numérica como arreglo tipado de Plotly (float32 en base64)
+
+    Los valores no numéricos se convierten en NaN, que Plotly dibuja como huecos.
+    """
+
+    array = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype='<f4')
+    return {"dtype": "f4", "bdata": base64.b64encode(array.tobytes()).decode("ascii")}
+
+
+def encode_dates(fechas):
+    """
+    Eje x de fechas en forma compacta para una traza de Plotly
+
+    Una serie diaria continua se envía solo como inicio (x0) y paso en ms (dx);
+    en otro caso se envían los milisegundos desde epoch como float64 en base64.
+    Requiere xaxis.type='date' en el layout.
+    """
+
+    fechas = pd.DatetimeIndex(fechas)
+    if len(fechas) == 0:
+        return {"x": []}
+
+    epoch_ms = fechas.as_unit('ms').asi8.astype('<f8')
+    pasos = pd.unique(epoch_ms[1:] - epoch_ms[:-1])
+    if len(pasos) <= 1:
+        return {"x0": fechas[0].isoformat(), "dx": float(pasos[0]) if len(pasos) else 86_400_000.0}
+    return {"x": {"dtype": "f8", "bdata": base64.b64encode(epoch_ms.tobytes()).decode("ascii")}}
@@ -0,0 +1,135 @@
+from dash import html, callback, Input, Output, State
+import dash_mantine_components as dmc
+from dash_iconify import DashIconify
+from cache import data_cache
+from data.events import CONDICIONES, OPERADORES, event_index
+from metrics import stage
+import numpy as np
+import time
+
+# Filas que se muestran en la tabla de resultados
+MAX_FILAS = 200
+
+ETIQUETAS_CONDICIONES = {
+    "helada": "Heladas (TMIN < 0 °C)",
+    "seco": "Días secos (PP < 1 mm)",
+    "lluvioso": "Días lluviosos (PP ≥ 1 mm)",
+}
+
+
+def eventos_layout():
+    """
+    Crea el layout de búsqueda de eventos extremos
+    """
+
+    return dmc.Container(fluid=True, style={"padding": "20px"}, children=[
+        dmc.Stack(gap="md", children=[
+            dmc.Paper(p="md", shadow="sm", radius="md", children=[
+                dmc.Stack(gap="xs", children=[
+                    dmc.Title("Eventos Extremos", order=2, c="blue"),
+                    dmc.Text("Búsqueda por umbral, valores extremos y rachas en todo el archivo histórico",
+                             size="sm", c="dimmed")
+                ])
+            ]),
+
+            dmc.Paper(p="md", shadow="sm", radius="md", withBorder=True, children=[
+                dmc.Stack(gap="md", children=[
+                    dmc.SegmentedControl(id="consulta-eventos", value="umbral", data=[
+                        {"value": "umbral", "label": "Umbral"},
+                        {"value": "top", "label": "Extremos (top-k)"},
+                        {"value": "rachas", "label": "Rachas"},
+                    ]),
+                    dmc.Group(grow=True, children=[
+                        dmc.Select(id="variable-eventos", label="Variable", value="TMIN", data=[
+                            {"value": "TMAX", "label": "Temperatura máxima"},
+                            {"value": "TMIN", "label": "Temperatura mínima"},
+                            {"value": "PP", "label": "Precipitación"},
+                        ]),
+                        dmc.Select(id="operador-eventos", label="Condición", value="<",
+                                   data=[{"value": op, "label": op} for op in OPERADORES]),
+                        dmc.NumberInput(id="umbral-eventos", label="Umbral", value=-10, decimalScale=1),
+                        dmc.NumberInput(id="k-eventos", label="Cantidad (top-k)", value=20, min=1, max=MAX_FILAS),
+                    ]),
+                    dmc.Group(grow=True, children=[
+                        dmc.Select(id="condicion-eventos", label="Racha de", value="helada",
+                                   data=[{"value": key, "label": label} for key, label in ETIQUETAS_CONDICIONES.items()] +
+                                        [{"value": "personalizada", "label": "Variable, condición y umbral de arriba"}]),
+                        dmc.NumberInput(id="min-dias-eventos", label="Mínimo de días", value=5, min=1),
+                        dmc.Switch(id="mayores-eventos", label="Top-k de valores más altos", checked=False),
+                    ]),
+                    dmc.Group(grow=True, children=[
+                        dmc.DatesProvider(settings={"locale": "es", "firstDayOfWeek": 1}, children=dmc.DatePickerInput(
+                            id="rango-eventos", label="Rango de fechas (opcional)", type="range", value=[],
+                            clearable=True
+                        )),
+                        dmc.MultiSelect(id="estaciones-eventos", label="Estaciones (todas si está vacío)",
+                                        data=data_cache["LISTA_ESTACIONES"], searchable=True, clearable=True),
+                    ]),
+                    dmc.Group(justify="flex-end", children=[
+                        dmc.Button("Buscar", id='buscar-btn-eventos',
+                                   leftSection=DashIconify(icon="mdi:magnify", width=20), size="md", variant="filled")
+                    ]),
+                    html.Div(id='loading-status-eventos')
+                ])
+            ]),
+
+            dmc.Paper(p="md", shadow="sm", radius="md", withBorder=True, children=[
+                html.Div(id="tabla-eventos")
+            ]),
+        ])
+    ])
+
+
+def results_table(df):
+    """
+    Tabla de resultados con las fechas en formato dd/mm/aaaa
+    """
+
+    filas = []
+    for fila in df.head(MAX_FILAS).itertuples(index=False):
+        filas.append([valor.strftime("%d/%m/%Y") if hasattr(valor, "strftime") else
+                      f"{valor:.1f}" if isinstance(valor, (float, np.floating)) else valor for valor in fila])
+    return dmc.Table(striped=True, highlightOnHover=True, data={"head": list(df.columns), "body": filas})
+
+
+@callback(
+    [Output('tabla-eventos', 'children'), Output('loading-status-eventos', 'children')],
+    Input('buscar-btn-eventos', 'n_clicks'),
+    [State('consulta-eventos', 'value'), State('variable-eventos', 'value'), State('operador-eventos', 'value'),
+     State('umbral-eventos', 'value'), State('k-eventos', 'value'), State('condicion-eventos', 'value'),
+     State('min-dias-eventos', 'value'), State('mayores-eventos', 'checked'), State('rango-eventos', 'value'),
+     State('estaciones-eventos', 'value')],
+    prevent_initial_call=True
+)
+def search_events(n_clicks, consulta, variable, operador, umbral, k, condicion, min_dias, mayores, rango, estaciones):
+    desde, hasta = rango if rango and len(rango) == 2 and all(rango) else (None, None)
+    inicio = time.perf_counter()
+
+    with stage("consulta", "eventos"):
+        if consulta == "umbral":
+            if umbral is None:
+                return None, dmc.Alert("Ingresa un umbral", color="yellow", icon=DashIconify(icon="mdi:alert"))
+            resultado = event_index.threshold(variable, operador, float(umbral), desde, hasta, estaciones)
+            if resultado is not None:
+                # Los más recientes primero: la primera fila responde "¿cuándo fue la última vez?"
+                resultado = resultado.iloc[::-1]
+            descripcion = f"{variable} {operador} {umbral}"
+        elif consulta == "top":
+            resultado = event_index.top_k(variable, int(k or 20), bool(mayores), desde, hasta, estaciones)
+            descripcion = f"{k} valores {'más altos' if mayores else 'más bajos'} de {variable}"
+        else:
+            if condicion == "personalizada":
+                if umbral is None:
+                    return None, dmc.Alert("Ingresa un umbral", color="yellow", icon=DashIconify(icon="mdi:alert"))
+                condicion = (variable, operador, float(umbral))
+            resultado = event_index.runs(condicion, int(min_dias or 1), desde, hasta, estaciones)
+            descripcion = f"rachas de {' '.join(map(str, CONDICIONES.get(condicion, condicion)))} de {min_dias}+ días"
+
+    if resultado is None:
+        return None, dmc.Alert("No hay archivo histórico; ejecuta src/backfill_archive.py para crearlo",
+                               color="yellow", icon=DashIconify(icon="mdi:alert"))
+
+    mensaje = f" {len(resultado)} resultados para {descripcion} en {(time.perf_counter() - inicio) * 1000:.0f} ms"
+    if len(resultado) > MAX_FILAS:
+        mensaje += f" (se muestran {MAX_FILAS})"
+    return results_table(resultado), dmc.Alert(mensaje, color="green", icon=DashIconify(icon="mdi:check-circle"))
@@ -1,13 +1,45 @@
-from data.file_managment import get_planilla_climatologica, convert_month
+from data.file_managment import ArchivoNoEncontrado, get_planilla_climatologica, convert_month
 from dash import Output, Input, State, callback, dcc, html, dash_table, no_update
 from dash_iconify import DashIconify
 from datetime import date, datetime
 from cache import data_cache
+from data.psychrometrics import planilla_psychrometrics
+from data.stations import SIN_CODIGO, station_registry
+from data.validation import flag_counts, frame_flags, mask_flagged
+from metrics import stage, timed
+from ui.rosa_vientos import rosa_vientos_layout
+from copy import copy
+from openpyxl.utils import get_column_letter
 import dash_mantine_components as dmc
+import numpy as np
 import pandas as pd
 import openpyxl
 from io import BytesIO
 
+# Sección 6 de la planilla, a la derecha de la plantilla: 7h, 13h, 19h y media de cada variable
+PRIMERA_COLUMNA_PSICROMETRIA = 49
+TITULOS_PSICROMETRIA = {
+    "HUMEDAD RELATIVA": "Humedad relativa (%)",
+    "TENSION DE VAPOR": "Tensión de vapor (hPa)",
+    "PUNTO DE ROCIO": "Punto de rocío (ºC)",
+}
+
+# Columna de la plantilla donde queda cada columna de la planilla según la lectura del día (0 = 7h, 1 = 13h, 2 = 19h)
+COLUMNAS_PLANTILLA = {
+    "TEMPERATURA MAXIMA DIARIA": {2: 1},
+    "TEMPERATURA MINIMA DIARIA": {0: 2},
+    "TEMPERATURA DEL BULBO SECO DIARIO": {0: 4, 1: 5, 2: 6},
+    "TEMPERATURA BULBO HUMEDO DIARIA": {0: 8, 1: 9, 2: 10},
+    "VELOCIDAD DEL VIENTO DIARIO": {0: 13, 1: 15, 2: 17},
+    "PRECIPITACION": {0: 19, 2: 20},
+    "CANTIDAD DE NUBES BAJAS DIARIAS": {0: 26, 1: 33, 2: 40},
+    "ALTURA DE NUBES BAJAS DIARIAS": {0: 27, 1: 34, 2: 41},
+    "CANTIDAD DE NUBES MEDIAS DIARIAS": {0: 29, 1: 36, 2: 43},
+    "CANTIDAD DE NUBES ALTAS DIARIAS": {0: 31, 1: 38, 2: 45},
+    "VISIBILIDAD PREVALECIENTE DIARIA": {0: 46, 1: 47, 2: 48},
+}
+COLOR_MARCADA = '#ffc9c9'
+
 
 def generacion_planilla_layout():
     """Layout para generacion de planilla climatologica"""
@@ -61,12 +93,14 @@ def generacion_planilla_layout():
             html.Div(id='planilla-table-container', style={'marginTop': '20px'}),
             html.Div(id='export-button-container', style={'marginTop': '20px'}),
             dcc.Download(id="download-planilla-excel")
-        ], fluid=True)
+        ], fluid=True),
+        rosa_vientos_layout()
     ])
 
     return content
 
 
+@timed("transformacion", "planilla")
 def transform_data_to_template(df_raw, station_name, year, month):
     """
     Transform raw data from get_planilla_climatologica to template format
@@ -91,9 +125,11 @@ def transform_data_to_template(df_raw, station_name, year, month):
 
     # Fill in metadata from cache
     metadata_df = data_cache.get('METADATA')
-    if metadata_df is not None and station_name in metadata_df.index:
-        # Get the row for this station (ESTACION is the index)
-        station_metadata = metadata_df.loc[station_name]
+    codigo = station_registry.code(station_name)
+    altitud = np.nan
+    if metadata_df is not None and codigo != SIN_CODIGO:
+        # METADATA is aligned with the station registry: row i is station code i
+        station_metadata = metadata_df.iloc[codigo]
 
         # Fill in geographic coordinates and location data
         # Row 6 (index 5): Latitud (col 7), Departamento (col 12)
@@ -111,6 +147,7 @@ def transform_data_to_template(df_raw, station_name, year, month):
         # Row 8 (index 7): Altitud (col 7), Distrito (col 12)
         if pd.notna(station_metadata.get('ALTITUD')):
             df_template.at[7, 7] = station_metadata['ALTITUD']
+            altitud = pd.to_numeric(station_metadata['ALTITUD'], errors='coerce')
         if pd.notna(station_metadata.get('DISTRITO')):
             df_template.at[7, 12] = station_metadata['DISTRITO']
 
@@ -289,6 +326,9 @@ def transform_data_to_template(df_raw, station_name, year, month):
         if pd.notna(reading_19h.get('VISIBILIDAD PREVALECIENTE DIARIA')):
             df_template.at[template_row, 48] = round(float(reading_19h['VISIBILIDAD PREVALECIENTE DIARIA']), 2)
 
+    # === Humedad (columns 49-60), derived from the dry and wet bulb readings ===
+    add_psychrometric_columns(df_template, df_raw, altitud, num_days, data_rows)
+
     # Calculate precipitation totals (19h of day N + 7h of day N+1)
     # Process all days except the last one
     for day in range(1, num_days):  # num_days-1 iterations (excludes last day)
@@ -373,6 +413,71 @@ def transform_data_to_template(df_raw, station_name, year, month):
     return df_template
 
 
+def add_psychrometric_columns(df_template, df_raw, altitud, num_days, data_rows):
+    """
+    Agrega la sección de humedad: humedad relativa, tensión de vapor y punto de
+    rocío a las 7h, 13h y 19h con su media, calculados para todo el mes a la vez
+    con la presión de la altitud de la estación
+    """
+
+    derivadas = planilla_psychrometrics(df_raw, altitud, num_days)
+    ultima = PRIMERA_COLUMNA_PSICROMETRIA + 4 * len(TITULOS_PSICROMETRIA)
+    for col in range(PRIMERA_COLUMNA_PSICROMETRIA, ultima):
+        # object como las columnas de la plantilla: llevan encabezados de texto y valores
+        df_template[col] = pd.Series(np.nan, index=df_template.index, dtype=object)
+
+    df_template.at[11, PRIMERA_COLUMNA_PSICROMETRIA] = 6
+    df_template.at[12, PRIMERA_COLUMNA_PSICROMETRIA] = 'Humedad (psicrometría)'
+    for i, (variable, titulo) in enumerate(TITULOS_PSICROMETRIA.items()):
+        col = PRIMERA_COLUMNA_PSICROMETRIA + 4 * i
+        df_template.at[15, col] = titulo
+        for j, encabezado in enumerate([7, 13, 19, 'Media Aritmética']):
+            df_template.at[16, col + j] = encabezado
+
+        lecturas = derivadas[variable][:len(data_rows)]
+        conteo = np.isfinite(lecturas).sum(axis=1)
+        media = np.where(conteo > 0, np.nansum(lecturas, axis=1) / np.maximum(conteo, 1), np.nan)
+        df_template.iloc[data_rows, col:col + 4] = np.round(np.column_stack([lecturas, media]), 2)
+
+
+def extend_template_sheet(ws, num_columns):
+    """
+    Da a las columnas agregadas a la derecha de la plantilla (sección de humedad)
+    el formato y las celdas combinadas de la sección del termómetro húmedo
+    """
+
+    primera = PRIMERA_COLUMNA_PSICROMETRIA + 1
+    ultima = num_columns
+    for col in range(primera, ultima + 1):
+        # Columnas I a L (termómetro húmedo: 7h, 13h, 19h y media) como modelo
+        modelo = 9 + (col - primera) % 4
+        ws.column_dimensions[get_column_letter(col)].width = ws.column_dimensions[get_column_letter(modelo)].width
+        for row in range(12, ws.max_row + 1):
+            ws.cell(row=row, column=col)._style = copy(ws.cell(row=row, column=modelo)._style)
+
+    ws.merge_cells(start_row=12, start_column=primera, end_row=12, end_column=ultima)
+    ws.merge_cells(start_row=13, start_column=primera, end_row=15, end_column=ultima)
+    for col in range(primera, ultima + 1, 4):
+        ws.merge_cells(start_row=16, start_column=col, end_row=16, end_column=col + 3)
+
+
+def flagged_template_cells(df_raw, banderas):
+    """
+    Celdas (fila, columna) de la plantilla que vienen de valores marcados por la validación
+    """
+
+    celdas = []
+    for nombre, columnas in COLUMNAS_PLANTILLA.items():
+        if nombre not in df_raw:
+            continue
+        for fila in np.flatnonzero(banderas[:, df_raw.columns.get_loc(nombre)]):
+            day, lectura = fila // 3 + 1, fila % 3
+            if lectura in columnas and day <= 31:
+                # Filas de la plantilla: una fila de SUMA después de los días 10 y 20
+                celdas.append((17 + day - 1 + (day > 10) + (day > 20), columnas[lectura]))
+    return celdas
+
+
 def calculate_suma(df_template, start_row, end_row, suma_row):
     """Calculate SUMA for a range of rows"""
     # Columns to exclude from SUMA calculations (only string columns and altura):
@@ -387,11 +492,12 @@ def calculate_suma(df_template, start_row, end_row, suma_row):
     # - Cantidad total (Octavos): 22, 23, 24
     # - Cloud cantidad: 26, 29, 31, 33, 36, 38, 40, 43, 45
     # - Visibility: 46, 47, 48
+    # - Humedad (psychrometrics): 49-60
     excluded_cols = set([12, 14, 16])  # Wind directions (strings)
     excluded_cols.update([25, 28, 30, 32, 35, 37, 39, 42, 44])  # Cloud forms (strings)
     excluded_cols.update([27, 34, 41])  # Cloud altura
 
-    for col in range(1, 49):  # Columns 1-48
+    for col in range(1, len(df_template.columns)):  # Columns 1-60
         if col in excluded_cols:
             # Keep NaN for excluded columns in SUMA rows
             df_template.at[suma_row, col] = None
@@ -424,11 +530,12 @@ def calculate_total_and_media(df_template, data_rows, total_row, media_row):
     # - Cantidad total (Octavos): 22, 23, 24
     # - Cloud cantidad: 26, 29, 31, 33, 36, 38, 40, 43, 45
     # - Visibility: 46, 47, 48
+    # - Humedad (psychrometrics): 49-60
     excluded_cols = set([12, 14, 16])  # Wind directions (strings)
     excluded_cols.update([25, 28, 30, 32, 35, 37, 39, 42, 44])  # Cloud forms (strings)
     excluded_cols.update([27, 34, 41])  # Cloud altura
 
-    for col in range(1, 49):  # Columns 1-48
+    for col in range(1, len(df_template.columns)):  # Columns 1-60
         if col in excluded_cols:
             # Keep NaN for excluded columns in TOTAL and MEDIA rows
             df_template.at[total_row, col] = None
@@ -474,8 +581,12 @@ def generate_planilla(n_clicks, station, fecha):
         year = fecha_obj.year
         month = fecha_obj.month
 
-        # Fetch raw data
+        # Fetch raw data; values flagged by validation are left out of the template and highlighted
         df_raw = get_planilla_climatologica(station, year, month)
+        banderas = frame_flags(df_raw)
+        marcadas = flag_counts(banderas) if banderas is not None else {}
+        celdas_marcadas = flagged_template_cells(df_raw, banderas) if marcadas else []
+        df_raw = mask_flagged(df_raw)
 
         # Transform to template format
         df_filled = transform_data_to_template(df_raw, station, year, month)
@@ -506,6 +617,12 @@ def generate_planilla(n_clicks, station, fecha):
                     'if': {'row_index': 'odd'},
                     'backgroundColor': 'rgb(248, 248, 248)'
                 }
+            ] + [
+                {
+                    'if': {'row_index': int(fila), 'column_id': str(columna)},
+                    'backgroundColor': COLOR_MARCADA
+                }
+                for fila, columna in celdas_marcadas
             ],
             id='planilla-datatable'
         )
@@ -534,9 +651,23 @@ def generate_planilla(n_clicks, station, fecha):
             color="green",
             icon=DashIconify(icon="mdi:check-circle")
         )
+        if marcadas:
+            detalle = ", ".join(f"{nombre}: {conteo}" for nombre, conteo in marcadas.items())
+            success_msg = dmc.Alert(
+                f"Planilla generada para {station} - {convert_month(month)} {year} | "
+                f"Valores omitidos por validación, resaltados en la tabla ({detalle})",
+                color="yellow",
+                icon=DashIconify(icon="mdi:alert")
+            )
 
         return [table, storage], export_btn, success_msg
 
+    except ArchivoNoEncontrado:
+        return no_update, no_update, dmc.Alert(
+            f"No existe planilla de {station} para {convert_month(month)} {year}",
+            color="yellow",
+            icon=DashIconify(icon="mdi:alert")
+        )
     except Exception as e:
         error_msg = dmc.Alert(
             f"Error al generar planilla: {str(e)}",
@@ -564,8 +695,8 @@ def export_to_excel(n_clicks, station, fecha):
         year = fecha_obj.year
         month = fecha_obj.month
 
-        # Fetch raw data
-        df_raw = get_planilla_climatologica(station, year, month)
+        # Fetch raw data (without the values flagged by validation, as in the table)
+        df_raw = mask_flagged(get_planilla_climatologica(station, year, month))
 
         # Transform to template format
         df_filled = transform_data_to_template(df_raw, station, year, month)
@@ -574,6 +705,7 @@ def export_to_excel(n_clicks, station, fecha):
         template_path = "src/template/Planilla de datos andrea.xlsx"
         wb = openpyxl.load_workbook(template_path)
         ws = wb.active
+        extend_template_sheet(ws, len(df_filled.columns))
 
         # Get all merged cell ranges to avoid writing to them
         merged_ranges = ws.merged_cells.ranges.copy()
@@ -607,7 +739,8 @@ def export_to_excel(n_clicks, station, fecha):
 
         # Save to BytesIO
         output = BytesIO()
-        wb.save(output)
+        with stage("serializacion", "planilla"):
+            wb.save(output)
         output.seek(0)
 
         # Return download data
@@ -0,0 +1,174 @@
+from dash import html, dcc, callback, Input, Output, State, no_update
+import dash_mantine_components as dmc
+from dash_iconify import DashIconify
+import plotly.graph_objects as go
+from datetime import date
+from data.anomalies import SIN_ZONA, anomaly_matrix, station_day_matrix, station_zones
+from data.archive import ANIO_INICIO, VARIABLES
+from data.file_managment import convert_month
+from cache import data_cache
+from metrics import stage, timed
+from ui.control_diario import ZONAS
+from ui.control_semanal import load_months
+from ui.encoding import encode_dates
+import numpy as np
+import pandas as pd
+
+# Estaciones climatológicas: (año relativo, mes); el verano incluye diciembre del año anterior
+ESTACIONES_DEL_ANIO = {
+    "DEF": ("Verano (Dic-Feb)", [(-1, 12), (0, 1), (0, 2)]),
+    "MAM": ("Otoño (Mar-May)", [(0, 3), (0, 4), (0, 5)]),
+    "JJA": ("Invierno (Jun-Ago)", [(0, 6), (0, 7), (0, 8)]),
+    "SON": ("Primavera (Sep-Nov)", [(0, 9), (0, 10), (0, 11)]),
+}
+
+UNIDADES = {'TMAX': '°C', 'TMIN': '°C', 'PP': 'mm'}
+
+
+def period_months(year, periodo):
+    """
+    Meses (año, mes) de un periodo: un mes ("1".."12") o una estación del año (DEF, MAM, JJA, SON)
+    """
+
+    if periodo in ESTACIONES_DEL_ANIO:
+        return [(year + delta, month) for delta, month in ESTACIONES_DEL_ANIO[periodo][1]]
+    return [(year, int(periodo))]
+
+
+def period_options():
+    """
+    Opciones del selector de periodo: los doce meses y las cuatro estaciones del año
+    """
+
+    return ([{"value": str(month), "label": convert_month(month).capitalize()} for month in range(1, 13)] +
+            [{"value": key, "label": label} for key, (label, _) in ESTACIONES_DEL_ANIO.items()])
+
+
+def zone_order(zonas):
+    """
+    Orden de filas por zona (en el orden de la vista diaria) y, dentro de cada zona, por código.
+    Las estaciones sin zona van al final.
+    """
+
+    rango = {zona: i for i, zona in enumerate(ZONAS + [SIN_ZONA])}
+    posicion_zona = np.array([rango.get(zona, len(ZONAS)) for zona in zonas])
+    return np.lexsort((np.arange(len(zonas)), posicion_zona))
+
+
+def anomalias_layout():
+    """
+    Crea el layout del mapa de calor de anomalías (estación x día)
+    """
+
+    return dmc.Container(fluid=True, style={"padding": "20px"}, children=[
+        dmc.Stack(gap="md", children=[
+            dmc.Paper(p="md", shadow="sm", radius="md", children=[
+                dmc.Stack(gap="xs", children=[
+                    dmc.Title("Mapa de Anomalías", order=2, c="blue"),
+                    dmc.Text("Anomalía diaria de todas las estaciones respecto de las normales 1991-2020, por zona",
+                             size="sm", c="dimmed")
+                ])
+            ]),
+
+            dmc.Paper(p="md", shadow="sm", radius="md", withBorder=True, children=[
+                dmc.Stack(gap="md", children=[
+                    dmc.Group(grow=True, children=[
+                        dmc.NumberInput(id="anio-anomalias", label="Año", value=date.today().year,
+                                        min=ANIO_INICIO, max=date.today().year, size="md"),
+                        dmc.Select(id="periodo-anomalias", label="Periodo", data=period_options(),
+                                   value=str(date.today().month), size="md"),
+                        dmc.Select(id="variable-anomalias", label="Variable", value="TMIN", size="md", data=[
+                            {"value": "TMAX", "label": "Temperatura máxima"},
+                            {"value": "TMIN", "label": "Temperatura mínima"},
+                            {"value": "PP", "label": "Precipitación (acumulado del mes)"},
+                        ]),
+                    ]),
+                    dmc.Group(justify="flex-end", children=[
+                        dmc.Button("Cargar Datos", id='cargar-datos-btn-anomalias',
+                                   leftSection=DashIconify(icon="mdi:refresh", width=20), size="md", variant="filled")
+                    ]),
+                    html.Div(id='loading-status-anomalias')
+                ])
+            ]),
+
+            dmc.Paper(p="md", shadow="sm", radius="md", withBorder=True, children=[
+                dcc.Loading(type="default", children=[
+                    dcc.Graph(
+                        id="anomalias-graph",
+                        figure=go.Figure(layout=dict(title="Selecciona un periodo y presiona 'Cargar Datos'",
+                                                     template='plotly_white')),
+                        config={'displayModeBar': True, 'displaylogo': False},
+                        style={'height': '1000px'}
+                    )
+                ])
+            ]),
+        ])
+    ])
+
+
+@timed("figura", "anomalias")
+def build_anomaly_figure(anomalias, valores, fechas, zonas, variable, titulo):
+    """
+    Mapa de calor estación x día agrupado por zona, con la anomalía como color
+    y el valor observado en el hover
+    """
+
+    orden = zone_order(zonas)
+    nombres = np.asarray(data_cache["LISTA_ESTACIONES"], dtype=object)
+    limite = float(np.nanmax(np.abs(anomalias))) if np.isfinite(anomalias).any() else 1.0
+    unidad = UNIDADES[variable]
+
+    fig = go.Figure(go.Heatmap(
+        z=anomalias[orden], customdata=valores[orden],
+        **encode_dates(fechas),
+        y=[zonas[orden].tolist(), nombres[orden].tolist()],
+        colorscale='RdBu' if variable == 'PP' else 'RdBu_r', zmid=0, zmin=-limite, zmax=limite,
+        colorbar=dict(title=f"Anomalía ({unidad})"),
+        hovertemplate=f'%{{y}}<br>%{{x|%d/%m/%Y}}<br>Anomalía: %{{z:+.1f}} {unidad}'
+                      f'<br>{"Diaria" if variable == "PP" else "Observada"}: %{{customdata:.1f}} {unidad}<extra></extra>',
+        hoverongaps=False,
+    ))
+    fig.update_layout(
+        title=dict(text=titulo, x=0.5, xanchor='center'),
+        xaxis=dict(title="Fecha", type='date', tickformat='%d/%m'),
+        yaxis=dict(autorange='reversed'),
+        template='plotly_white', height=1000, margin=dict(l=260)
+    )
+    return fig
+
+
+@callback(
+    [Output('anomalias-graph', 'figure'), Output('loading-status-anomalias', 'children')],
+    Input('cargar-datos-btn-anomalias', 'n_clicks'),
+    [State('anio-anomalias', 'value'), State('periodo-anomalias', 'value'), State('variable-anomalias', 'value')],
+    prevent_initial_call=True
+)
+def update_anomaly_map(n_clicks, year, periodo, variable):
+    if not year or not periodo or not variable:
+        return no_update, None
+
+    months = period_months(int(year), periodo)
+    frames, missing = load_months(months)
+    with stage("transformacion", "anomalias"):
+        matrices = [station_day_matrix(df_mes) for df_mes, _ in frames]
+    fechas = [fechas_mes for _, fechas_mes in frames]
+
+    if not matrices:
+        return no_update, dmc.Alert(f"No hay registro mensual para: {', '.join(missing)}", color="yellow",
+                                    icon=DashIconify(icon="mdi:alert"))
+
+    fechas = pd.DatetimeIndex(np.concatenate(fechas))
+    with stage("transformacion", "anomalias"):
+        valores = np.concatenate(matrices, axis=1)
+        anomalias = anomaly_matrix(valores, fechas)
+
+    j = VARIABLES.index(variable)
+    zonas = station_zones(*months[-1])
+    titulo = f"Anomalía de {variable} - {fechas[0]:%d/%m/%Y} a {fechas[-1]:%d/%m/%Y}"
+    fig = build_anomaly_figure(anomalias[:, :, j], valores[:, :, j], fechas, zonas, variable, titulo)
+
+    status = f" {len(data_cache['LISTA_ESTACIONES'])} estaciones x {len(fechas)} días"
+    if missing:
+        return fig, dmc.Alert(status + f" | Sin registro: {', '.join(missing)}", color="yellow",
+                              icon=DashIconify(icon="mdi:alert"))
+    return fig, dmc.Alert(status, color="green", icon=DashIconify(icon="mdi:check-circle"))
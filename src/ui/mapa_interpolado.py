@@ -0,0 +1,99 @@
+from dash import dcc
+import dash_mantine_components as dmc
+import plotly.graph_objects as go
+from cache import data_cache
+from data.archive import VARIABLES
+from data.interpolation import interpolate, load_grid, station_coordinates
+from metrics import timed
+import config as cf
+import numpy as np
+
+ESCALAS = {'TMAX': 'Turbo', 'TMIN': 'Turbo', 'PP': 'Blues'}
+UNIDADES = {'TMAX': '°C', 'TMIN': '°C', 'PP': 'mm'}
+
+
+def create_map_paper(prefix, variable_selector):
+    """
+    Crea un Paper con el mapa interpolado y el selector valores/anomalías (y de
+    variable si la página no tiene uno propio)
+    """
+
+    controles = [dmc.SegmentedControl(id=f"modo-mapa-{prefix}", value="valores", data=[
+        {"value": "valores", "label": "Valores"},
+        {"value": "anomalias", "label": "Anomalías"},
+    ])]
+    if variable_selector:
+        controles.insert(0, dmc.Select(id=f"variable-mapa-{prefix}", value="TMAX", w=250, data=[
+            {"value": "TMAX", "label": "Temperatura máxima"},
+            {"value": "TMIN", "label": "Temperatura mínima"},
+            {"value": "PP", "label": "Precipitación"},
+        ]))
+
+    return dmc.Paper(p="md", shadow="sm", radius="md", withBorder=True, children=[
+        dmc.Stack(gap="md", children=[
+            dmc.Group(justify="space-between", children=[
+                dmc.Title("Mapa interpolado (IDW)", order=4),
+                dmc.Group(gap="md", children=controles)
+            ]),
+            dcc.Loading(type="default", children=[
+                dcc.Graph(
+                    id=f"mapa-{prefix}",
+                    figure=go.Figure(layout=dict(title="Carga datos para ver el mapa", template='plotly_white')),
+                    config={'displayModeBar': True, 'displaylogo': False, 'scrollZoom': True},
+                    style={'height': '700px'}
+                )
+            ])
+        ])
+    ])
+
+
+@timed("figura", "mapa")
+def build_map_figure(resumen, anomalia, variable, modo, titulo):
+    """
+    Mapa de la variable interpolada a la malla sobre Puno con las estaciones
+    encima. resumen y anomalia son arreglos (estación, variable) por código.
+    """
+
+    j = VARIABLES.index(variable)
+    es_anomalia = modo == "anomalias"
+    valores = (anomalia if es_anomalia else resumen)[:, j]
+    corregir_altitud = variable != 'PP' and not es_anomalia
+
+    campo = interpolate(valores, corregir_altitud)
+    if campo is None:
+        return go.Figure(layout=dict(title="Sin datos de estaciones para interpolar", template='plotly_white'))
+
+    grid = load_grid()
+    latitud, longitud, altitud = station_coordinates()
+    con_dato = np.isfinite(valores) & np.isfinite(latitud) & np.isfinite(longitud)
+    unidad = UNIDADES[variable]
+
+    if es_anomalia:
+        limite = float(np.nanmax(np.abs(campo))) or 1.0
+        escala = dict(colorscale='RdBu' if variable == 'PP' else 'RdBu_r', zmid=0, zmin=-limite, zmax=limite)
+        titulo = f"Anomalía de {titulo}"
+    else:
+        escala = dict(colorscale=ESCALAS[variable])
+        if corregir_altitud and grid["altitud"] is None:
+            titulo += f" (reducida a {cf.ALTITUD_REFERENCIA:.0f} m)"
+
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=grid["longitud"], y=grid["latitud"], z=campo.astype(np.float32), zsmooth='best',
+        colorbar=dict(title=unidad), hovertemplate=f'%{{y:.2f}}, %{{x:.2f}}: %{{z:.1f}} {unidad}<extra></extra>',
+        **escala
+    ))
+    nombres = np.asarray(data_cache["LISTA_ESTACIONES"], dtype=object)
+    fig.add_trace(go.Scatter(
+        x=longitud[con_dato], y=latitud[con_dato], mode='markers', name='Estaciones',
+        marker=dict(size=8, color='white', line=dict(color='black', width=1)),
+        text=nombres[con_dato], customdata=np.column_stack([valores[con_dato], altitud[con_dato]]),
+        hovertemplate=f'%{{text}} (%{{customdata[1]:.0f}} m): %{{customdata[0]:.1f}} {unidad}<extra></extra>'
+    ))
+    fig.update_layout(
+        title=dict(text=titulo, x=0.5, xanchor='center'),
+        xaxis=dict(title="Longitud", constrain='domain'),
+        yaxis=dict(title="Latitud", scaleanchor='x', scaleratio=1),
+        template='plotly_white', height=700, showlegend=False
+    )
+    return fig
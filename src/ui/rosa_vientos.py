@@ -0,0 +1,134 @@
+from dash import html, dcc, callback, Input, Output, State, no_update
+import dash_mantine_components as dmc
+from dash_iconify import DashIconify
+import plotly.graph_objects as go
+from datetime import date
+from cache import data_cache
+from data.archive import ANIO_INICIO
+from data.file_managment import convert_month
+from data.planilla_stats import CLASES_VELOCIDAD, GENEROS_NUBES, HORAS, NIVELES_NUBES, SECTORES, aggregate
+from metrics import timed
+from ui.control_semanal import get_month_range
+
+COLORES_VELOCIDAD = ['#a5d8ff', '#4dabf7', '#1c7ed6', '#1864ab', '#0b3d6e']
+COLORES_NIVELES = ['#868e96', '#4dabf7', '#e599f7']
+
+
+def rosa_vientos_layout():
+    """
+    Crea la sección de rosa de vientos y nubosidad de la página de planilla
+    """
+
+    return dmc.Container(fluid=True, style={'marginTop': '20px'}, children=[
+        dmc.Paper(p="md", shadow="sm", radius="md", withBorder=True, children=[
+            dmc.Stack(gap="md", children=[
+                dmc.Title("Rosa de vientos y nubosidad", order=4),
+                dmc.Group(grow=True, children=[
+                    dmc.MultiSelect(id="estaciones-rosa", label="Estaciones",
+                                    data=data_cache.get("LISTA_ESTACIONES", []), searchable=True, clearable=True),
+                    dmc.MonthPickerInput(id="meses-rosa", label="Rango de meses", type="range", value=[],
+                                         minDate=date(ANIO_INICIO, 1, 1), valueFormat="MMMM YYYY"),
+                    dmc.Stack(gap=4, children=[
+                        dmc.Text("Hora de observación", size="sm", fw=500),
+                        dmc.SegmentedControl(id="hora-rosa", value="todas", data=[{"value": "todas", "label": "Todas"}] +
+                                             [{"value": str(hora), "label": f"{hora}h"} for hora in HORAS]),
+                    ]),
+                ]),
+                dmc.Group(justify="flex-end", children=[
+                    dmc.Button("Calcular", id='calcular-btn-rosa',
+                               leftSection=DashIconify(icon="mdi:weather-windy", width=20), size="md", variant="filled")
+                ]),
+                html.Div(id='loading-status-rosa'),
+                dcc.Loading(type="default", children=[
+                    dmc.SimpleGrid(cols=2, spacing="md", children=[
+                        dcc.Graph(id="rosa-vientos-graph", style={'height': '550px'},
+                                  figure=go.Figure(layout=dict(template='plotly_white'))),
+                        dcc.Graph(id="nubes-graph", style={'height': '550px'},
+                                  figure=go.Figure(layout=dict(template='plotly_white'))),
+                    ])
+                ])
+            ])
+        ])
+    ])
+
+
+@timed("figura", "rosa")
+def build_wind_rose(viento, calmas, titulo):
+    """
+    Rosa de vientos: frecuencia (%) por sector apilada por clase de velocidad
+    """
+
+    total = viento.sum() + calmas
+    fig = go.Figure()
+    for clase, color in zip(range(len(CLASES_VELOCIDAD)), COLORES_VELOCIDAD):
+        fig.add_trace(go.Barpolar(
+            r=100 * viento[:, clase] / max(total, 1), theta=SECTORES, name=f"{CLASES_VELOCIDAD[clase]} m/s",
+            marker_color=color, hovertemplate='%{theta}: %{r:.1f} %<extra>' + CLASES_VELOCIDAD[clase] + ' m/s</extra>'
+        ))
+    fig.update_layout(
+        title=dict(text=f"{titulo}<br><sup>Calmas: {100 * calmas / max(total, 1):.1f} % de {total} observaciones</sup>",
+                   x=0.5, xanchor='center'),
+        polar=dict(angularaxis=dict(direction='clockwise', rotation=90), radialaxis=dict(ticksuffix=' %')),
+        template='plotly_white', legend=dict(title="Velocidad")
+    )
+    return fig
+
+
+@timed("figura", "rosa")
+def build_cloud_chart(nubes, octas, titulo):
+    """
+    Frecuencia (%) de cada género de nube por nivel y distribución de la nubosidad total en octas
+    """
+
+    fig = go.Figure()
+    for nivel, (nombre, color) in enumerate(zip(NIVELES_NUBES, COLORES_NIVELES)):
+        fig.add_trace(go.Bar(
+            x=GENEROS_NUBES, y=100 * nubes[nivel] / max(nubes[nivel].sum(), 1), name=f"Nubes {nombre.lower()}",
+            marker_color=color, hovertemplate='%{x}: %{y:.1f} %<extra>' + nombre.capitalize() + '</extra>'
+        ))
+    fig.add_trace(go.Bar(
+        x=[f"{octa}/8" for octa in range(9)], y=100 * octas / max(octas.sum(), 1), name="Nubosidad total",
+        marker_color='#495057', xaxis='x2', yaxis='y2', hovertemplate='%{x}: %{y:.1f} %<extra>Total</extra>'
+    ))
+    fig.update_layout(
+        title=dict(text=titulo, x=0.5, xanchor='center'), barmode='group', template='plotly_white',
+        xaxis=dict(domain=[0, 1], anchor='y'), yaxis=dict(domain=[0.55, 1], title="% por nivel", ticksuffix=' %'),
+        xaxis2=dict(domain=[0, 1], anchor='y2', title="Octas"),
+        yaxis2=dict(domain=[0, 0.4], title="% de observaciones", ticksuffix=' %'),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5)
+    )
+    return fig
+
+
+@callback(
+    [Output('rosa-vientos-graph', 'figure'), Output('nubes-graph', 'figure'), Output('loading-status-rosa', 'children')],
+    Input('calcular-btn-rosa', 'n_clicks'),
+    [State('estaciones-rosa', 'value'), State('meses-rosa', 'value'), State('hora-rosa', 'value'),
+     State('station-selector-planilla', 'value')],
+    prevent_initial_call=True
+)
+def update_wind_rose(n_clicks, estaciones, meses, hora, estacion_planilla):
+    estaciones = estaciones or ([estacion_planilla] if estacion_planilla else [])
+    if not estaciones or not meses or len(meses) != 2 or not all(meses):
+        return no_update, no_update, dmc.Alert("Selecciona estaciones y un rango de meses", color="yellow",
+                                               icon=DashIconify(icon="mdi:alert"))
+
+    inicio, fin = (date.fromisoformat(mes[:10]) for mes in meses)
+    months = get_month_range(inicio, fin)
+    horas = None if hora == "todas" else [int(hora)]
+    resultado = aggregate(estaciones, months, horas)
+    if resultado is None:
+        return no_update, no_update, dmc.Alert("No hay planillas para las estaciones y meses elegidos",
+                                               color="yellow", icon=DashIconify(icon="mdi:alert"))
+
+    periodo = f"{convert_month(inicio.month)} {inicio.year} - {convert_month(fin.month)} {fin.year}"
+    nombre = estaciones[0] if len(estaciones) == 1 else f"{len(estaciones)} estaciones"
+    titulo = f"{nombre}, {periodo}" + ("" if horas is None else f", {hora}h")
+    fig_rosa = build_wind_rose(resultado["viento"], int(resultado["calmas"]), titulo)
+    fig_nubes = build_cloud_chart(resultado["nubes"], resultado["octas"], titulo)
+
+    mensaje = f" {resultado['meses_con_datos']} planillas estación-mes agregadas"
+    if resultado["meses_sin_planilla"]:
+        mensaje += f" | {len(resultado['meses_sin_planilla'])} sin planilla"
+        return fig_rosa, fig_nubes, dmc.Alert(mensaje, color="yellow", icon=DashIconify(icon="mdi:alert"))
+    return fig_rosa, fig_nubes, dmc.Alert(mensaje, color="green", icon=DashIconify(icon="mdi:check-circle"))
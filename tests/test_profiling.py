@@ -0,0 +1,89 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from flask import Flask, jsonify
+import config as cf
+import profiling
+
+HILOS = 3
+
+
+class ConcurrentProfilingTest(unittest.TestCase):
+    """
+    Con PERFILADO=1 varias solicitudes y cargadores concurrentes no deben fallar
+    porque Python solo admite un perfilador activo por proceso
+    """
+
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.configuracion = (cf.PERFILADO, cf.PERFILADO_CALLBACKS, cf.DIRECTORIO_PERFILES)
+        cf.PERFILADO, cf.PERFILADO_CALLBACKS, cf.DIRECTORIO_PERFILES = "1", "", self.directorio.name
+
+    def tearDown(self):
+        cf.PERFILADO, cf.PERFILADO_CALLBACKS, cf.DIRECTORIO_PERFILES = self.configuracion
+        self.directorio.cleanup()
+
+    def run_threads(self, fn):
+        barrera = threading.Barrier(HILOS)
+        resultados, errores = [], []
+
+        def worker():
+            barrera.wait()
+            try:
+                resultados.append(fn())
+            except Exception as e:
+                errores.append(e)
+
+        hilos = [threading.Thread(target=worker) for _ in range(HILOS)]
+        with redirect_stdout(StringIO()):
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        return resultados, errores
+
+    def test_concurrent_loaders(self):
+        def cargador():
+            time.sleep(0.05)
+            return "ok"
+
+        resultados, errores = self.run_threads(lambda: profiling.run_profiled("cargador", cargador))
+
+        self.assertEqual(errores, [])
+        self.assertEqual(resultados, ["ok"] * HILOS)
+        perfiles = os.listdir(self.directorio.name)
+        self.assertGreaterEqual(len(perfiles), 1)
+        self.assertLessEqual(len(perfiles), HILOS)
+
+    def test_concurrent_requests(self):
+        app = Flask(__name__)
+        profiling.init_profiling(app)
+
+        @app.route("/_dash-update-component", methods=["POST"])
+        def update():
+            # Un cargador perfilado dentro de la solicitud se ejecuta con el perfil de la solicitud
+            return jsonify(profiling.run_profiled("cargador", lambda: time.sleep(0.05) or "ok"))
+
+        def solicitud():
+            with app.test_client() as client:
+                return client.post("/_dash-update-component", json={"output": "grafico.figure"}).status_code
+
+        resultados, errores = self.run_threads(solicitud)
+
+        self.assertEqual(errores, [])
+        self.assertEqual(resultados, [200] * HILOS)
+        # El perfilador queda libre para la siguiente solicitud
+        self.assertTrue(profiling._perfilador.acquire(blocking=False))
+        profiling._perfilador.release()
+
+
+if __name__ == "__main__":
+    unittest.main()